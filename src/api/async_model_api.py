@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from api.limiter import AsyncAdaptiveLimiter, backoff_delay, is_transient
+from api.profiles import EarlyStopReader, sse_delta
+from api.model_api import ModelAPI
+from telemetry.tracer import annotate, span
+
+
+class AsyncModelAPI:
+    """
+    ModelAPI 的异步版本：配置、messages 和请求参数都复用同一个 ModelAPI，
+    只把调用换成 AsyncOpenAI / httpx.AsyncClient。
+    每个端点（副本 URL）有自己的 AsyncAdaptiveLimiter，并发上限取该端点上模型的 config['concurrency'] /
+    external.json 的 max_concurrency，缺省为 default_concurrency；启用 adaptive 时在上限内按 AIMD 调整。
+    副本的选择和摘除与同步路径共用 ModelAPI 的 ReplicaPool。
+    """
+
+    def __init__(self, model_api: ModelAPI, default_concurrency: int = 32, timeout: float = 600.0):
+        self.model_api = model_api
+        self.default_concurrency = default_concurrency
+        self.timeout = timeout
+        self.clients = {}             # Replica -> AsyncOpenAI，第一次调用该副本时创建
+        self._http = None
+        self._limiters = {}
+
+    @classmethod
+    def from_config(cls, config_path, **kwargs):
+        return cls(ModelAPI(config_path), **kwargs)
+
+    def concurrency_limit(self, endpoint) -> int:
+        return self.model_api.endpoint_limit(endpoint, self.default_concurrency)
+
+    def _limiter(self, endpoint) -> AsyncAdaptiveLimiter:
+        # 限流器在事件循环内惰性创建
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            limiter = self._limiters[endpoint] = AsyncAdaptiveLimiter(self.model_api.adaptive_options,
+                                                                      self.concurrency_limit(endpoint))
+        return limiter
+
+    def _client(self, replica) -> AsyncOpenAI:
+        client = self.clients.get(replica)
+        if client is None:
+            client = self.clients[replica] = AsyncOpenAI(api_key=replica.api_key, base_url=replica.url,
+                                                         timeout=self.timeout, max_retries=0)
+        return client
+
+    def limiter_stats(self):
+        return {endpoint: limiter.stats() for endpoint, limiter in self._limiters.items()}
+
+    def _http_client(self) -> httpx.AsyncClient:
+        # 与同步路径使用同一组连接池 / 超时参数（config.json 的 "http" 段）
+        if self._http is None:
+            options = self.model_api.http_options
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(options["read_timeout"], connect=options["connect_timeout"]),
+                limits=httpx.Limits(max_connections=options["pool_size"],
+                                    max_keepalive_connections=options["pool_size"]),
+            )
+        return self._http
+
+    async def _complete(self, replica, model_name, params, early_stop=None):
+        """向 replica 发出请求，返回 (content, resp)；requests 路径和流式调用下 resp 为 None。"""
+        api = self.model_api
+        if api.model_types.get(model_name) == 'requests':
+            url, headers = replica.url, api.requests_headers(model_name)
+            if early_stop is not None:
+                return await self._read_sse(url, params, headers, early_stop), None
+            r = await self._http_client().post(url, json=params, headers=headers)
+            annotate(status=r.status_code)
+            r.raise_for_status()
+            data = r.json()
+            api.record_usage(model_name, data.get('usage'))
+            return data['choices'][0]['message']['content'], None
+        if early_stop is not None:
+            return await self._read_stream(replica, params, early_stop), None
+        resp = await self._client(replica).chat.completions.create(**params)
+        self.model_api.record_usage(model_name, resp.usage)
+        return resp.choices[0].message.content, resp
+
+    async def _read_stream(self, replica, params, early_stop):
+        # 与 ModelAPI._read_stream 相同：能取出完整的值时立即关闭流
+        reader = EarlyStopReader(early_stop)
+        stream = await self._client(replica).chat.completions.create(**dict(params, stream=True))
+        try:
+            async for chunk in stream:
+                if chunk.choices and reader.feed(chunk.choices[0].delta.content):
+                    break
+        finally:
+            await stream.close()
+        annotate(**reader.fields())
+        return reader.text
+
+    async def _read_sse(self, url, params, headers, early_stop):
+        reader = EarlyStopReader(early_stop)
+        async with self._http_client().stream("POST", url, json=dict(params, stream=True), headers=headers) as r:
+            annotate(status=r.status_code)
+            if r.is_error:
+                await r.aread()
+                r.raise_for_status()
+            async for line in r.aiter_lines():
+                delta = sse_delta(line)
+                if delta is not None and reader.feed(delta):
+                    break
+        annotate(**reader.fields())
+        return reader.text
+
+    async def _call_with_retries(self, model_name, params, early_stop=None):
+        # 与 ModelAPI._call_with_retries 相同：选在途最少的副本，名额不足时等待，瞬时错误退避后换副本重试
+        pool = self.model_api.pools[model_name]
+        options = self.model_api.retry_options
+        replica = None
+        for attempt in range(options["max_retries"] + 1):
+            replica = pool.acquire(exclude=replica)
+            limiter = self._limiter(replica.url)
+            try:
+                generation = await limiter.acquire()
+            except BaseException:
+                pool.release(replica, False)
+                raise
+            start = time.perf_counter()
+            try:
+                result = await self._complete(replica, model_name, params, early_stop)
+            except Exception as e:
+                transient = is_transient(e)
+                limiter.release(generation, time.perf_counter() - start if transient else None, transient)
+                pool.release(replica, transient)
+                if not transient or attempt == options["max_retries"]:
+                    annotate(retries=attempt, endpoint=replica.url)
+                    raise
+                delay = backoff_delay(attempt, options, e)
+                print(f"Transient error from {model_name} ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 被取消（投机判分放弃 loose 调用）时归还名额
+                limiter.release(generation, None, False)
+                pool.release(replica, False)
+                raise
+            limiter.release(generation, time.perf_counter() - start, False)
+            pool.release(replica, False)
+            annotate(retries=attempt, endpoint=replica.url)
+            return result
+
+    async def _response_record(self, model_name, system_role_key, query):
+        # 与 ModelAPI._response_record 相同；缓存是本地 SQLite，直接在事件循环里查
+        api = self.model_api
+        messages = api.build_messages(model_name, system_role_key, query)
+        params = api.request_params(model_name, messages, system_role_key)
+        early_stop = api.early_stop(model_name, system_role_key)
+        with span("llm_call", model=model_name):
+            key, record = api.cache_lookup(params, early_stop)
+            if record is not None:
+                annotate(cache_hit=True)
+                return record
+
+            future = api.submit_batched(model_name, params) if early_stop is None else None
+            if future is not None:
+                # 微批由 batcher 线程发出，这里只等待结果
+                content, resp = await asyncio.wrap_future(future), None
+                annotate(batched=True)
+            else:
+                content, resp = await self._call_with_retries(model_name, params, early_stop)
+            record = api.make_record(model_name, content, resp)
+            if key is not None:
+                api.cache.put(key, record)
+            return record
+
+    async def aget_response(self, model_name, system_role_key, query):
+        record = await self._response_record(model_name, system_role_key, query)
+        return record['content']
+
+    async def aget_response_with_reasoning(self, model_name, system_role_key, query):
+        return dict(await self._response_record(model_name, system_role_key, query))
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        for client in self.clients.values():
+            await client.close()
@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+# 本地 vLLM 的 /v1/completions 接受一组 prompt，需要先把 chat messages 按模型的对话模板渲染成文本。
+# vLLM 对 prompt 默认 add_special_tokens=True，BOS 由 tokenizer 自己加，模板里不写。
+CHAT_TEMPLATES = {
+    "chatml": {  # Qwen 系列
+        "turn": "<|im_start|>{role}\n{content}<|im_end|>\n",
+        "assistant": "<|im_start|>assistant\n",
+        "stop": ["<|im_end|>", "<|endoftext|>"],
+    },
+    "llama3": {
+        "turn": "<|start_header_id|>{role}<|end_header_id|>\n\n{content}<|eot_id|>",
+        "assistant": "<|start_header_id|>assistant<|end_header_id|>\n\n",
+        "stop": ["<|eot_id|>"],
+    },
+}
+
+# 微批参数，可在 config.json 的 "batching" 段覆盖；只有在 "templates" 中配置了模板的本地模型才合批
+DEFAULT_BATCHING_OPTIONS = {
+    "enabled": False,
+    "window_ms": 5.0,        # 第一条 prompt 到达后最多再等这么久收集同批 prompt
+    "max_batch": 32,
+    "max_inflight": 4,       # 每个模型同时在途的批量请求数
+    "templates": {},         # 模型名 -> CHAT_TEMPLATES 中的模板名
+}
+
+
+def batching_options(config: dict) -> dict:
+    options = dict(DEFAULT_BATCHING_OPTIONS)
+    options.update(config.get('batching', {}))
+    return options
+
+
+def render_prompt(messages: List[Dict], template: str) -> str:
+    spec = CHAT_TEMPLATES[template]
+    return "".join(spec["turn"].format(role=m["role"], content=m["content"]) for m in messages) + spec["assistant"]
+
+
+def _resolve(future: Future, result=None, error: Exception = None):
+    # 调用方可能已经取消了自己的 Future（如被放弃的投机判分经 asyncio.wrap_future 传过来的取消），
+    # 跳过它，同批其它请求的结果照常交付
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class MicroBatcher:
+    """
+    把多个 worker 在 window 秒内提交的请求合并成一次批量调用（最多 max_batch 条）。
+    send_fn(group, payloads) -> List[result]，group 相同的请求才能合批，返回顺序与 payloads 一致。
+    最多 max_inflight 个批同时在途；名额用满时新请求继续累积，下一批会更大。
+    """
+
+    def __init__(self, send_fn: Callable, window: float = 0.005, max_batch: int = 32,
+                 max_inflight: int = 4, name: str = "micro-batcher"):
+        self.send_fn = send_fn
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.requests = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self._pending: List[Tuple[object, object, Future]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._slots = threading.BoundedSemaphore(max(1, max_inflight))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix=name)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, group, payload) -> Future:
+        future = Future()
+        with self._lock:
+            self.requests += 1
+            self._pending.append((group, payload, future))
+            self._wakeup.notify()
+        return future
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                # 第一条请求到达后再等 window 秒，收集更多请求
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                # 取最早一条请求所在的 group，同 group 的请求按到达顺序凑满一批
+                group = self._pending[0][0]
+                batch, rest = [], []
+                for item in self._pending:
+                    (batch if item[0] == group and len(batch) < self.max_batch else rest).append(item)
+                self._pending = rest
+                self.batches += 1
+            self._executor.submit(self._send, group, batch)
+
+    def _send(self, group, batch):
+        try:
+            results = self.send_fn(group, [payload for _, payload, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batched call returned {len(results)} results for {len(batch)} prompts")
+        except Exception as e:
+            with self._lock:
+                self.failed_batches += 1
+            for _, _, future in batch:
+                _resolve(future, error=e)
+            return
+        finally:
+            self._slots.release()
+        for (_, _, future), result in zip(batch, results):
+            _resolve(future, result)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "mean_batch": self.requests / self.batches if self.batches else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    # 自检：同一批中一个请求被调用方取消后，其余请求（成功和失败两种情况）仍然能拿到结果
+    #     python api/batcher.py
+    from concurrent.futures import CancelledError
+
+    for fail in (False, True):
+        release = threading.Event()
+
+        def send(group, payloads, fail=fail, release=release):
+            release.wait()
+            if fail:
+                raise RuntimeError("batch failed")
+            return [payload.upper() for payload in payloads]
+
+        batcher = MicroBatcher(send, window=0.05, name="batcher-selfcheck")
+        cancelled, other = batcher.submit("g", "a"), batcher.submit("g", "b")
+        time.sleep(0.1)  # 两个请求已合成一批，正在发送
+        assert cancelled.cancel()
+        release.set()
+        try:
+            result = other.result(timeout=5)
+            assert not fail and result == "B", result
+        except RuntimeError as e:
+            assert fail and str(e) == "batch failed", e
+        try:
+            cancelled.result(timeout=0)
+            raise AssertionError("cancelled request returned a result")
+        except CancelledError:
+            pass
+    print("MicroBatcher self-check passed.")
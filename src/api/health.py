@@ -0,0 +1,76 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# 启动时的端点健康检查，可在 config.json 的 "health" 段覆盖
+DEFAULT_HEALTH_OPTIONS = {
+    "enabled": True,
+    "timeout": 3.0,          # 每个端点 GET /v1/models 的超时（秒）；所有端点并发探测，总耗时约为一个超时
+}
+
+# 外部服务没有实现 /models 时的返回；401 / 403 等认证错误仍然算失败
+UNLISTED_ERRORS = ("HTTP 404", "HTTP 405")
+
+
+def health_options(config: dict) -> dict:
+    options = dict(DEFAULT_HEALTH_OPTIONS)
+    options.update(config.get('health', {}))
+    return options
+
+
+def probe_endpoint(base_url: str, api_key: Optional[str] = None,
+                   timeout: float = 3.0) -> Tuple[Optional[List[str]], Optional[str], float]:
+    """GET {base_url}/models，返回 (端点提供的模型 id 列表, 错误信息, 耗时 ms)；成功时错误信息为 None。"""
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    request = urllib.request.Request(base_url.rstrip("/") + "/models", headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as r:
+            data = json.load(r)
+    except urllib.error.HTTPError as e:
+        return None, f"HTTP {e.code}", (time.perf_counter() - start) * 1000
+    except (OSError, ValueError) as e:
+        reason = getattr(e, "reason", None) or e
+        return None, f"{type(e).__name__}: {reason}", (time.perf_counter() - start) * 1000
+    models = [m.get("id") for m in data.get("data", [])] if isinstance(data, dict) else []
+    return models, None, (time.perf_counter() - start) * 1000
+
+
+def probe_models(targets: Dict[str, List[Tuple[str, Optional[str], str, bool]]],
+                 timeout: float = 3.0) -> Dict[str, Dict]:
+    """
+    targets：模型名 -> [(base_url, api_key, 请求中使用的模型名, 是否要求 /models 中列出该模型名)]。
+    所有端点并发探测，同一端点只探测一次。
+    要求列出时（本地 vLLM：--served-model-name 与配置不一致，每次调用都会 404），端点可达但没有该模型名也算失败；
+    外部服务的 /models 不一定列出所有可用的模型 / 别名，只记为 warning，只要求端点可达且认证通过。
+    返回 {模型名: {"ok": 至少一个副本可用, "endpoints": {url: {"ok", "error", "warning", "ms"}}}}。
+    """
+    endpoints = {(url, api_key) for replicas in targets.values() for url, api_key, _, _ in replicas}
+    results = {}
+    if endpoints:
+        with ThreadPoolExecutor(max_workers=min(32, len(endpoints)), thread_name_prefix="health-probe") as executor:
+            futures = {endpoint: executor.submit(probe_endpoint, endpoint[0], endpoint[1], timeout)
+                       for endpoint in endpoints}
+            results = {endpoint: future.result() for endpoint, future in futures.items()}
+
+    report = {}
+    for model_name, replicas in targets.items():
+        checked = {}
+        for url, api_key, served_name, require_listed in replicas:
+            served, error, ms = results[(url, api_key)]
+            warning = None
+            if not require_listed and error in UNLISTED_ERRORS:
+                # 端点可达、认证通过，只是没有提供 /models
+                error, warning = None, f"/models is not available ({error})"
+            if error is None and served and served_name not in served:
+                message = f"model '{served_name}' is not listed here (lists: {', '.join(map(str, served))})"
+                if require_listed:
+                    error = message
+                else:
+                    warning = message
+            checked[url] = {"ok": error is None, "error": error, "warning": warning, "ms": ms}
+        report[model_name] = {"ok": any(endpoint["ok"] for endpoint in checked.values()), "endpoints": checked}
+    return report
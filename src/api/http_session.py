@@ -0,0 +1,46 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# requests 路径的默认连接参数，可在 config.json 的 "http" 段覆盖
+DEFAULT_HTTP_OPTIONS = {
+    "pool_size": 32,          # 每个 base_url 保持的 keep-alive 连接数
+    "connect_timeout": 5.0,
+    "read_timeout": 120.0,
+    "retries": 3,             # 建立连接失败时的重试次数（429 / 5xx 由 api.limiter 的重试循环处理）
+    "backoff": 0.5,           # 连接重试间隔：backoff * 2^(n-1) 秒
+}
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def http_options(config: dict) -> dict:
+    options = dict(DEFAULT_HTTP_OPTIONS)
+    options.update(config.get('http', {}))
+    return options
+
+
+def make_session(options: dict) -> requests.Session:
+    """
+    带连接池的 requests.Session：连接复用（keep-alive），只在建立连接失败时重试。
+    429 / 5xx 原样返回给调用方，由 ModelAPI 的重试循环处理并反馈给端点限流器。
+    Session 可以在多个 worker 线程之间共享。
+    """
+    retry = Retry(
+        total=options["retries"],
+        connect=options["retries"],
+        read=0,                           # 读超时不重试，避免重复计费的生成请求
+        status=0,
+        allowed_methods=None,             # chat/completions 是 POST，默认不在重试范围内
+        backoff_factor=options["backoff"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=options["pool_size"], max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def timeouts(options: dict):
+    return options["connect_timeout"], options["read_timeout"]
@@ -0,0 +1,205 @@
+import asyncio
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+import openai
+import requests
+
+from api.http_session import RETRY_STATUS
+
+# 自适应并发的默认参数，可在 config.json 的 "adaptive" 段覆盖；每个模型的上限取 "concurrency"
+DEFAULT_ADAPTIVE_OPTIONS = {
+    "enabled": False,
+    "initial": 4,            # 初始并发
+    "min": 1,
+    "max": 64,
+    "decrease": 0.5,         # 过载时并发乘以该系数（multiplicative decrease）
+    "spike_factor": 3.0,     # 延迟超过基线的该倍数视为过载
+    "warmup": 20,            # 前若干次成功调用只用来估计基线延迟
+}
+
+# 重试参数，可在 config.json 的 "retry" 段覆盖
+DEFAULT_RETRY_OPTIONS = {
+    "max_retries": 4,
+    "base_delay": 0.5,       # 第 n 次重试等待 uniform(0, min(max_delay, base_delay * 2^n)) 秒（full jitter）
+    "max_delay": 30.0,
+}
+
+
+def adaptive_options(config: dict) -> dict:
+    options = dict(DEFAULT_ADAPTIVE_OPTIONS)
+    options.update(config.get('adaptive', {}))
+    return options
+
+
+def retry_options(config: dict) -> dict:
+    options = dict(DEFAULT_RETRY_OPTIONS)
+    options.update(config.get('retry', {}))
+    return options
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """429、5xx、超时和连接错误可以重试，且视为端点过载；其余错误（400、401 等）直接抛出。"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError,
+                          requests.Timeout, requests.ConnectionError,
+                          httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return _status_code(error) in RETRY_STATUS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """服务端在 Retry-After 头里给出的等待秒数。"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None and response.headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            from datetime import datetime, timezone
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt: int, options: dict, error: Exception = None) -> float:
+    hint = retry_after(error) if error is not None else None
+    if hint is not None:
+        return min(hint, options["max_delay"])
+    return random.uniform(0, min(options["max_delay"], options["base_delay"] * (2 ** attempt)))
+
+
+class AIMDController:
+    """
+    AIMD 并发窗口：延迟正常时每完成一次调用 limit += 1/limit（约每轮加一），
+    遇到 429 / 超时 / 延迟尖峰时 limit *= decrease。同一时刻在途的请求一起失败时只减一次。
+    """
+
+    def __init__(self, options: dict, max_limit: Optional[int] = None):
+        self.enabled = options["enabled"]
+        self.min_limit = options["min"]
+        self.max_limit = max_limit or options["max"]
+        self.decrease = options["decrease"]
+        self.spike_factor = options["spike_factor"]
+        self.warmup = options["warmup"]
+        self.limit = float(min(max(options["initial"], self.min_limit), self.max_limit)) if self.enabled \
+            else float(self.max_limit)
+        self.baseline = None      # 成功调用延迟的 EWMA
+        self.samples = 0
+        self.overloads = 0
+        self.decreases = 0
+        self._generation = 0      # 每次减窗口加一，早于减窗口发出的请求失败不再重复减
+        self.in_flight = 0
+
+    def on_start(self) -> int:
+        self.in_flight += 1
+        return self._generation
+
+    def on_done(self, generation: int, latency: Optional[float], overloaded: bool):
+        # latency 为 None：调用因非过载原因失败（400 等），只归还名额
+        self.in_flight -= 1
+        if latency is None and not overloaded:
+            return
+        if not overloaded:
+            self.samples += 1
+            spike = self.baseline is not None and self.samples > self.warmup \
+                and latency > self.spike_factor * self.baseline
+            if not spike:
+                self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+                if self.enabled:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                return
+        self.overloads += 1
+        if self.enabled and generation == self._generation:
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._generation += 1
+            self.decreases += 1
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "calls": self.samples + self.overloads,
+            "in_flight": self.in_flight,
+            "baseline_ms": (self.baseline or 0.0) * 1000,
+            "overloads": self.overloads,
+            "decreases": self.decreases,
+        }
+
+
+class AdaptiveLimiter:
+    """
+    线程版：acquire() 在在途请求数达到当前窗口时阻塞。
+    未启用 adaptive 时窗口固定为 max_limit（每个模型的 concurrency 上限），与 asyncio 版一致。
+    """
+
+    def __init__(self, options: dict, max_limit: Optional[int] = None):
+        self.controller = AIMDController(options, max_limit)
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        with self._cond:
+            while self.controller.in_flight >= int(self.controller.limit):
+                self._cond.wait()
+            return self.controller.on_start()
+
+    def release(self, generation: int, latency: Optional[float], overloaded: bool):
+        with self._cond:
+            self.controller.on_done(generation, latency, overloaded)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return self.controller.stats()
+
+
+class AsyncAdaptiveLimiter:
+    """
+    asyncio 版：未启用 adaptive 时等价于一个容量为 max_limit 的信号量。
+    release() 是同步的，调用被取消时也能在 except / finally 中直接归还名额。
+    """
+
+    def __init__(self, options: dict, max_limit: Optional[int] = None):
+        self.controller = AIMDController(options, max_limit)
+        self._waiters = deque()
+
+    async def acquire(self) -> int:
+        while self.controller.in_flight >= int(self.controller.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 被唤醒后又被取消：把名额让给下一个等待者
+                self._wake()
+                raise
+        return self.controller.on_start()
+
+    def release(self, generation: int, latency: Optional[float], overloaded: bool):
+        self.controller.on_done(generation, latency, overloaded)
+        self._wake()
+
+    def _wake(self):
+        free = int(self.controller.limit) - self.controller.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self) -> Dict:
+        return self.controller.stats()
@@ -1,213 +1,495 @@
 import json
 import os
 import sys
-import requests
+import threading
+import time
 from openai import OpenAI
 
+from api.batcher import CHAT_TEMPLATES, MicroBatcher, batching_options, render_prompt
+from api.health import probe_models
+from api.http_session import http_options, make_session, timeouts
+from api.limiter import AdaptiveLimiter, adaptive_options, backoff_delay, is_transient, retry_options
+from api.profiles import EARLY_STOP, EarlyStopReader, load_profiles, profile_params, sse_delta
+from api.prompt_templates import PromptRegistry
+from api.replicas import Replica, ReplicaPool, replica_options, url_list
+from api.response_cache import ResponseCache, is_cacheable, request_key
+from telemetry.tracer import annotate, span
+
 # 保留旧有本地模块搜索路径
 sys.path.append("/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/src")
 
+# 配置和 prompt 文件默认取包内的 config/ 和 prompts/ 目录，可以用环境变量指向别的目录
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.environ.get("ESA_DGR_CONFIG_DIR", os.path.join(SRC_DIR, "config"))
+PROMPTS_DIR = os.environ.get("ESA_DGR_PROMPTS_DIR", os.path.join(SRC_DIR, "prompts"))
+CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+EXTERNAL_CONFIG_FILE = "external.json"  # 外部 API 模型配置；相对路径按所用的 config.json 所在目录解析，设为 None 时不加载
+PROMPTS_FILE = os.path.join(PROMPTS_DIR, "evidence.json")
+TEMPLATES_FILE = os.path.join(PROMPTS_DIR, "templates.json")
+
+
+def load_prompt_templates(config: dict = None, templates_path=None, prompt_versions: dict = None) -> PromptRegistry:
+    """
+    加载版本化的 prompt 模板，版本取 config.json 的 "prompts.versions"，prompt_versions 覆盖；
+    config 为 None 时读取默认的 config.json。模板文件不存在时返回空的注册表。
+    """
+    templates_path = templates_path or TEMPLATES_FILE
+    if not os.path.exists(templates_path):
+        return PromptRegistry()
+    if config is None and os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    versions = dict((config or {}).get('prompts', {}).get('versions', {}), **(prompt_versions or {}))
+    return PromptRegistry.from_file(templates_path, versions)
+
+
+def client_factory(api_key, base_url):
+    # 重试由 _call_with_retries 统一处理，这样每次 429 / 超时都会反馈给限流器和副本池
+    return lambda: OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
 class ModelAPI:
-    def __init__(self, config_path):
+    def __init__(self, config_path, cache: ResponseCache = None,
+                 external_config_path=None, prompts_path=None, adaptive: bool = None, batching: bool = None,
+                 profiles_path=None, streaming: bool = None, templates_path=None, prompt_versions: dict = None):
         # 1. 加载主配置
         with open(config_path, 'r') as f:
             self.config = json.load(f)
        
-        # 2. 准备容器
-        self.clients = {}             # 存放 OpenAI 客户端实例
+        # 2. 准备容器；OpenAI 客户端、连接池和微批线程都在第一次调用该模型时才创建
+        self.pools = {}               # 模型名 -> ReplicaPool，请求分配给在途请求最少的副本
+        self.replica_options = replica_options(self.config)
         self.model_types = {}         # 标记模型调用类型：local / external / requests
         self.model_features = {}      # 标记模型特殊能力（如 reasoning）
-        self.external_base_urls = {}  # 存放外部模型的 base_url，requests 调用时使用
+        self.external_base_urls = {}  # 存放外部模型的 base_url（有多个副本时为第一个）
+        self.sessions = {}            # requests 调用使用的连接池，每个 base_url 一个，惰性创建
+        self._lazy_lock = threading.Lock()
+        self.headers = {}             # requests 调用的请求头，初始化时构建一次
+        self.http_options = http_options(self.config)
+        self.cache = cache            # 可选的持久化响应缓存（只缓存 temperature=0 的调用）
+        self.max_concurrency = dict(self.config.get('concurrency', {}))  # 每个模型的并发上限
+        self.adaptive_options = adaptive_options(self.config)  # 每个端点的 AIMD 并发控制（config.json 的 "adaptive" 段）
+        if adaptive is not None:
+            self.adaptive_options["enabled"] = adaptive
+        self.retry_options = retry_options(self.config)  # 429 / 超时 / 5xx 的重试（config.json 的 "retry" 段）
+        self.limiters = {}            # 每个端点（副本 URL）一个 AdaptiveLimiter，同一端点上的模型共享
+        self.batching_options = batching_options(self.config)  # 跨条目微批（config.json 的 "batching" 段）
+        if batching is not None:
+            self.batching_options["enabled"] = batching
+        self.batchers = {}            # 本地模型名 -> MicroBatcher，只对配置了对话模板的模型启用，惰性创建
+        self.profiles = {}            # 角色 -> 生成参数（prompts/profiles.json）
+        self.templates = PromptRegistry()  # 版本化的 prompt 模板（prompts/templates.json），同时统计 prefix cache 命中
+        self.streaming = self.config.get('streaming', {}).get('enabled', False) if streaming is None else streaming
         
-        # 3. 处理本地模型（config['models'] 中的条目）
+        # 3. 处理本地模型（config['models'] 中的条目，值可以是一个 URL 或一组副本的 URL）
         for model_name, base_url in self.config.get('models', {}).items():
-            self.clients[model_name] = OpenAI(api_key='EMPTY', base_url=base_url)
+            self.add_pool(model_name, [Replica(url, api_key='EMPTY', factory=client_factory('EMPTY', url))
+                                       for url in url_list(base_url)])
             self.model_types[model_name] = 'local'
         
         # 4. 处理 external.json 中的外部 API 模型
-        external_config_path = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/src/config/external.json"
-        if os.path.exists(external_config_path):
+        if external_config_path is None and EXTERNAL_CONFIG_FILE:
+            # 与 --config 指定的配置文件放在一起（EXTERNAL_CONFIG_FILE 为绝对路径时原样使用）
+            external_config_path = os.path.join(os.path.dirname(os.path.abspath(config_path)), EXTERNAL_CONFIG_FILE)
+        if external_config_path and os.path.exists(external_config_path):
             with open(external_config_path, 'r') as f:
                 external_config = json.load(f)
             
             for model_name, api_conf in external_config.get('models', {}).items():
                 api_key  = api_conf.get('api_key')
-                base_url = api_conf.get('base_url')
+                base_urls = url_list(api_conf.get('base_url'))
+                base_url = base_urls[0]
                 real_name = api_conf.get('model_name')
                 
-                # 用 OpenAI 客户端保存认证信息（主要为了统一管理 api_key）
-                self.clients[model_name] = OpenAI(api_key=api_key, base_url=base_url)
+                # 用副本保存认证信息（主要为了统一管理 api_key），客户端在第一次调用时创建
+                self.add_pool(model_name, [Replica(url, api_key=api_key, factory=client_factory(api_key, url))
+                                           for url in base_urls])
                 
                 # 根据 URL 判断调用方式：SiliconFlow 用 requests，其它用 openai-style
                 if "siliconflow.cn" in base_url:
                     self.model_types[model_name] = 'requests'
+                    self.headers[model_name] = {
+                        "Authorization": f"Bearer {api_key}",
+                        "Content-Type": "application/json"
+                    }
                 else:
                     self.model_types[model_name] = 'external'
                 
-                # 记录 base_url 以便 requests.post 时使用
+                # 记录 base_url 以便 requests 调用时使用
                 self.external_base_urls[model_name] = base_url
                 
                 # 记录实际的模型名称
                 self.config.setdefault('external_model_names', {})[model_name] = real_name
                 
+                if 'max_concurrency' in api_conf:
+                    self.max_concurrency[model_name] = api_conf['max_concurrency']
+                
                 # deepseek-reasoner 有推理功能
                 if real_name == 'deepseek-r1-250120':
                     self.model_features[model_name] = {'has_reasoning': True}
         
         # 5. 加载 evidence 提示内容
-        with open("/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/src/prompts/evidence.json", 'r') as f:
+        prompts_path = prompts_path or PROMPTS_FILE
+        with open(prompts_path, 'r') as f:
             self.evidence_prompts = json.load(f)
+        
+        # 5.1 每个角色的生成参数，默认与 evidence.json 放在同一目录
+        profiles_path = profiles_path or os.path.join(os.path.dirname(prompts_path), "profiles.json")
+        if os.path.exists(profiles_path):
+            self.profiles = load_profiles(profiles_path)
+        
+        # 5.2 版本化的 prompt 模板，版本取 config.json 的 "prompts.versions"，prompt_versions 覆盖
+        templates_path = templates_path or os.path.join(os.path.dirname(prompts_path), "templates.json")
+        self.templates = load_prompt_templates(self.config, templates_path, prompt_versions)
+        
+        # 6. 每个端点一个限流器；未启用 adaptive 时按 concurrency 上限（没有配置时为 adaptive.max）固定限流
+        for pool in self.pools.values():
+            for replica in pool.replicas:
+                if replica.url not in self.limiters:
+                    self.limiters[replica.url] = AdaptiveLimiter(self.adaptive_options, self.endpoint_limit(replica.url))
+        
+        # 7. 本地模型的跨条目微批：并发条目的 prompt 合并成一次 /v1/completions 批量请求；
+        #    模板在这里检查，MicroBatcher（及其线程）在该模型第一次调用时创建
+        if self.batching_options["enabled"]:
+            for model_name, template in self.batching_options["templates"].items():
+                if self.model_types.get(model_name) == 'local' and template not in CHAT_TEMPLATES:
+                    raise ValueError(f"Unknown chat template '{template}' for model '{model_name}'.")
     
-    def get_response(self, model_name, system_role_key, query):
+    def add_pool(self, model_name, replicas):
+        self.pools[model_name] = ReplicaPool(model_name, replicas, self.replica_options)
+    
+    def session(self, url):
+        session = self.sessions.get(url)
+        if session is None:
+            with self._lazy_lock:
+                session = self.sessions.get(url)
+                if session is None:
+                    session = self.sessions[url] = make_session(self.http_options)
+        return session
+    
+    def batcher(self, model_name):
+        """模型启用了微批时返回它的 MicroBatcher（第一次调用时创建），否则返回 None。"""
+        if not self.batching_options["enabled"] or self.model_types.get(model_name) != 'local' \
+                or model_name not in self.batching_options["templates"]:
+            return None
+        batcher = self.batchers.get(model_name)
+        if batcher is None:
+            with self._lazy_lock:
+                batcher = self.batchers.get(model_name)
+                if batcher is None:
+                    batcher = self.batchers[model_name] = MicroBatcher(
+                        lambda group, prompts: self._send_batch(model_name, group, prompts),
+                        window=self.batching_options["window_ms"] / 1000,
+                        max_batch=self.batching_options["max_batch"],
+                        max_inflight=self.batching_options["max_inflight"],
+                        name=f"batch-{model_name}",
+                    )
+        return batcher
+    
+    def check_models(self, model_names, timeout=3.0):
+        """
+        并发探测 model_names 的每个副本（GET /v1/models），返回 probe_models 的报告；
+        没有配置的模型直接记为失败。requests 类型的地址是 chat/completions 端点本身，不做探测。
+        只有本地 vLLM 模型要求 /models 中列出配置的模型名；外部模型只检查端点可达且认证通过。
+        """
+        targets, report = {}, {}
+        for model_name in dict.fromkeys(model_names):
+            if model_name not in self.pools:
+                report[model_name] = {"ok": False, "endpoints": {}, "error": "not configured in config.json / external.json"}
+            elif self.model_types[model_name] == 'requests':
+                report[model_name] = {"ok": True, "endpoints": {}, "skipped": True}
+            else:
+                local = self.model_types[model_name] == 'local'
+                served_name = model_name if local else self.config['external_model_names'][model_name]
+                targets[model_name] = [(replica.url, replica.api_key, served_name, local)
+                                       for replica in self.pools[model_name].replicas]
+        report.update(probe_models(targets, timeout))
+        return report
+    
+    def build_messages(self, model_name, system_role_key, query):
         # 验证模型和角色键
-        if model_name not in self.clients:
+        if model_name not in self.pools:
             raise ValueError(f"Model '{model_name}' is not available.")
         if system_role_key not in self.evidence_prompts:
             raise ValueError(f"System role key '{system_role_key}' is not defined.")
         
-        # 构建 messages
+        # 构建 messages（推理模型不使用 system prompt）
         has_reason = self.model_features.get(model_name, {}).get('has_reasoning', False)
         system_content = self.evidence_prompts[system_role_key]
         if has_reason:
-            messages = [{'role': 'user', 'content': query}]
-        else:
-            messages = [
-                {'role': 'system', 'content': system_content},
-                {'role': 'user',   'content': query}
-            ]
-        
+            return [{'role': 'user', 'content': query}]
+        return [
+            {'role': 'system', 'content': system_content},
+            {'role': 'user',   'content': query}
+        ]
+    
+    def chat_kwargs(self, model_name, messages, system_role_key=None):
+        # OpenAI-style（external / local）调用参数，角色的 profile 覆盖默认值
         mtype = self.model_types.get(model_name)
-        client = self.clients[model_name]
-        
-        # —— external (OpenAI-style) 调用 —— 
+        has_reason = self.model_features.get(model_name, {}).get('has_reasoning', False)
+        profile = profile_params(self.profiles.get(system_role_key, {}), mtype, has_reason)
         if mtype == 'external':
-            actual = self.config['external_model_names'][model_name]
-            resp = client.chat.completions.create(
-                model=actual,
+            params = dict(
+                model=self.config['external_model_names'][model_name],
                 messages=messages,
                 max_tokens=512,
                 temperature=0,
                 stream=False
             )
-            # print("DEBUG from ModelAPI: the full response is: ",resp)
-            return resp.choices[0].message.content
-        
-        # —— requests (SiliconFlow 风格) 调用 —— 
-        elif mtype == 'requests':
-            url = self.external_base_urls[model_name]
-            payload = {
-                "model": self.config['external_model_names'][model_name],
-                "messages": messages,
-                "stream": False,
-                "max_tokens": 512,
-                "stop": None,
-                "temperature": 0.7,   # 可根据需要自行调整
-                "top_p": 0.7,
-                "top_k": 50,
-                "frequency_penalty": 0.5,
-                "n": 1,
-                "response_format": {"type": "text"},
-                # 如果需要 tools 参数，这里也可加上
-            }
-            headers = {
-                "Authorization": f"Bearer {client.api_key}",
-                "Content-Type": "application/json"
-            }
-            r = requests.post(url, json=payload, headers=headers)
-            r.raise_for_status()
-            data = r.json()
-            # 假设返回结构同 OpenAI：choices → message → content
-            return data['choices'][0]['message']['content']
-        
-        # —— local (内部服务) 调用 —— 
-        else:  # local
-            resp = client.chat.completions.create(
+        else:
+            params = dict(
                 model=model_name,
                 messages=messages,
                 max_tokens=512,
                 temperature=0
             )
-            print("DEBUG from ModelAPI: the full response is: ",resp)
-            return resp.choices[0].message.content
+        params.update(profile)
+        return params
     
-    def get_response_with_reasoning(self, model_name, system_role_key, query):
-        # 验证模型和角色键
-        if model_name not in self.clients:
-            raise ValueError(f"Model '{model_name}' is not available.")
-        if system_role_key not in self.evidence_prompts:
-            raise ValueError(f"System role key '{system_role_key}' is not defined.")
-        
-        # 构建 messages（同上）
+    def requests_payload(self, model_name, messages, system_role_key=None):
+        # SiliconFlow 风格调用的 payload
+        payload = {
+            "model": self.config['external_model_names'][model_name],
+            "messages": messages,
+            "stream": False,
+            "max_tokens": 512,
+            "stop": None,
+            "temperature": 0.7,   # 可根据需要自行调整
+            "top_p": 0.7,
+            "top_k": 50,
+            "frequency_penalty": 0.5,
+            "n": 1,
+            "response_format": {"type": "text"},
+            # 如果需要 tools 参数，这里也可加上
+        }
         has_reason = self.model_features.get(model_name, {}).get('has_reasoning', False)
-        system_content = self.evidence_prompts[system_role_key]
-        if has_reason:
-            messages = [{'role': 'user', 'content': query}]
-        else:
-            messages = [
-                {'role': 'system', 'content': system_content},
-                {'role': 'user',   'content': query}
-            ]
-        
+        payload.update(profile_params(self.profiles.get(system_role_key, {}), 'requests', has_reason))
+        return payload
+    
+    def requests_headers(self, model_name):
+        return self.headers[model_name]
+    
+    def request_params(self, model_name, messages, system_role_key=None):
+        # 实际发出的请求参数（同时作为响应缓存的 key）
+        if self.model_types.get(model_name) == 'requests':
+            return self.requests_payload(model_name, messages, system_role_key)
+        return self.chat_kwargs(model_name, messages, system_role_key)
+    
+    def early_stop(self, model_name, system_role_key):
+        """流式模式下该角色的提前结束判断；未启用流式、角色没有配置或推理模型时返回 None。"""
+        if not self.streaming or self.model_features.get(model_name, {}).get('has_reasoning', False):
+            return None
+        name = self.profiles.get(system_role_key, {}).get('early_stop')
+        return EARLY_STOP[name] if name else None
+    
+    def _complete(self, replica, model_name, params, early_stop=None):
+        """向 replica 发出请求，返回 (content, resp)；requests 路径和流式调用下 resp 为 None。"""
         mtype = self.model_types.get(model_name)
-        client = self.clients[model_name]
-        result = {}
         
-        # —— external —— 
-        if mtype == 'external':
-            actual = self.config['external_model_names'][model_name]
-            resp = client.chat.completions.create(
-                model=actual,
-                messages=messages,
-                max_tokens=512,
-                temperature=0,
-                stream=False
-            )
-            print("DEBUG from ModelAPI: the full response is: ",resp)
-            result['content'] = resp.choices[0].message.content
-        
-        # —— requests —— 
-        elif mtype == 'requests':
-            url = self.external_base_urls[model_name]
-            payload = {
-                "model": self.config['external_model_names'][model_name],
-                "messages": messages,
-                "stream": False,
-                "max_tokens": 512,
-                "stop": None,
-                "temperature": 0.7,
-                "top_p": 0.7,
-                "top_k": 50,
-                "frequency_penalty": 0.5,
-                "n": 1,
-                "response_format": {"type": "text"},
-            }
-            headers = {
-                "Authorization": f"Bearer {client.api_key}",
-                "Content-Type": "application/json"
-            }
-            r = requests.post(url, json=payload, headers=headers)
+        # —— requests (SiliconFlow 风格) 调用 —— 
+        if mtype == 'requests':
+            url = replica.url
+            r = self.session(url).post(url, json=dict(params, stream=early_stop is not None),
+                                        headers=self.requests_headers(model_name),
+                                        timeout=timeouts(self.http_options), stream=early_stop is not None)
+            annotate(status=r.status_code)
             r.raise_for_status()
+            if early_stop is not None:
+                return self._read_sse(r, early_stop), None
             data = r.json()
-            result['content'] = data['choices'][0]['message']['content']
-        
-        # —— local —— 
-        else:
-            resp = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                max_tokens=512,
-                temperature=0
-            )
-            print("DEBUG from ModelAPI: the full response is: ",resp)
-            result['content'] = resp.choices[0].message.content
+            self.record_usage(model_name, data.get('usage'))
+            # 假设返回结构同 OpenAI：choices → message → content
+            return data['choices'][0]['message']['content'], None
         
+        # —— external (OpenAI-style) / local (内部服务) 调用 —— 
+        if early_stop is not None:
+            return self._read_stream(replica, params, early_stop), None
+        resp = replica.client.chat.completions.create(**params)
+        self.record_usage(model_name, resp.usage)
+        return resp.choices[0].message.content, resp
+    
+    def record_usage(self, model_name, usage):
+        # token 用量写进当前 span，prompt_tokens / cached_tokens 累计到模板注册表
+        fields = usage_fields(usage)
+        annotate(**fields)
+        self.templates.record(model_name, fields.get('prompt_tokens'), fields.get('cached_tokens'))
+    
+    def _read_stream(self, replica, params, early_stop):
+        # 流式读取回答，能取出完整的值时立即关闭连接，服务端随之中止生成
+        reader = EarlyStopReader(early_stop)
+        stream = replica.client.chat.completions.create(**dict(params, stream=True))
+        try:
+            for chunk in stream:
+                if chunk.choices and reader.feed(chunk.choices[0].delta.content):
+                    break
+        finally:
+            stream.close()
+        annotate(**reader.fields())
+        return reader.text
+    
+    def _read_sse(self, r, early_stop):
+        # requests 路径的流式读取，SiliconFlow 返回 OpenAI 格式的 SSE
+        reader = EarlyStopReader(early_stop)
+        try:
+            for line in r.iter_lines(decode_unicode=True):
+                delta = sse_delta(line or "")
+                if delta is not None and reader.feed(delta):
+                    break
+        finally:
+            r.close()
+        annotate(**reader.fields())
+        return reader.text
+    
+    def _complete_batch(self, replica, model_name, settings, prompts):
+        """一次 /v1/completions 请求发出一批已渲染的 prompt，按 choice.index 取回各自的结果。"""
+        template = CHAT_TEMPLATES[self.batching_options["templates"][model_name]]
+        settings = dict(settings)
+        settings['stop'] = (settings.get('stop') or []) + template["stop"]
+        resp = replica.client.completions.create(prompt=prompts, **settings)
+        self.record_usage(model_name, resp.usage)
+        contents = [None] * len(prompts)
+        for choice in resp.choices:
+            contents[choice.index] = choice.text
+        return contents
+    
+    def _send_batch(self, model_name, group, prompts):
+        # 在 batcher 的发送线程里执行；一批只占用端点限流器的一个名额
+        with span("llm_batch", model=model_name, batch_size=len(prompts)):
+            return self._call_with_retries(model_name, self._complete_batch, model_name, json.loads(group), prompts)
+    
+    def submit_batched(self, model_name, params):
+        """模型启用了微批时把请求交给 batcher，返回 Future（结果为 content）；否则返回 None。"""
+        batcher = self.batcher(model_name)
+        if batcher is None:
+            return None
+        # 除 messages 外参数完全相同的请求才能合批
+        settings = {k: v for k, v in params.items() if k != 'messages'}
+        prompt = render_prompt(params['messages'], self.batching_options["templates"][model_name])
+        return batcher.submit(json.dumps(settings, sort_keys=True), prompt)
+    
+    def _call_with_retries(self, model_name, call, *args):
+        """
+        从副本池中选出在途请求最少的副本，经该端点的限流器执行 call(replica, *args)：
+        名额不足时阻塞等待；429 / 超时 / 5xx 按 full jitter 退避后换一个副本重试，
+        重试等待期间不占用名额。其它错误直接抛出。
+        """
+        pool = self.pools[model_name]
+        options = self.retry_options
+        replica = None
+        for attempt in range(options["max_retries"] + 1):
+            replica = pool.acquire(exclude=replica)
+            limiter = self.limiters[replica.url]
+            generation = limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = call(replica, *args)
+            except Exception as e:
+                transient = is_transient(e)
+                limiter.release(generation, time.perf_counter() - start if transient else None, transient)
+                pool.release(replica, transient)
+                if not transient or attempt == options["max_retries"]:
+                    annotate(retries=attempt, endpoint=replica.url)
+                    raise
+                delay = backoff_delay(attempt, options, e)
+                print(f"Transient error from {model_name} ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                limiter.release(generation, None, False)
+                pool.release(replica, False)
+                raise
+            limiter.release(generation, time.perf_counter() - start, False)
+            pool.release(replica, False)
+            annotate(retries=attempt, endpoint=replica.url)
+            return result
+    
+    def endpoints(self, model_name):
+        return [replica.url for replica in self.pools[model_name].replicas]
+    
+    def endpoint_limit(self, endpoint, default=None):
+        # 同一端点上各模型并发上限中最小的一个（对每个副本分别生效）；都没有配置时返回 default
+        limits = [self.max_concurrency[name] for name in self.pools
+                  if name in self.max_concurrency and endpoint in self.endpoints(name)]
+        return min(limits) if limits else default
+    
+    def limiter_stats(self):
+        return {endpoint: limiter.stats() for endpoint, limiter in self.limiters.items()}
+    
+    def replica_stats(self):
+        # 只列出配置了多个副本的模型
+        return {name: pool.stats() for name, pool in self.pools.items() if len(pool.replicas) > 1}
+    
+    def prefix_cache_stats(self):
+        return self.templates.stats()
+    
+    def batcher_stats(self):
+        return {model_name: batcher.stats() for model_name, batcher in self.batchers.items()}
+    
+    def cache_lookup(self, params, early_stop=None):
+        """
+        查响应缓存，返回 (key, record)；未启用缓存或调用不可缓存时 key 为 None。
+        提前结束的流式调用得到的是截断后的回答，key 中带上 early_stop 的方式，不与完整回答混用。
+        """
+        if self.cache is None:
+            return None, None
+        if not is_cacheable(params):
+            self.cache.skip()
+            return None, None
+        key = request_key(dict(params, early_stop=early_stop.__name__) if early_stop is not None else params)
+        return key, self.cache.get(key)
+    
+    def make_record(self, model_name, content, resp):
+        record = {'content': content}
         # 如果支持 reasoning，则尝试提取
-        if has_reason:
-            # OpenAI client 返回
-            if mtype != 'requests' and hasattr(resp.choices[0].message, 'reasoning_content'):
-                result['reasoning_content'] = resp.choices[0].message.reasoning_content
+        if self.model_features.get(model_name, {}).get('has_reasoning', False):
+            record['reasoning_content'] = extract_reasoning(resp)
+        return record
+    
+    def _response_record(self, model_name, system_role_key, query):
+        """返回 {'content': ..., ['reasoning_content': ...]}，确定性调用优先查缓存。"""
+        messages = self.build_messages(model_name, system_role_key, query)
+        params = self.request_params(model_name, messages, system_role_key)
+        early_stop = self.early_stop(model_name, system_role_key)
+        with span("llm_call", model=model_name):
+            key, record = self.cache_lookup(params, early_stop)
+            if record is not None:
+                annotate(cache_hit=True)
+                return record
+            
+            # 流式调用逐个发出，不参与微批
+            future = self.submit_batched(model_name, params) if early_stop is None else None
+            if future is not None:
+                content, resp = future.result(), None
+                annotate(batched=True)
             else:
-                # SiliconFlow 或未返回时的 fallback
-                result['reasoning_content'] = "模型支持推理功能，但未返回相关内容。"
-        
-        return result
+                content, resp = self._call_with_retries(model_name, self._complete, model_name, params, early_stop)
+            record = self.make_record(model_name, content, resp)
+            if key is not None:
+                self.cache.put(key, record)
+            return record
+    
+    def get_response(self, model_name, system_role_key, query):
+        return self._response_record(model_name, system_role_key, query)['content']
+    
+    def get_response_with_reasoning(self, model_name, system_role_key, query):
+        return dict(self._response_record(model_name, system_role_key, query))
+
+
+def usage_fields(usage):
+    # OpenAI 客户端返回对象，requests 路径返回 dict；没有 usage 时返回空
+    if usage is None:
+        return {}
+    # cached_tokens：vLLM（--enable-prompt-tokens-details）/ OpenAI 在 prompt_tokens_details 中返回的 prefix cache 命中数
+    if isinstance(usage, dict):
+        return {'prompt_tokens': usage.get('prompt_tokens'), 'completion_tokens': usage.get('completion_tokens'),
+                'cached_tokens': (usage.get('prompt_tokens_details') or {}).get('cached_tokens')}
+    return {'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+            'completion_tokens': getattr(usage, 'completion_tokens', None),
+            'cached_tokens': getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)}
+
+
+def extract_reasoning(resp):
+    # OpenAI client 返回
+    if resp is not None and hasattr(resp.choices[0].message, 'reasoning_content'):
+        return resp.choices[0].message.reasoning_content
+    # SiliconFlow 或未返回时的 fallback
+    return "模型支持推理功能，但未返回相关内容。"
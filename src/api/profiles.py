@@ -0,0 +1,95 @@
+import json
+import re
+from typing import Callable, Dict, Optional
+
+# 每个角色（prompts/evidence.json 的 key）的生成参数，放在 prompts/profiles.json 中：
+#   max_tokens / temperature / top_p / stop：直接作为请求参数
+#   response_format：默认只发给本地 vLLM 模型；外部 API 对 json_object 有额外要求（messages 中须出现 "json"），
+#     需要时用 response_format_types 显式列出允许的模型类型（local / external / requests）
+#   guided_json：vLLM 的受限解码 JSON schema，只发给本地模型（通过 extra_body）
+#   early_stop：流式模式下判断回答是否已经完整的方式（number / json），见 EARLY_STOP
+#   推理模型（has_reasoning）不发送 response_format / guided_json，也不使用 max_tokens / stop 的限制
+#     （推理过程也计入输出 token，判分角色的上限会把回答截断或截空），上限改用 reasoning_max_tokens（没有时不限）
+PROFILE_PARAMS = ("max_tokens", "temperature", "top_p", "stop")
+CAP_PARAMS = ("max_tokens", "stop")
+STRUCTURED_TYPES = ("local",)
+
+_NUMBER = re.compile(r"\s*([01](?:\.\d+)?|\.\d+)(?=[^\d.])")
+
+
+def load_profiles(path: str) -> Dict[str, Dict]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def profile_params(profile: Dict, model_type: str, has_reasoning: bool = False) -> Dict:
+    """profile 中需要写进请求参数的部分；guided_json 只有本地 vLLM 服务支持，且不能与 response_format 同时使用。"""
+    params = {k: profile[k] for k in PROFILE_PARAMS if k in profile}
+    if has_reasoning:
+        params = {k: v for k, v in params.items() if k not in CAP_PARAMS}
+        if profile.get('reasoning_max_tokens') is not None:
+            params['max_tokens'] = profile['reasoning_max_tokens']
+        return params
+    if model_type == 'local' and profile.get('guided_json') is not None:
+        params['extra_body'] = {'guided_json': profile['guided_json']}
+    elif 'response_format' in profile and model_type in profile.get('response_format_types', STRUCTURED_TYPES):
+        params['response_format'] = profile['response_format']
+    return params
+
+
+def complete_number(text: str) -> Optional[str]:
+    # 0~1 之间的数字后面已经出现了非数字字符，说明数字已经写完
+    match = _NUMBER.match(text)
+    return match.group(1) if match else None
+
+
+def complete_json(text: str) -> Optional[str]:
+    # 第一个 JSON 对象已经闭合
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        _, end = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None
+    return text[start:end]
+
+
+# 流式读取时每收到一段就调用一次，能取出完整的值时返回截断后的回答，流随即关闭
+EARLY_STOP: Dict[str, Callable[[str], Optional[str]]] = {
+    "number": complete_number,
+    "json": complete_json,
+}
+
+
+def sse_delta(line: str) -> Optional[str]:
+    """解析一行 SSE（"data: {...}"），返回增量文本；[DONE] 和非数据行返回 None。"""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return None
+    choices = json.loads(data).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or ""
+
+
+class EarlyStopReader:
+    """累积流式回答；early_stop 能取出完整的值时 feed() 返回 True，text 为截断后的回答。"""
+
+    def __init__(self, early_stop: Callable[[str], Optional[str]]):
+        self.early_stop = early_stop
+        self.text = ""
+        self.chunks = 0
+        self.stopped = False
+
+    def feed(self, delta: Optional[str]) -> bool:
+        self.text += delta or ""
+        self.chunks += 1
+        value = self.early_stop(self.text)
+        if value is not None:
+            self.text, self.stopped = value, True
+        return self.stopped
+
+    def fields(self) -> Dict:
+        # tracing 字段：收到的分块数、是否提前关闭
+        return {"stream_chunks": self.chunks, "early_stop": self.stopped}
@@ -0,0 +1,70 @@
+import json
+import threading
+from typing import Dict, Optional
+
+# prompts/templates.json 的格式：
+#   {模板名: {版本: {"prefix": 固定的指令部分（原样输出）, "text": 含 {question} / {reference} 等字段的可变部分}}}
+# prefix 放在最前面、与条目无关，vLLM 的 automatic prefix caching 可以跨请求复用这部分的 KV cache；
+# 旧版本（v1）保留原来的 prompt 原文，指定版本即可复现以前的结果。
+
+
+def load_templates(path: str) -> Dict[str, Dict[str, Dict]]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _version_key(version: str):
+    digits = "".join(ch for ch in version if ch.isdigit())
+    return (int(digits) if digits else -1, version)
+
+
+class PromptRegistry:
+    """
+    按名字和版本渲染 prompt；未指定版本的模板使用最新版本。
+    同时按模型累计 usage 中的 prompt_tokens 和 cached_tokens（prompt_tokens_details），
+    用来观察 prefix cache 的命中率。
+    """
+
+    def __init__(self, templates: Dict[str, Dict[str, Dict]] = None, versions: Optional[Dict[str, str]] = None):
+        self.templates = templates or {}
+        self.selected = {}
+        for name, variants in self.templates.items():
+            version = (versions or {}).get(name) or max(variants, key=_version_key)
+            if version not in variants:
+                raise ValueError(f"Unknown version '{version}' of prompt template '{name}', "
+                                 f"choose from {sorted(variants)}.")
+            self.selected[name] = version
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_file(cls, path: str, versions: Optional[Dict[str, str]] = None) -> "PromptRegistry":
+        return cls(load_templates(path), versions)
+
+    def versions(self) -> Dict[str, str]:
+        """当前使用的模板版本，写进结果以便复现。"""
+        return dict(self.selected)
+
+    def render(self, name: str, **fields) -> str:
+        template = self.templates[name][self.selected[name]]
+        return template.get("prefix", "") + template["text"].format(**fields)
+
+    def record(self, model_name: str, prompt_tokens: Optional[int], cached_tokens: Optional[int]):
+        if not prompt_tokens:
+            return
+        with self._lock:
+            usage = self._usage.setdefault(model_name, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                                                        "reported": 0})
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            if cached_tokens is not None:
+                # 服务端没有开启 prompt_tokens_details 时不返回 cached_tokens，命中率只按返回了的调用计算
+                usage["cached_tokens"] += cached_tokens
+                usage["reported"] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                model_name: dict(usage, hit_rate=usage["cached_tokens"] / usage["prompt_tokens"])
+                for model_name, usage in self._usage.items()
+            }
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# 副本池参数，可在 config.json 的 "replicas" 段覆盖
+DEFAULT_REPLICA_OPTIONS = {
+    "eject_after": 3,        # 连续失败（429 / 超时 / 5xx / 连接错误）这么多次后摘除该副本
+    "cooldown": 5.0,         # 摘除后等待多少秒再放回（试用）；试用期内再次失败时等待时间翻倍
+    "max_cooldown": 120.0,
+}
+
+
+def replica_options(config: dict) -> dict:
+    options = dict(DEFAULT_REPLICA_OPTIONS)
+    options.update(config.get('replicas', {}))
+    return options
+
+
+def url_list(value) -> List[str]:
+    # config.json 中模型的地址可以是单个 URL，也可以是一组副本的 URL
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class Replica:
+    # client 可以直接给出，也可以给 factory，在第一次用到时才创建（run 只用到配置中的少数几个模型）
+    def __init__(self, url: str, client: Any = None, api_key: Optional[str] = None,
+                 factory: Optional[Callable[[], Any]] = None):
+        self.url = url
+        self.api_key = api_key if api_key is not None else getattr(client, "api_key", None)
+        self._client = client
+        self._factory = factory
+        self._client_lock = threading.Lock()
+        self.outstanding = 0          # 已分配、尚未完成的请求数
+        self.failures = 0             # 连续失败次数
+        self.cooldown = 0.0
+        self.ejected_until = 0.0      # 0 表示在池中；否则在该时刻之前不分配请求
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    @property
+    def client(self) -> Any:
+        if self._client is None and self._factory is not None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+
+class ReplicaPool:
+    """
+    同一逻辑模型的一组副本。acquire() 选出在途请求最少的可用副本（并列时随机），
+    release() 记录结果：连续失败达到 eject_after 次的副本被摘除 cooldown 秒，
+    到期后重新参与分配，第一次成功即恢复，失败则以加倍的 cooldown 再次摘除。
+    所有副本都被摘除时仍然分配给最早到期的那个，请求不会因此失败。
+    """
+
+    def __init__(self, model_name: str, replicas: List[Replica], options: dict = None):
+        self.model_name = model_name
+        self.replicas = replicas
+        self.options = dict(DEFAULT_REPLICA_OPTIONS, **(options or {}))
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude: Optional[Replica] = None) -> Replica:
+        """exclude：上一次失败的副本，重试时有其它可用副本就避开它。"""
+        with self._lock:
+            now = time.monotonic()
+            available = [r for r in self.replicas if r.ejected_until <= now]
+            if exclude is not None and len(available) > 1:
+                available = [r for r in available if r is not exclude]
+            if available:
+                fewest = min(r.outstanding for r in available)
+                replica = random.choice([r for r in available if r.outstanding == fewest])
+            else:
+                replica = min(self.replicas, key=lambda r: r.ejected_until)
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def release(self, replica: Replica, failed: bool):
+        with self._lock:
+            replica.outstanding -= 1
+            if not failed:
+                if replica.ejected_until:
+                    print(f"Replica {replica.url} of {self.model_name} recovered.")
+                replica.failures, replica.cooldown, replica.ejected_until = 0, 0.0, 0.0
+                return
+            replica.errors += 1
+            replica.failures += 1
+            if replica.ejected_until > time.monotonic():
+                # 摘除前已经发出的请求陆续失败，不再重复摘除
+                return
+            # 试用期（刚放回）的副本失败一次就再次摘除
+            if replica.failures >= self.options["eject_after"] or replica.cooldown:
+                replica.cooldown = min(self.options["max_cooldown"],
+                                       replica.cooldown * 2 if replica.cooldown else self.options["cooldown"])
+                replica.ejected_until = time.monotonic() + replica.cooldown
+                replica.ejections += 1
+                if len(self.replicas) > 1:
+                    print(f"Ejected replica {replica.url} of {self.model_name} for {replica.cooldown:.0f}s "
+                          f"after {replica.failures} failures.")
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                r.url: {
+                    "requests": r.requests,
+                    "errors": r.errors,
+                    "ejections": r.ejections,
+                    "outstanding": r.outstanding,
+                    "ejected": r.ejected_until > now,
+                }
+                for r in self.replicas
+            }
@@ -0,0 +1,250 @@
+"""
+本地的 OpenAI-compatible 假服务，用于离线压测：
+POST /v1/chat/completions 按配置的延迟分布 sleep 后返回预设的 strict / loose / answer / evidence 内容，
+POST /v1/completions 接受一组 prompt（微批），GET /v1/models 返回模型列表。返回内容由 prompt 的哈希决定，同样的请求总是得到同样的结果。
+
+    python bench/mock_server.py --port 9000 --latency lognormal:40:0.5 --modelLatency strictqwen=fixed:15
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec: str):
+    """
+    延迟分布（毫秒）：fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA，
+    返回一个 rng -> 秒 的采样函数。
+    """
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda rng: args[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1]) / 1000
+    if kind == "lognormal":
+        import math
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1]) / 1000
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+class MockBackend:
+    def __init__(self, latency: str = "fixed:20", model_latency=None, strict_full_rate: float = 0.3,
+                 loose_mean: float = 0.6, answer_tokens: int = 40, ramble: int = 0, token_ms: float = 0.0,
+                 served_models=None):
+        self.default_latency = parse_latency(latency)
+        self.model_latency = {name: parse_latency(spec) for name, spec in (model_latency or {}).items()}
+        self.strict_full_rate = strict_full_rate
+        self.loose_mean = loose_mean
+        self.answer_tokens = answer_tokens
+        self.ramble = ramble              # 判分回答后面附加的多余词数，模拟不守格式的模型
+        self.token_ms = token_ms          # 每个输出 token 的解码耗时（在请求延迟之外）
+        self.served_models = list(served_models or ["mock"])  # GET /v1/models 返回的模型名（启动时的健康检查会核对）
+        self.requests = 0
+        self.aborted = 0                  # 客户端提前关闭的流式请求数
+        self._lock = threading.Lock()
+        self._blocks = set()              # 模拟 vLLM 的 prefix cache：已经见过的前缀块（链式哈希）
+
+    def _cached_tokens(self, model: str, text: str) -> int:
+        # 每 64 个字符（约 16 个 token）一块，从头开始连续命中的块数 × 16 即为 cached_tokens
+        digest, cached, hit = model.encode("utf-8"), 0, True
+        with self._lock:
+            if len(self._blocks) > 1_000_000:
+                self._blocks.clear()
+            for i in range(0, len(text) - 63, 64):
+                digest = hashlib.md5(digest + text[i:i + 64].encode("utf-8")).digest()
+                if hit and digest in self._blocks:
+                    cached += 16
+                else:
+                    hit = False
+                    self._blocks.add(digest)
+        return cached
+
+    def reset_prefix_cache(self):
+        # 对应 vLLM 的 POST /reset_prefix_cache；共用一个 mock 服务的多次压测之间要清空，否则后面的配置命中率偏高
+        with self._lock:
+            self._blocks.clear()
+
+    def _prepare(self, body: dict):
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = messages[-1]["content"] if messages else ""
+        model = body.get("model", "")
+        # 每个请求用 prompt 哈希作为随机种子：结果可复现，与并发顺序无关
+        seed = int(hashlib.md5(f"{model}\0{system}\0{user}".encode("utf-8")).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        latency = self.model_latency.get(model, self.default_latency)(rng)
+        content = self._content(system, user, rng)
+        # 按 max_tokens 截断（约 4 个字符一个 token）
+        max_tokens = body.get("max_tokens")
+        if max_tokens:
+            content = content[:max_tokens * 4]
+        with self._lock:
+            self.requests += 1
+        return model, seed, latency, content, (len(system) + len(user)) // 4
+
+    def _prompt_text(self, body: dict) -> str:
+        return "".join(f"<{m['role']}>{m['content']}" for m in body.get("messages", []))
+
+    def complete(self, body: dict) -> dict:
+        model, seed, latency, content, prompt_tokens = self._prepare(body)
+        cached = self._cached_tokens(model, self._prompt_text(body))
+        time.sleep(latency + self.token_ms * max(1, len(content) // 4) / 1000)
+        return {
+            "id": f"mock-{seed:x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": max(1, len(content) // 4),
+                      "total_tokens": prompt_tokens + max(1, len(content) // 4),
+                      "prompt_tokens_details": {"cached_tokens": min(cached, prompt_tokens)}},
+        }
+
+    def stream(self, body: dict):
+        """流式回答：先等待请求延迟，然后每 4 个字符一个分块，按 token_ms 逐块发出。"""
+        model, seed, latency, content, _ = self._prepare(body)
+        time.sleep(latency)
+        for i in range(0, len(content), 4):
+            time.sleep(self.token_ms / 1000)
+            yield {"id": f"mock-{seed:x}", "object": "chat.completion.chunk", "model": model,
+                   "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}, "finish_reason": None}]}
+
+    def complete_batch(self, body: dict) -> dict:
+        # /v1/completions：prompt 可以是一组已渲染的对话，整批只 sleep 一次（模拟 GPU 上的批量解码）
+        prompts = body.get("prompt", [])
+        prompts = [prompts] if isinstance(prompts, str) else prompts
+        model = body.get("model", "")
+        rng = random.Random(int(hashlib.md5(f"{model}\0{prompts[0] if prompts else ''}".encode("utf-8")).hexdigest()[:16], 16))
+        time.sleep(self.model_latency.get(model, self.default_latency)(rng))
+        with self._lock:
+            self.requests += 1
+        choices, prompt_tokens, completion_tokens, cached = [], 0, 0, 0
+        for i, prompt in enumerate(prompts):
+            seed = int(hashlib.md5(f"{model}\0{prompt}".encode("utf-8")).hexdigest()[:16], 16)
+            text = self._content(prompt, prompt, random.Random(seed))
+            choices.append({"index": i, "text": text, "finish_reason": "stop"})
+            prompt_tokens += len(prompt) // 4
+            cached += min(len(prompt) // 4, self._cached_tokens(model, prompt))
+            completion_tokens += max(1, len(text) // 4)
+        return {
+            "id": f"mock-batch-{len(prompts)}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        }
+
+    def _content(self, system: str, user: str, rng: random.Random) -> str:
+        ramble = "".join(f" word{i}" for i in range(self.ramble))
+        if "missing_evidence" in system:
+            # strict_test 角色
+            if rng.random() < self.strict_full_rate:
+                return json.dumps({"score": 1, "missing_evidence": ""}) + ramble
+            return json.dumps({"score": round(rng.random() * 0.9, 2),
+                               "missing_evidence": f"which entity is referred to in clue {rng.randint(1, 99)}"}) + ramble
+        if "numerical value" in system:
+            # loose_test 角色
+            return f"{min(1.0, max(0.0, rng.gauss(self.loose_mean, 0.2))):.2f}" + ramble
+        if '"final answer"' in user:
+            return json.dumps({"process": " ".join(["reasoning"] * self.answer_tokens),
+                               "final answer": rng.choice(["yes", "no", "Paris", "1990"])})
+        # evidence 提炼
+        return " ".join(f"Evidence sentence {i} for the question." for i in range(rng.randint(3, 5)))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    backend: MockBackend = None
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if path.endswith("/reset_prefix_cache"):
+            self.backend.reset_prefix_cache()
+            self._send_json({"status": "ok"})
+        elif path.endswith("/chat/completions") and body.get("stream"):
+            self._send_stream(self.backend.stream(body))
+        elif path.endswith("/chat/completions"):
+            self._send_json(self.backend.complete(body))
+        elif path.endswith("/completions"):
+            self._send_json(self.backend.complete_batch(body))
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list",
+                             "data": [{"id": name, "object": "model"} for name in self.backend.served_models]})
+        else:
+            self.send_error(404)
+
+    def _send_json(self, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端拿到需要的值后关闭了连接，停止生成
+            with self.backend._lock:
+                self.backend.aborted += 1
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, backend: MockBackend) -> ThreadingHTTPServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"backend": backend})
+    # 默认 listen backlog 只有 5，几十个 worker 同时建连时会被 reset
+    server_class = type("MockHTTPServer", (ThreadingHTTPServer,), {"request_queue_size": 256})
+    server = server_class(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server for benchmarks.")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=str, default="fixed:20", help="Default latency distribution (ms)")
+    parser.add_argument("--modelLatency", action="append", default=[], help="Per-model latency, e.g. strictqwen=fixed:15")
+    parser.add_argument("--strictFullRate", type=float, default=0.3, help="Fraction of strict judgements with score 1")
+    parser.add_argument("--looseMean", type=float, default=0.6, help="Mean of the loose score distribution")
+    parser.add_argument("--ramble", type=int, default=0, help="Extra words appended to judge answers")
+    parser.add_argument("--tokenMs", type=float, default=0.0, help="Decode time per output token (ms)")
+    parser.add_argument("--servedModels", type=str, default="mock", help="Comma-separated model names listed by /v1/models")
+    args = parser.parse_args()
+
+    backend = MockBackend(args.latency, dict(item.split("=", 1) for item in args.modelLatency),
+                          args.strictFullRate, args.looseMean, ramble=args.ramble, token_ms=args.tokenMs,
+                          served_models=[name for name in args.servedModels.split(",") if name])
+    server = serve(args.port, backend)
+    print(f"Mock server listening on 127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
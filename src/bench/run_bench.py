@@ -0,0 +1,220 @@
+"""
+离线吞吐压测：启动本地假 chat/completions 服务和确定性检索桩，
+在合成的 HotpotQA 格式数据上跑 exp_qwen.main，对不同的线程数 / 引擎 / maxRound 组合
+报告 entries/s、CPU 占用和各阶段延迟。不需要 GPU 和真实检索服务。
+
+    python bench/run_bench.py --entries 200 --threads 1,5,20 --async 0,64 --pipeline 0,64 --maxRounds 1,3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import urllib.request
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from bench import stub_retrieve  # noqa: E402
+
+# exp_qwen 通过 `from utils.retrieve import retrieve` 引入检索模块，这里换成确定性的桩
+_utils = types.ModuleType("utils")
+_utils.retrieve = stub_retrieve
+sys.modules.setdefault("utils", _utils)
+sys.modules["utils.retrieve"] = stub_retrieve
+
+import api.model_api as model_api_module  # noqa: E402
+import exp_qwen  # noqa: E402
+
+STAGES = ("retrieve", "evidence_extract", "strict_judge", "loose_judge", "final_answer")
+
+
+def make_dataset(path: str, n: int):
+    """合成的 HotpotQA 形状数据（含 distractor context 和 supporting_facts）。"""
+    data = []
+    for i in range(n):
+        data.append({
+            "_id": f"bench{i:06d}",
+            "question": f"Which city hosted event number {i} that was organised by person {i % 37}?",
+            "answer": "Paris" if i % 3 else "yes",
+            "type": "bridge" if i % 4 else "comparison",
+            "level": ["easy", "medium", "hard"][i % 3],
+            "supporting_facts": [[f"Title {i}", 0], [f"Title {i + 1}", 1]],
+            "context": [[f"Title {i + k}", [f"Sentence {j} of paragraph {k}." for j in range(4)]] for k in range(10)],
+        })
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock_server(port: int, args) -> subprocess.Popen:
+    cmd = [sys.executable, os.path.join(SRC_DIR, "bench", "mock_server.py"), "--port", str(port),
+           "--latency", args.latency, "--strictFullRate", str(args.strictFullRate), "--looseMean", str(args.looseMean),
+           "--ramble", str(args.ramble), "--tokenMs", str(args.tokenMs)]
+    for item in args.modelLatency:
+        cmd += ["--modelLatency", item]
+    # 一个 mock 服务充当配置中的所有模型，/v1/models 列出全部模型名，启动时的健康检查才能通过
+    with open(os.path.join(SRC_DIR, "config", "config.json")) as f:
+        cmd += ["--servedModels", ",".join(json.load(f)["models"])]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/models", timeout=0.5).read()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Mock server did not start")
+
+
+def reset_mock_servers(ports):
+    # mock 服务在所有配置之间共用，每次运行前清空模拟的 prefix cache，各配置的 prefix% 才能相互比较
+    for port in ports:
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/reset_prefix_cache", data=b"", method="POST")
+        urllib.request.urlopen(request, timeout=5).read()
+
+
+def write_config(path: str, ports):
+    # 多个 mock 服务时每个模型配置成一组副本
+    with open(os.path.join(SRC_DIR, "config", "config.json")) as f:
+        config = json.load(f)
+    urls = [f"http://127.0.0.1:{port}/v1" for port in ports]
+    config["models"] = {name: urls if len(urls) > 1 else urls[0] for name in config["models"]}
+    with open(path, 'w') as f:
+        json.dump(config, f)
+
+
+def run_once(args, workdir: str, config_path: str, threads: int, async_concurrency: int, max_round: int,
+             max_in_flight: int = 0) -> dict:
+    exp_qwen.INPUT_FILE = os.path.join(workdir, "data.json")
+    exp_qwen.BASE_OUTPUT_DIR = os.path.join(workdir, f"out_t{threads}_a{async_concurrency}_p{max_in_flight}_r{max_round}")
+    exp_qwen.PROCESSED_IDS_FILE = os.path.join(exp_qwen.BASE_OUTPUT_DIR, "processed_ids.txt")
+    trace_path = os.path.join(exp_qwen.BASE_OUTPUT_DIR, "trace.jsonl")
+    os.makedirs(exp_qwen.BASE_OUTPUT_DIR, exist_ok=True)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = exp_qwen.main(
+            args.defaultModel, "default", args.strictModel, "strict_test", args.looseModel, "loose_test",
+            args.looseScore, max_round, threads, stats_interval=0, async_concurrency=async_concurrency,
+            retrieval_batch_ms=args.retrievalBatchMs,
+            run_state_path=os.path.join(exp_qwen.BASE_OUTPUT_DIR, "run_state.sqlite"),
+            trace_path=trace_path, config_path=config_path, micro_batch=args.microBatch,
+            stream_judges=args.streamJudges, speculative_judges=args.speculativeJudges,
+            prompt_versions=dict(item.split("=", 1) for item in args.promptVersion),
+            pipeline=max_in_flight > 0, max_in_flight=max_in_flight or None,
+            stage_workers={name: int(workers) for name, workers in (item.split("=", 1) for item in args.stageWorkers)},
+        )
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    with open(trace_path + ".summary.json") as f:
+        summary = json.load(f)
+    stages, prompt_tokens, cached_tokens = {}, 0, 0
+    for label, s in summary.items():
+        if label.startswith(("llm_call/", "llm_batch/")):
+            prompt_tokens += s["prompt_tokens"]
+            cached_tokens += s.get("cached_tokens", 0)
+        stage = label.split("/")[0]
+        if stage in STAGES:
+            stages[stage] = {"p50_ms": s["p50_ms"], "p95_ms": s["p95_ms"], "count": s["count"]}
+    return {
+        "engine": (f"async({async_concurrency})" if async_concurrency else
+                   f"pipeline({max_in_flight})" if max_in_flight else f"threads({threads})"),
+        "max_round": max_round,
+        "entries": stats["completed"],
+        "failed": stats["failed"],
+        "wall_s": wall,
+        "entries_per_s": stats["completed"] / wall if wall else 0.0,
+        "cpu_s": cpu,
+        "cpu_util": cpu / wall if wall else 0.0,
+        "stages": stages,
+        "prefix_hit": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
+
+
+def format_rows(rows) -> str:
+    header = f"{'engine':<14} {'rounds':>6} {'entries/s':>10} {'cpu%':>7} {'failed':>6} {'prefix%':>8} " + \
+             " ".join(f"{stage[:12] + ' p50':>16}" for stage in STAGES)
+    lines = [header]
+    for r in rows:
+        stage_cols = " ".join(f"{r['stages'].get(stage, {}).get('p50_ms', 0.0):>16.1f}" for stage in STAGES)
+        lines.append(f"{r['engine']:<14} {r['max_round']:>6} {r['entries_per_s']:>10.2f} "
+                     f"{r['cpu_util'] * 100:>6.1f}% {r['failed']:>6} {r.get('prefix_hit', 0.0) * 100:>7.1f}% {stage_cols}")
+    return "\n".join(lines)
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the ESA-DGR pipeline.")
+    parser.add_argument("--entries", type=int, default=200, help="Synthetic dataset size")
+    parser.add_argument("--threads", type=int_list, default=[1, 5, 20], help="Comma-separated worker thread counts")
+    parser.add_argument("--async", dest="asyncConcurrency", type=int_list, default=[0],
+                        help="Comma-separated async concurrency levels (0 runs the thread engine)")
+    parser.add_argument("--pipeline", type=int_list, default=[0],
+                        help="Comma-separated max in-flight entries for the stage-pipelined engine (0 runs the thread engine)")
+    parser.add_argument("--stageWorkers", action="append", default=[], help="Pipeline stage workers, e.g. strict_judge=16")
+    parser.add_argument("--maxRounds", type=int_list, default=[1, 3], help="Comma-separated maxRound values")
+    parser.add_argument("--looseScore", type=float, default=0.8)
+    parser.add_argument("--defaultModel", type=str, default="qwen-7b")
+    parser.add_argument("--strictModel", type=str, default="strictqwen")
+    parser.add_argument("--looseModel", type=str, default="looseqwen")
+    parser.add_argument("--latency", type=str, default="lognormal:40:0.4", help="Mock model latency distribution (ms)")
+    parser.add_argument("--modelLatency", action="append", default=[], help="Per-model latency, e.g. strictqwen=fixed:15")
+    parser.add_argument("--strictFullRate", type=float, default=0.3)
+    parser.add_argument("--looseMean", type=float, default=0.6)
+    parser.add_argument("--retrievalLatencyMs", type=float, default=10.0, help="Stub retrieval latency")
+    parser.add_argument("--retrievalBatchMs", type=float, default=5.0, help="Retrieval batching window (0 disables)")
+    parser.add_argument("--microBatch", action="store_true", help="Batch prompts per model via /v1/completions")
+    parser.add_argument("--streamJudges", action="store_true", help="Stream judge calls and stop early")
+    parser.add_argument("--speculativeJudges", action="store_true", help="Send strict and loose judges concurrently")
+    parser.add_argument("--ramble", type=int, default=0, help="Extra words the mock appends to judge answers")
+    parser.add_argument("--tokenMs", type=float, default=0.0, help="Mock decode time per output token (ms)")
+    parser.add_argument("--replicas", type=int, default=1, help="Mock server replicas per model")
+    parser.add_argument("--promptVersion", action="append", default=[], help="Pin a prompt template, e.g. answer=v1")
+    parser.add_argument("--out", type=str, default=None, help="Write the raw results as JSON")
+    args = parser.parse_args()
+
+    stub_retrieve.STUB_LATENCY = args.retrievalLatencyMs / 1000
+    model_api_module.EXTERNAL_CONFIG_FILE = None
+
+    ports = [free_port() for _ in range(args.replicas)]
+    servers = [start_mock_server(port, args) for port in ports]
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            make_dataset(os.path.join(workdir, "data.json"), args.entries)
+            config_path = os.path.join(workdir, "config.json")
+            write_config(config_path, ports)
+            for max_round in args.maxRounds:
+                for async_concurrency in args.asyncConcurrency:
+                    for max_in_flight in ([0] if async_concurrency else args.pipeline):
+                        for threads in ([1] if async_concurrency or max_in_flight else args.threads):
+                            reset_mock_servers(ports)
+                            rows.append(run_once(args, workdir, config_path, threads, async_concurrency, max_round,
+                                                 max_in_flight))
+                            print(format_rows(rows[-1:]).splitlines()[-1], flush=True)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    print()
+    print(format_rows(rows))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(rows, f, indent=4)
@@ -0,0 +1,36 @@
+"""
+确定性的检索桩，接口与 utils.retrieve.retrieve 相同，结果只由 query 决定。
+延迟由 STUB_LATENCY 控制（秒），bench 会在运行前设置。
+"""
+import hashlib
+import time
+from typing import Dict, List
+
+STUB_LATENCY = 0.01
+
+
+def _hits(query: str, corpus_name: str, size: int) -> List[Dict]:
+    digest = hashlib.md5(f"{corpus_name}\0{query}".encode("utf-8")).hexdigest()
+    return [
+        {
+            "_id": f"{digest[:8]}-{i}",
+            "_score": round(10.0 / (i + 1), 3),
+            "_source": {
+                "title": f"Doc {digest[i % 32]}{i}",
+                "paragraph_text": f"Passage {i} retrieved for '{query[:60]}' ({digest[:6]}). "
+                                  f"It mentions entity {int(digest[i:i + 4], 16) % 997} and year {1900 + int(digest[i:i + 2], 16) % 120}.",
+            },
+        }
+        for i in range(size)
+    ]
+
+
+def retrieve(query: str, corpus_name: str, size: int = 10) -> List[Dict]:
+    time.sleep(STUB_LATENCY)
+    return _hits(query, corpus_name, size)
+
+
+def batch_retrieve(queries: List[str], corpus_name: str, size: int = 10) -> List[List[Dict]]:
+    # 批量请求的延迟与单条相同，模拟检索集群的 msearch
+    time.sleep(STUB_LATENCY)
+    return [_hits(query, corpus_name, size) for query in queries]
@@ -1,36 +1,61 @@
-import sys
-import ujson as json
+"""
+评估 exp_qwen.py 的输出（list JSON / JSONL / .jsonl.gz，或旧的 {id: answer} 字典文件）：
+
+    python eval/eval.py <prediction_file> [<gold_file>] [--sweep more_predictions ...] [--workers N]
+
+没有给出 gold_file 时使用结果条目中的 answer 字段作为标准答案。
+除总体 EM / F1 外，还按轮次数（round_logs）和问题类型（type）分组统计。
+"""
+import argparse
+import os
 import re
 import string
-from collections import Counter
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-def normalize_answer(s):
-    """规范化答案以便进行比较"""
-    def remove_articles(text):
-        return re.sub(r'\b(a|an|the)\b', ' ', text)
+import ujson as json
 
-    def white_space_fix(text):
-        return ' '.join(text.split())
+# 作为脚本运行（python eval/eval.py ...）时也能引入 src 下的模块
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
 
-    def remove_punc(text):
-        exclude = set(string.punctuation)
-        return ''.join(ch for ch in text if ch not in exclude)
+from storage.dataset import open_text  # noqa: E402
+from storage.result_writer import iter_results  # noqa: E402
 
-    def lower(text):
-        return text.lower()
+# 规范化用到的预编译模式：先小写、去标点，再去冠词、合并空白
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+_ARTICLES = re.compile(r'\b(a|an|the)\b')
+_SPECIAL = ('yes', 'no', 'noanswer')
 
-    return white_space_fix(remove_articles(remove_punc(lower(s))))
+# JSONL 按字节范围切分给各个进程时，每个进程大约处理的字节数下限
+MIN_RANGE_BYTES = 4 << 20
+# list JSON 等只能顺序读取的文件，每次发给进程的条目数
+CHUNK_ENTRIES = 2000
 
-def f1_score(prediction, ground_truth):
-    """计算 F1 分数"""
-    normalized_prediction = normalize_answer(prediction)
-    normalized_ground_truth = normalize_answer(ground_truth)
+METRICS = ('em', 'f1', 'prec', 'recall')
+
+
+def normalize_answer(s):
+    """规范化答案以便进行比较"""
+    return ' '.join(_ARTICLES.sub(' ', s.lower().translate(_PUNCTUATION)).split())
+
+
+def _as_text(answer) -> str:
+    # 检查 prediction 和 gold 是否为字典类型
+    if isinstance(answer, dict):
+        return " ".join(f"{k}: {v}" for k, v in answer.items())
+    return answer if isinstance(answer, str) else ("" if answer is None else str(answer))
 
+
+def _f1_normalized(normalized_prediction, normalized_ground_truth):
     ZERO_METRIC = (0, 0, 0)
 
-    if normalized_prediction in ['yes', 'no', 'noanswer'] and normalized_prediction != normalized_ground_truth:
+    if normalized_prediction in _SPECIAL and normalized_prediction != normalized_ground_truth:
         return ZERO_METRIC
-    if normalized_ground_truth in ['yes', 'no', 'noanswer'] and normalized_prediction != normalized_ground_truth:
+    if normalized_ground_truth in _SPECIAL and normalized_prediction != normalized_ground_truth:
         return ZERO_METRIC
 
     prediction_tokens = normalized_prediction.split()
@@ -44,66 +69,288 @@ def f1_score(prediction, ground_truth):
     f1 = (2 * precision * recall) / (precision + recall)
     return f1, precision, recall
 
+
+def f1_score(prediction, ground_truth):
+    """计算 F1 分数"""
+    return _f1_normalized(normalize_answer(prediction), normalize_answer(ground_truth))
+
+
 def exact_match_score(prediction, ground_truth):
     """计算精确匹配分数"""
     return (normalize_answer(prediction) == normalize_answer(ground_truth))
 
+
+def score_pair(prediction, gold) -> Tuple[float, float, float, float]:
+    """每个字符串只规范化一次，返回 (em, f1, prec, recall)。"""
+    normalized_prediction = normalize_answer(_as_text(prediction))
+    normalized_gold = normalize_answer(_as_text(gold))
+    f1, prec, recall = _f1_normalized(normalized_prediction, normalized_gold)
+    return float(normalized_prediction == normalized_gold), f1, prec, recall
+
+
 def update_answer(metrics, prediction, gold):
     """更新答案的评估指标"""
-    # 检查 prediction 和 gold 是否为字典类型
-    if isinstance(prediction, dict):
-        prediction = " ".join(f"{k}: {v}" for k, v in prediction.items())
-    if isinstance(gold, dict):
-        gold = " ".join(f"{k}: {v}" for k, v in gold.items())
-
-    em = exact_match_score(prediction, gold)
-    f1, prec, recall = f1_score(prediction, gold)
-    metrics['em'] += float(em)
+    em, f1, prec, recall = score_pair(prediction, gold)
+    metrics['em'] += em
     metrics['f1'] += f1
     metrics['prec'] += prec
     metrics['recall'] += recall
     return em, prec, recall
 
-def eval(prediction_file, gold_file):
-    """主评估函数"""
-    # 加载预测文件和真实值文件
-    with open(prediction_file, "r", encoding="utf-8") as f:
-        predictions = json.load(f)
-    with open(gold_file, "r", encoding="utf-8") as f:
-        gold_data = json.load(f)
-
-    # 初始化评估指标
-    metrics = {
-        'em': 0, 'f1': 0, 'prec': 0, 'recall': 0
-    }
 
-    # 遍历真实值文件进行评估
-    for gold_id, gold_answer in gold_data.items():
-        if gold_id not in predictions:
-            print(f'Warning: Missing prediction for ID {gold_id}')
+def load_gold(gold_file: Optional[str]) -> Tuple[Optional[Dict], Dict]:
+    """
+    读取标准答案：旧的 {id: answer} 字典，或带 _id / answer（以及 type）的数据集文件。
+    返回 (answers, types)；gold_file 为空时返回 (None, {})，使用结果条目自带的 answer。
+    """
+    if gold_file is None:
+        return None, {}
+    answers, types = {}, {}
+    for entry_id, entry in _iter_keyed(gold_file):
+        if isinstance(entry, dict) and "answer" in entry:
+            answers[entry_id] = entry["answer"]
+            if entry.get("type") is not None:
+                types[entry_id] = entry["type"]
+        else:
+            answers[entry_id] = entry
+    return answers, types
+
+
+def _iter_keyed(path: str) -> Iterator[Tuple[str, object]]:
+    # 字典文件（{id: answer}）整个读入；结果 / 数据集文件逐条读取
+    with open_text(path) as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        first_line = (head + f.readline()).strip() if head == '{' else None
+    if first_line is not None:
+        try:
+            keyed = "_id" not in json.loads(first_line)
+        except ValueError:
+            keyed = True
+        if keyed:
+            with open_text(path) as f:
+                yield from json.load(f).items()
+            return
+    for entry in iter_results(path):
+        yield entry["_id"], entry
+
+
+def score_entry(entry_id, entry, answers: Optional[Dict], types: Dict):
+    """把一条结果压缩成 (id, em, f1, prec, recall, rounds, type)；没有标准答案时返回 None。"""
+    if isinstance(entry, dict) and ("Answer_final" in entry or "_id" in entry):
+        prediction = entry.get("Answer_final", "")
+        gold = answers.get(entry_id) if answers is not None else entry.get("answer")
+        round_logs = entry.get("round_logs")
+        rounds = len(round_logs) if isinstance(round_logs, dict) else None
+        question_type = types.get(entry_id, entry.get("type"))
+    else:
+        prediction, rounds, question_type = entry, None, types.get(entry_id)
+        gold = answers.get(entry_id) if answers is not None else None
+    if gold is None:
+        return None
+    return (entry_id,) + score_pair(prediction, gold) + (rounds, question_type)
+
+
+# 进程池中的标准答案（initializer 设置，每个进程只传一次）
+_GOLD = (None, {})
+
+
+def _init_worker(gold):
+    global _GOLD
+    _GOLD = gold
+
+
+def _score_entries(entries: List[Tuple[str, object]]) -> List[Tuple]:
+    answers, types = _GOLD
+    return [row for row in (score_entry(entry_id, entry, answers, types) for entry_id, entry in entries) if row is not None]
+
+
+def _score_range(path: str, start: int, end: int) -> List[Tuple]:
+    # 处理起始位置落在 [start, end) 内的 JSONL 行
+    answers, types = _GOLD
+    rows = []
+    with open(path, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"Warning: skipping truncated line in {path}")
+                continue
+            row = score_entry(entry["_id"], entry, answers, types)
+            if row is not None:
+                rows.append(row)
+    return rows
+
+
+def _is_plain_jsonl(path: str) -> bool:
+    if path.endswith(".gz"):
+        return False
+    with open(path, 'rb') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head != b'{':
+            return False
+        try:
+            return "_id" in json.loads(head + f.readline())
+        except ValueError:
+            return False
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _score_rows(prediction_file: str, gold, workers: int) -> Iterator[Tuple]:
+    if workers <= 1:
+        answers, types = gold
+        for entry_id, entry in _iter_keyed(prediction_file):
+            row = score_entry(entry_id, entry, answers, types)
+            if row is not None:
+                yield row
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(gold,)) as pool:
+        if _is_plain_jsonl(prediction_file):
+            # JSONL：按字节范围切分，解析和打分都在子进程里完成
+            size = os.path.getsize(prediction_file)
+            step = max(MIN_RANGE_BYTES, -(-size // (workers * 4)))
+            starts = range(0, size, step)
+            for rows in pool.map(_score_range, [prediction_file] * len(starts), starts,
+                                 [min(size, s + step) for s in starts]):
+                yield from rows
+        else:
+            # 只能顺序读取：主进程解析，分块交给子进程打分；最多 2 * workers 块在途，内存有界
+            futures = deque()
+            for chunk in _chunks(_iter_keyed(prediction_file), CHUNK_ENTRIES):
+                if len(futures) >= 2 * workers:
+                    yield from futures.popleft().result()
+                futures.append(pool.submit(_score_entries, chunk))
+            while futures:
+                yield from futures.popleft().result()
+
+
+def _empty() -> Dict:
+    return {'em': 0.0, 'f1': 0.0, 'prec': 0.0, 'recall': 0.0, 'count': 0}
+
+
+def _add(metrics: Dict, row: Tuple):
+    for key, value in zip(METRICS, row[1:5]):
+        metrics[key] += value
+    metrics['count'] += 1
+
+
+def _average(metrics: Dict, denominator: int = None) -> Dict:
+    n = metrics['count'] if denominator is None else denominator
+    return dict({key: metrics[key] / n if n else 0.0 for key in METRICS}, count=metrics['count'])
+
+
+def evaluate(prediction_file: str, gold=None, workers: int = 1) -> Dict:
+    """
+    评估一个结果文件，返回 overall / by_rounds / by_type 三组平均指标以及 missing / duplicates 数。
+    gold 为 load_gold() 的返回值；给出标准答案文件时，缺失的预测按 0 分计入 overall（与原来的 eval 一致）。
+    """
+    answers, types = gold or (None, {})
+    overall, by_rounds, by_type = _empty(), {}, {}
+    seen, duplicates = set(), 0
+    for row in _score_rows(prediction_file, (answers, types), workers):
+        if row[0] in seen:
+            duplicates += 1
             continue
-        predicted_answer = predictions[gold_id]
-        update_answer(metrics, predicted_answer, gold_answer)
+        seen.add(row[0])
+        _add(overall, row)
+        if row[5] is not None:
+            _add(by_rounds.setdefault(row[5], _empty()), row)
+        if row[6] is not None:
+            _add(by_type.setdefault(row[6], _empty()), row)
+    missing = [gold_id for gold_id in answers if gold_id not in seen] if answers is not None else []
+    return {
+        "overall": _average(overall, len(answers) if answers is not None else None),
+        "by_rounds": {str(rounds): _average(m) for rounds, m in sorted(by_rounds.items())},
+        "by_type": {str(t): _average(m) for t, m in sorted(by_type.items())},
+        "missing": len(missing),
+        "missing_ids": missing,
+        "duplicates": duplicates,
+    }
 
-    # 计算平均值
-    num_samples = len(gold_data)
-    if num_samples == 0:
-        print("No data to evaluate!")
+
+def _evaluate_file(args):
+    prediction_file, gold = args
+    return prediction_file, evaluate(prediction_file, gold)
+
+
+def evaluate_many(prediction_files: List[str], gold=None, workers: int = 1) -> Iterator[Tuple[str, Dict]]:
+    """超参数扫描产生的大量结果文件：每个文件在一个进程里顺序评估，多个文件并行。"""
+    if workers <= 1 or len(prediction_files) == 1:
+        for prediction_file in prediction_files:
+            yield prediction_file, evaluate(prediction_file, gold, workers)
         return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_evaluate_file, [(path, gold) for path in prediction_files])
+
+
+def format_metrics(label: str, metrics: Dict) -> str:
+    return (f"{label:<24} n={metrics['count']:<6} em={metrics['em']:.4f} f1={metrics['f1']:.4f} "
+            f"prec={metrics['prec']:.4f} recall={metrics['recall']:.4f}")
+
 
-    for key in metrics.keys():
-        metrics[key] /= num_samples
+def eval(prediction_file, gold_file=None, workers: int = 1):
+    """主评估函数"""
+    result = evaluate(prediction_file, load_gold(gold_file), workers)
+    for gold_id in result["missing_ids"][:20]:
+        print(f'Warning: Missing prediction for ID {gold_id}')
+    if result["missing"] > 20:
+        print(f'Warning: {result["missing"] - 20} more predictions missing')
+    if result["overall"]["count"] == 0 and not result["missing"]:
+        print("No data to evaluate!")
+        return result
 
     # 输出评估结果
     print("Evaluation Metrics:")
-    print(json.dumps(metrics, indent=4, ensure_ascii=False))
+    print(json.dumps({key: result["overall"][key] for key in METRICS}, indent=4, ensure_ascii=False))
+    for rounds, metrics in result["by_rounds"].items():
+        print(format_metrics(f"rounds={rounds}", metrics))
+    for question_type, metrics in result["by_type"].items():
+        print(format_metrics(f"type={question_type}", metrics))
+    return result
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python eval.py <prediction_file> <gold_file>")
-        sys.exit(1)
 
-    prediction_file = sys.argv[1]
-    gold_file = sys.argv[2]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute EM / F1 for exp_qwen.py outputs.")
+    parser.add_argument("prediction_file", help="Results (.json list / .jsonl / .jsonl.gz) or an {id: answer} dict")
+    parser.add_argument("gold_file", nargs="?", default=None,
+                        help="{id: answer} dict or the input dataset (default: the 'answer' field of each result)")
+    parser.add_argument("--sweep", nargs="+", default=[],
+                        help="More prediction files scored against the same gold, one summary line each")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scoring processes")
+    parser.add_argument("--json", type=str, default=None, help="Write all metrics to this JSON file")
+    args = parser.parse_args()
 
-    eval(prediction_file, gold_file)
\ No newline at end of file
+    if not args.sweep:
+        results = {args.prediction_file: eval(args.prediction_file, args.gold_file, args.workers)}
+    else:
+        results = {}
+        for path, result in evaluate_many([args.prediction_file] + args.sweep, load_gold(args.gold_file), args.workers):
+            results[path] = result
+            print(format_metrics(os.path.basename(path), result["overall"]) +
+                  f" missing={result['missing']} duplicates={result['duplicates']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({path: dict(result, missing_ids=result["missing_ids"][:1000])
+                                for path, result in results.items()}, indent=4, ensure_ascii=False))
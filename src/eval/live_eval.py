@@ -0,0 +1,186 @@
+"""
+边跑边评估：跟随 exp_qwen.py 正在写入的 JSONL 结果文件，只对新写入的条目打分，
+持续输出 EM / F1 / precision / recall 的均值和置信区间，并在指标已经收敛
+或明显低于基线时给出提前停止的信号（可选地向 run 进程发送 SIGINT，让它排空在途条目后退出）。
+
+    python eval/live_eval.py out/qwen-7b_20250101.jsonl [gold_file] --baseline 0.52 --pid 12345
+"""
+import argparse
+import math
+import os
+import signal
+import sys
+import time
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+# 作为脚本运行（python eval/live_eval.py ...）时也能引入 src 下的模块；
+# 脚本目录里的 eval.py 会遮住 eval 包，所以用 src 替换掉脚本目录
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if sys.path and os.path.abspath(sys.path[0]) == os.path.dirname(os.path.abspath(__file__)):
+    sys.path[0] = SRC_DIR
+elif SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from eval.eval import METRICS, evaluate, load_gold, score_entry  # noqa: E402
+from storage.result_writer import ResultTailer  # noqa: E402
+
+# 提前停止判断的参数
+DEFAULT_STOP_OPTIONS = {
+    "metric": "f1",           # 用于判断的指标
+    "confidence": 0.95,       # 置信区间的置信度
+    "min_entries": 200,       # 至少评估这么多条之后才给出停止信号
+    "tolerance": 0.01,        # 置信区间半宽小于该值视为已收敛
+    "baseline": None,         # 置信区间上界低于基线（减去 margin）时视为明显更差
+    "margin": 0.0,
+}
+
+
+class RunningMetrics:
+    """增量累计每个指标的均值和方差（Welford），给出置信区间；EM 是 0/1 指标，用 Wilson 区间。"""
+
+    def __init__(self, confidence: float = 0.95):
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.count = 0
+        self._mean = {key: 0.0 for key in METRICS}
+        self._m2 = {key: 0.0 for key in METRICS}
+
+    def add(self, values: Tuple[float, ...]):
+        self.count += 1
+        for key, value in zip(METRICS, values):
+            delta = value - self._mean[key]
+            self._mean[key] += delta / self.count
+            self._m2[key] += delta * (value - self._mean[key])
+
+    def mean(self, key: str) -> float:
+        return self._mean[key]
+
+    def interval(self, key: str) -> Tuple[float, float]:
+        n, mean = self.count, self._mean[key]
+        if n < 2:
+            return 0.0, 1.0
+        if key == "em":
+            z2 = self.z * self.z
+            center = (mean + z2 / (2 * n)) / (1 + z2 / n)
+            half = self.z * math.sqrt(mean * (1 - mean) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+            return max(0.0, center - half), min(1.0, center + half)
+        half = self.z * math.sqrt(self._m2[key] / (n - 1) / n)
+        return max(0.0, mean - half), min(1.0, mean + half)
+
+    def summary(self) -> Dict:
+        return {key: {"mean": self.mean(key), "ci": self.interval(key)} for key in METRICS}
+
+
+def stop_reason(metrics: RunningMetrics, options: Dict) -> Optional[str]:
+    """满足提前停止条件时返回原因，否则返回 None。"""
+    if metrics.count < options["min_entries"]:
+        return None
+    key = options["metric"]
+    low, high = metrics.interval(key)
+    if options["baseline"] is not None and high < options["baseline"] - options["margin"]:
+        return f"{key} upper bound {high:.4f} is below the baseline {options['baseline']:.4f}"
+    if (high - low) / 2 < options["tolerance"]:
+        return f"{key} converged at {metrics.mean(key):.4f} ± {(high - low) / 2:.4f}"
+    return None
+
+
+def format_live(metrics: RunningMetrics, missing_gold: int) -> str:
+    parts = [f"n={metrics.count}"]
+    for key in METRICS:
+        low, high = metrics.interval(key)
+        parts.append(f"{key}={metrics.mean(key):.4f} [{low:.4f}, {high:.4f}]")
+    if missing_gold:
+        parts.append(f"no_gold={missing_gold}")
+    return "[live-eval] " + " ".join(parts)
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def follow(output_file: str, gold=None, options: Dict = None, interval: float = 10.0, pid: int = None,
+           once: bool = False, exit_on_stop: bool = False) -> Tuple[RunningMetrics, Optional[str]]:
+    """
+    跟随 output_file 直到：once（只读当前内容）、pid 对应的 run 进程退出、exit_on_stop 且出现停止信号，或 Ctrl-C。
+    返回累计指标和停止原因（没有触发时为 None）。
+    """
+    options = dict(DEFAULT_STOP_OPTIONS, **(options or {}))
+    answers, types = gold or (None, {})
+    tailer = ResultTailer(output_file)
+    metrics = RunningMetrics(options["confidence"])
+    seen, missing_gold, reason = set(), 0, None
+    try:
+        while True:
+            new_entries = tailer.poll()
+            for entry in new_entries:
+                entry_id = entry.get("_id")
+                if entry_id is None or entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                row = score_entry(entry_id, entry, answers, types)
+                if row is None:
+                    missing_gold += 1
+                    continue
+                metrics.add(row[1:5])
+            if new_entries:
+                print(format_live(metrics, missing_gold), flush=True)
+                if reason is None:
+                    reason = stop_reason(metrics, options)
+                    if reason is not None:
+                        print(f"[live-eval] STOP: {reason}", flush=True)
+                        if pid is not None:
+                            # exp_qwen.py 收到 SIGINT 后停止派发新条目，等在途条目完成后正常收尾
+                            os.kill(pid, signal.SIGINT)
+                            print(f"[live-eval] Sent SIGINT to run process {pid}.", flush=True)
+                        if exit_on_stop:
+                            break
+            if once or (pid is not None and not process_alive(pid)):
+                if not once:
+                    # run 已经结束，读完最后写入的条目
+                    pid, once = None, True
+                    continue
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return metrics, reason
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow an in-progress exp_qwen.py JSONL output and score new entries.")
+    parser.add_argument("output_file", help="JSONL result file being written (.jsonl / .jsonl.gz)")
+    parser.add_argument("gold_file", nargs="?", default=None,
+                        help="{id: answer} dict or the input dataset (default: the 'answer' field of each result)")
+    parser.add_argument("--metric", type=str, default="f1", choices=METRICS, help="Metric used for the stop decision")
+    parser.add_argument("--baseline", type=float, default=None, help="Baseline value of --metric")
+    parser.add_argument("--baselineFile", type=str, default=None,
+                        help="Finished results of the baseline configuration; its --metric is used as the baseline")
+    parser.add_argument("--margin", type=float, default=0.0, help="Signal stop only when below baseline - margin")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Converged once the CI half-width is below this")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--minEntries", type=int, default=200, help="Entries required before any stop signal")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls of the output file")
+    parser.add_argument("--pid", type=int, default=None,
+                        help="PID of the running exp_qwen.py: SIGINT it on a stop signal, exit when it finishes")
+    parser.add_argument("--once", action="store_true", help="Score the current contents of the file and exit")
+    parser.add_argument("--exitOnStop", action="store_true", help="Exit as soon as a stop signal fires")
+    args = parser.parse_args()
+
+    gold = load_gold(args.gold_file)
+    baseline = args.baseline
+    if args.baselineFile:
+        baseline = evaluate(args.baselineFile, gold)["overall"][args.metric]
+        print(f"[live-eval] Baseline {args.metric}={baseline:.4f} from {args.baselineFile}")
+    metrics, reason = follow(args.output_file, gold, {
+        "metric": args.metric, "confidence": args.confidence, "min_entries": args.minEntries,
+        "tolerance": args.tolerance, "baseline": baseline, "margin": args.margin,
+    }, interval=args.interval, pid=args.pid, once=args.once, exit_on_stop=args.exitOnStop)
+    print(format_live(metrics, 0))
+    # 退出码 2 表示建议提前停止，方便调度脚本据此终止 run
+    sys.exit(2 if reason is not None else 0)
@@ -1,157 +1,233 @@
+import asyncio
 import json
 import threading
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict
 
 import sys
 sys.path.append("/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/src")
+import utils.retrieve as retrieve_module
 from utils.retrieve import retrieve  # 引入检索模块
-from api.model_api import ModelAPI  # 引入模型调用模块
+from api.model_api import ModelAPI, CONFIG_FILE, load_prompt_templates  # 引入模型调用模块；配置文件默认在包内的 config/ 目录
+from api.health import health_options  # 启动时的端点健康检查
+from api.profiles import complete_json  # 从判分回答中取出第一个完整的 JSON 对象
+from api.async_model_api import AsyncModelAPI  # 异步模型调用
+from api.response_cache import ResponseCache  # LLM 响应缓存
+from retrieval.cached_retrieve import CachedRetriever  # 检索缓存与批量合并
+from retrieval.reference import ReferenceAssembler, reference_options  # 参考信息去重与 token 预算
+from runner.steps import Retrieve, Generate, Checkpoint, Spawn, Await, Cancel, drive, adrive  # 轮次逻辑的步骤与驱动
+from runner.async_runner import AsyncEntryRunner  # asyncio 执行引擎
+from runner.pipeline import PipelineRunner, pipeline_options  # 按阶段流水线的执行引擎
+from runner.scheduler import WorkerPool, StatsReporter, install_sigint_handler, format_stats  # worker 池调度
+from storage.result_writer import ResultWriter, SweepWriter, create_writer, iter_results, output_options, output_suffix, project_entry, SWEEP_FIELD, WRITERS  # 结果写入器
+from storage.dataset import iter_entries  # 流式读取数据集
+from storage.shards import check_shard, in_shard, shard_path, shard_tag  # 多进程 / 多节点分片
+from storage.run_store import RunStore  # 断点状态库
+from telemetry.tracer import Tracer, set_tracer, span, format_summary  # 分阶段耗时 / token 统计
 
 # 全局变量定义
 INPUT_FILE = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/baseExp/evidence_SLModel_v0/data/hotpot_dev_distractor_v1_2k.json"
 BASE_OUTPUT_DIR = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/baseExp/evidence_SLModel_v0/output/ESLModel"
 LOCK = threading.Lock()  # 线程锁
-PROCESSED_IDS_FILE = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/baseExp/evidence_SLModel_v0/output/ESLModel/qwen_dev_processed_ids.txt"  # 断点记录文件
+RETRIEVER = None  # 带缓存的检索层，main() 中初始化；为 None 时直接调用 retrieve
+REFERENCE = ReferenceAssembler()  # 参考信息组装（去重 + 每个模型的 token 预算），main() 中按 config.json 重建
+JUDGE_EXECUTOR = None  # 投机判分模式下并行发出 looseModel 调用的线程池
+SPECULATION_STATS = {"launched": 0, "wasted": 0, "cancelled": 0}  # 投机判分的 loose 调用统计
+PROCESSED_IDS_FILE = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/baseExp/evidence_SLModel_v0/output/ESLModel/qwen_dev_processed_ids.txt"  # 旧版断点记录文件，启动时导入 RUN_STATE_FILE
+RUN_STATE_FILE = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/baseExp/evidence_SLModel_v0/output/ESLModel/qwen_dev_run_state.sqlite"  # 断点记录（每轮状态 + 完成标记）
+RUN_STORE = None  # RunStore 实例，main() 中初始化
+processed_ids = set()  # 已完成的条目 id，main() 中从 RUN_STORE 读取
+PROMPTS = load_prompt_templates()  # prompt 模板注册表，import 时按默认 config.json 的版本加载；main() 中换成 ModelAPI 按 --config / --promptVersion 选定的版本
+OUTPUT_FIELDS = None  # 结果中保留的输入字段（除 _id / 答案外），None 保留整条输入；main() 中按 config.json / --fields 设置
 
-# 加载已处理的ID列表
-def load_processed_ids() -> set:
-    if os.path.exists(PROCESSED_IDS_FILE):
-        with open(PROCESSED_IDS_FILE, 'r') as f:
-            return set(line.strip() for line in f)
-    return set()
+# 把已完成但还没写进输出文件的结果补写进去（上次 run 在结果 fsync 之前崩溃）
+# sweep 模式下 output_files 是各配置的输出文件，条目在所有文件中都出现才算已写入
+def recover_exports(run_store: RunStore, writer: ResultWriter, output_files: List[str]):
+    pending = list(run_store.pending_exports())
+    if not pending:
+        return
+    written = None
+    for output_file in output_files:
+        ids = {entry["_id"] for entry in iter_results(output_file)} if os.path.exists(output_file) else set()
+        written = ids if written is None else written & ids
+    for entry in pending:
+        entry_id = entry["_id"]
+        if entry_id in written:
+            run_store.mark_exported(entry_id)
+        else:
+            writer.write(entry, on_commit=lambda entry_id=entry_id: run_store.mark_exported(entry_id))
+    print(f"Recovered {len(pending)} completed entries missing from the output file.")
 
-# 保存已处理的ID
-def save_processed_id(entry_id: str):
-    with LOCK:
-        with open(PROCESSED_IDS_FILE, 'a') as f:
-            f.write(f"{entry_id}\n")
-
-# 生成参考信息
-def generate_reference(retrieved_results: List[Dict]) -> str:
-    """
-    从检索结果中提取 paragraph_text 字段并拼接成参考信息。
-    """
-    return "\n".join([hit["_source"]["paragraph_text"] for hit in retrieved_results])
-
-# 更新并保存数据到文件
-def save_entry(entry: Dict, output_file: str):
+# 记录投机判分统计；cancelled 表示被放弃的 loose 调用在完成前就被取消
+def count_speculation(key: str, cancelled: bool = False):
     with LOCK:
-        # 读取现有数据
-        if os.path.exists(output_file):
-            with open(output_file, 'r') as f:
-                data = json.load(f)
-        else:
-            data = []
-        
-        # 更新数据
-        data.append(entry)
-        
-        # 写回文件
-        with open(output_file, 'w') as f:
-            json.dump(data, f, indent=4)
+        SPECULATION_STATS[key] += 1
+        if cancelled:
+            SPECULATION_STATS["cancelled"] += 1
+
+# 先在断点库里原子地记录结果和完成标记，再提交到写入器；结果落盘之后标记为已导出
+# sweep 模式下 entry 为 {"_id": ..., SWEEP_FIELD: {配置: entry}}，由 SweepWriter 分发到各配置的输出文件
+def save_entry(entry: Dict, writer: ResultWriter):
+    entry_id = entry["_id"]
+    entry = project_entry(entry, OUTPUT_FIELDS)
+    if RUN_STORE is None:
+        writer.write(entry)
+        return
+    RUN_STORE.complete(entry_id, entry)
+    writer.write(entry, on_commit=lambda: RUN_STORE.mark_exported(entry_id))
 
 # 生成 evidence prompt
 def generate_evidence_prompt(question: str, reference: str) -> str:
     return json.dumps({"question": question, "evidence": reference})
 
-# 提取 strictModel 的 score 和 missing_evidence
+# 提取 strictModel 的 score 和 missing_evidence；回答前面有多余的文字时取其中第一个 JSON 对象
 def parse_strict_response(response: str) -> (int, str):
     try:
-        parsed_response = json.loads(response)
+        parsed_response = json.loads(complete_json(response) or response)
         score = parsed_response.get("score", 0)
-        missing_evidence = parsed_response.get("missing_evidence", "")
-        return score, missing_evidence
-    except json.JSONDecodeError:
+        missing_evidence = parsed_response.get("missing_evidence") or ""
+        return score, str(missing_evidence)
+    except (json.JSONDecodeError, AttributeError):
         print("Error parsing strictModel response.")
         return 0, ""
 
-# 提取 looseModel 的 looseScore
+# 提取 looseModel 的 looseScore；回答前面有多余的文字时取其中第一个数字
 def parse_loose_response(response: str) -> float:
+    match = re.search(r"\d*\.?\d+", response)
     try:
-        return float(response.strip())
+        return float(match.group(0) if match else response.strip())
     except ValueError:
         print("Error parsing looseModel response.")
         return 0.0
 
-# 生成 prompt
+# 生成作答 prompt（prompts/templates.json 的 answer 模板：固定指令在前，问题和参考信息在后）
 def generate_prompt(question: str, reference: str) -> str:
-    return f"""
-    Based on the following reference information, answer the question in JSON format with "process" and "final answer" fields:
-    
-    Reference: {reference}
-    Question: {question}
-
-    for the final answer,you should follow these two things：
-    
-    1. If the question is of a yes/no type (e.g., "am", "is", "are"), only answer "yes" or "no".
-    2. If the question is about "who", "where", "when", "what", etc., answer with only the relevant information (e.g., name, location, date, etc.), avoiding full sentences.
-    
-    For example: 
-    The output should be concise and without explanation. Only return the most relevant keywords or key information, formatted as a phrase or value. For example:
-    - If the question is "Who is the president of the USA?" and the sub-answer mentions "Joe Biden" or "current president", answer only "Joe Biden" or "President Biden".
-    - If the question is "Is it raining?" and the sub-answer suggests yes or no, answer "yes" or "no".
-    
-    Output format:
-    {{
-        "process": "<your reasoning process here>",
-        "final answer": "<your final answer here>"
-    }}
-    """
+    return PROMPTS.render("answer", question=question, reference=reference)
 
+# 生成证据提炼 prompt（evidence_extract 模板）
 def getEvidencePrompt(current_reference_raw: str, question: str) -> str:
-    return f"""
-        "Extract the current evidence from the provided reference text, ensuring it is concise, relevant, and strictly limited to information directly related to the question. "
-        "The output should be a short paragraph of 3-5 sentences, presenting only the key details in a single block without bullet points. "
-        "Remain faithful to the original text and avoid adding any interpretations or additional information."
-    
-    Question: {question}
-    current_reference: {current_reference_raw}
-    """
+    return PROMPTS.render("evidence_extract", question=question, reference=current_reference_raw)
 
-# 单条数据处理逻辑
-def process_entry(entry: Dict, model_api: ModelAPI, default_model: str, default_role: str,
-                  strict_model: str, strict_role: str, loose_model: str, loose_role: str,
-                  loose_score_threshold: float, max_round: int, output_file: str):
+# sweep 中一个配置 (looseScore, maxRound) 的名字，也用在输出文件名里
+def sweep_key(loose_score_threshold: float, max_round: int) -> str:
+    return f"ls{loose_score_threshold:g}_mr{max_round}"
+
+# 单条数据的轮次逻辑（生成器）：检索和模型调用以步骤的形式 yield 出去，由驱动方执行
+# sweep 为一组 (looseScore, maxRound) 时，轮次只跑一遍（到最大的 maxRound / looseScore 为止），
+# 在每个配置本该停下的位置记录一份快照，最后只对每个不同的停止点调用一次 defaultModel 作答，
+# 返回 {sweep_key: entry}；否则与单个配置的原有流程相同，返回 entry。
+def entry_rounds(entry: Dict, default_model: str, default_role: str,
+                 strict_model: str, strict_role: str, loose_model: str, loose_role: str,
+                 loose_score_threshold: float, max_round: int, speculative_judges: bool = False,
+                 state: Dict = None, sweep: List = None):
     entry_id = entry["_id"]
+    configs = {sweep_key(t, m): (t, m) for t, m in (sweep or [(loose_score_threshold, max_round)])}
     
-    # 检查是否已处理
-    if entry_id in processed_ids:
-        print(f"Skipping already processed entry: {entry_id}")
-        return
-    
-    # 初始化变量
-    round_num = 1
+    # 初始化变量；state 是上次 run 的断点，从最后完成的一轮之后继续
+    state = state or {}
+    round_num = state.get("round_num", 1)
     question = entry["question"]
-    cumulative_reference = ""  # 累积的 reference
-    round_logs = {}  # 记录每一轮的日志信息
+    cumulative_reference = state.get("cumulative_reference", "")  # 累积的 reference
+    evidence_rounds = state.get("evidence_rounds", [cumulative_reference.lstrip("\n")] if cumulative_reference else [])  # 去重后的逐轮证据
+    raw_evidence_rounds = state.get("raw_evidence_rounds", list(evidence_rounds))  # 未去重的逐轮证据，只用于统计
+    seen_passages = state.get("seen_passages", [])  # 之前各轮已用过的检索段落指纹
+    reference_stats = state.get("reference_stats", {})  # 原样拼接 / 实际送出的参考信息 token 数
+    missing_evidence = state.get("missing_evidence", "")
+    round_logs = state.get("round_logs", {})  # 记录每一轮的日志信息
+    rounds_done = state.get("rounds_done", False)  # 轮次循环已结束，只差 defaultModel 作答
+    snapshots = state.get("snapshots", [])  # 各停止点的状态（作答用的参考信息、轮次日志）
+    stops = state.get("stops", {})  # 配置 -> 停止点在 snapshots 中的下标
+    
+    # 还没停下的配置在当前位置停下，共用一份快照
+    def stop(keys, answer_round):
+        keys = [key for key in keys if key not in stops]
+        if not keys:
+            return
+        snapshots.append({
+            "round_num": answer_round,
+            "cumulative_reference": cumulative_reference,
+            "evidence_rounds": list(evidence_rounds),
+            "raw_evidence_rounds": list(raw_evidence_rounds),
+            "reference_stats": dict(reference_stats),
+            "round_logs": dict(round_logs),
+        })
+        for key in keys:
+            stops[key] = len(snapshots) - 1
+    
+    def checkpoint(**extra):
+        return Checkpoint(entry_id, dict({
+            "round_num": round_num,
+            "cumulative_reference": cumulative_reference,
+            "evidence_rounds": evidence_rounds,
+            "raw_evidence_rounds": raw_evidence_rounds,
+            "seen_passages": seen_passages,
+            "reference_stats": reference_stats,
+            "missing_evidence": missing_evidence,
+            "round_logs": round_logs,
+            "snapshots": snapshots,
+            "stops": stops,
+        }, **extra))
 
-    while round_num <= max_round:
+    while not rounds_done:
+        # 超过 maxRound 的配置停下（原来的循环条件 round_num <= max_round）
+        stop([key for key, (_, m) in configs.items() if round_num > m], round_num)
+        if len(stops) == len(configs):
+            break
+        
+        # strictModel 没有给出 missing_evidence（回答被截断、解析失败等）时没有可以补充检索的内容，不用空查询检索
+        if round_num > 1 and not missing_evidence.strip():
+            print(f"No missing evidence for entry {entry_id} after round {round_num - 1}, skipping further retrieval.")
+            stop(configs, round_num)
+            break
+        
         # 检索相关段落
-        retrieved_results = retrieve(query=question if round_num == 1 else missing_evidence, corpus_name="hotpotqa", size=10)
-        current_reference_raw = generate_reference(retrieved_results)
+        retrieved_results = yield Retrieve(query=question if round_num == 1 else missing_evidence, corpus_name="hotpotqa", size=10, round_num=round_num)
+        current_reference_raw = REFERENCE.select_hits(retrieved_results, seen_passages, default_model, reference_stats)
 
 
         # 注意⚠️！这里加入Evidence Extract 函数，把得到的current_reference_raw经过一层model提炼出来
-        EvidencePrompt = getEvidencePrompt(current_reference_raw,question)
-        current_reference = model_api.get_response(default_model, default_role, EvidencePrompt)
-        cumulative_reference += "\n" + current_reference  # 拼接累积的 reference
+        if current_reference_raw:
+            EvidencePrompt = getEvidencePrompt(current_reference_raw,question)
+            current_reference = yield Generate(default_model, default_role, EvidencePrompt, "evidence_extract", round_num)
+            REFERENCE.add_round(evidence_rounds, current_reference)  # 去掉与之前各轮重复的句子
+            raw_evidence_rounds.append(current_reference)
+            cumulative_reference = "".join("\n" + evidence for evidence in evidence_rounds)  # 拼接累积的 reference
+        else:
+            # 检索结果都与之前各轮重复：不对空参考信息调用提炼模型，沿用已有的证据
+            current_reference = ""
+            print(f"No new passages for entry {entry_id} in round {round_num}, skipping evidence extraction.")
         
-        # 构造 evidence prompt
-        evidence_prompt = generate_evidence_prompt(question, cumulative_reference)
+        # 构造 evidence prompt（按判分模型的 token 预算截断）
+        judge_reference = REFERENCE.assemble(evidence_rounds, [strict_model, loose_model],
+                                             question + " " + missing_evidence, reference_stats, raw_evidence_rounds)
+        evidence_prompt = generate_evidence_prompt(question, judge_reference)
+        
+        # 投机模式：looseModel 与 strictModel 同时发出，strict_score 为 1 时放弃 loose 的结果
+        loose_call = None
+        if speculative_judges:
+            loose_call = yield Spawn(Generate(loose_model, loose_role, evidence_prompt, "loose_judge", round_num))
+            count_speculation("launched")
         
         # 调用 strictModel
         try:
-            strict_response = model_api.get_response(strict_model, strict_role, evidence_prompt)
+            strict_response = yield Generate(strict_model, strict_role, evidence_prompt, "strict_judge", round_num)
             strict_score, missing_evidence = parse_strict_response(strict_response)
         except Exception as e:
             print(f"Error calling strictModel for entry {entry_id}: {e}")
+            if loose_call is not None:
+                count_speculation("wasted", (yield Cancel(loose_call)))
+            stop(configs, round_num)
             break
 
         # 判断 strict_score 是否为 1
         if strict_score == 1:
             # 如果 strict_score 为 1，跳过 looseModel，直接进入 defaultModel 处理
+            if loose_call is not None:
+                count_speculation("wasted", (yield Cancel(loose_call)))
                     # 记录当前轮次的日志
             round_logs[f"round_{round_num}"] = {
                 "strict_score": strict_score,
@@ -159,14 +235,19 @@ def process_entry(entry: Dict, model_api: ModelAPI, default_model: str, default_
                 "current_reference": current_reference
             }
             print(f"Strict score is 1 for entry {entry_id}, skipping looseModel.")
+            stop(configs, round_num)
             break
         # 调用 looseModel
 
         try:
-            loose_response = model_api.get_response(loose_model, loose_role, evidence_prompt)
+            if loose_call is not None:
+                loose_response = yield Await(loose_call)
+            else:
+                loose_response = yield Generate(loose_model, loose_role, evidence_prompt, "loose_judge", round_num)
             loose_score = parse_loose_response(loose_response)
         except Exception as e:
             print(f"Error calling looseModel for entry {entry_id}: {e}")
+            stop(configs, round_num)
             break
         
         # 记录当前轮次的日志
@@ -178,69 +259,405 @@ def process_entry(entry: Dict, model_api: ModelAPI, default_model: str, default_
         }
         
         # 判断退出条件
-        if loose_score >= loose_score_threshold:
+        stop([key for key, (t, _) in configs.items() if loose_score >= t], round_num)
+        if len(stops) == len(configs):
             break
         else:
             round_num += 1
+            yield checkpoint()
     
-    # 调用 defaultModel
-    try:
-        prompt = generate_prompt(question, cumulative_reference)  # 使用累积的 reference
-        answer = model_api.get_response(default_model, default_role, prompt)
-        parsed_answer = json.loads(answer)
-        entry['Answer_process'] = parsed_answer.get('process', '')
-        entry['Answer_final'] = parsed_answer.get('final answer', '')
-    except Exception as e:
-        print(f"Error calling defaultModel for entry {entry_id}: {e}")
-        entry['Answer_process'] = "Error generating answer"
-        entry['Answer_final'] = ""
+    # 轮次结束，记录断点后再调用 defaultModel
+    stop(configs, round_num)  # 旧断点（没有快照）恢复时，所有配置停在当前位置
+    if not rounds_done:
+        yield checkpoint(rounds_done=True)
     
-    # 保存结果
-    entry['retrieved_passages'] = cumulative_reference.strip()  # 去掉多余的换行符
-    entry['round_logs'] = round_logs  # 添加轮次日志信息
-    save_entry(entry, output_file)
-    save_processed_id(entry_id)
+    # 调用 defaultModel：每个停止点作答一次；有多个停止点时并发发出
+    calls = []
+    for snapshot in snapshots:
+        answer_reference = REFERENCE.assemble(snapshot["evidence_rounds"], [default_model], question,
+                                              snapshot["reference_stats"], snapshot["raw_evidence_rounds"])
+        prompt = generate_prompt(question, answer_reference)  # 使用累积的 reference（按 defaultModel 的预算截断）
+        step = Generate(default_model, default_role, prompt, "final_answer", snapshot["round_num"])
+        calls.append((yield Spawn(step)) if len(snapshots) > 1 else step)
+    answers = []
+    for call in calls:
+        try:
+            answer = yield (Await(call) if len(snapshots) > 1 else call)
+            parsed_answer = json.loads(answer)
+            answers.append((parsed_answer.get('process', ''), parsed_answer.get('final answer', '')))
+        except Exception as e:
+            print(f"Error calling defaultModel for entry {entry_id}: {e}")
+            answers.append(("Error generating answer", ""))
+    
+    results = {}
+    for key in configs:
+        snapshot = snapshots[stops[key]]
+        reference_stats = snapshot["reference_stats"]
+        result = dict(entry) if sweep else entry
+        result['Answer_process'], result['Answer_final'] = answers[stops[key]]
+        result['retrieved_passages'] = snapshot["cumulative_reference"].strip()  # 去掉多余的换行符
+        result['round_logs'] = snapshot["round_logs"]  # 添加轮次日志信息
+        result['prompt_versions'] = PROMPTS.versions()  # 使用的模板版本，便于复现
+        result['reference_tokens'] = dict(reference_stats, saved=reference_stats.get("tokens_in", 0) - reference_stats.get("tokens_out", 0))
+        results[key] = result
+    return results if sweep else entry
+
+# 同步执行一个步骤
+def execute_step(step, model_api: ModelAPI):
+    if isinstance(step, Checkpoint):
+        if RUN_STORE is not None:
+            RUN_STORE.save_round(step.entry_id, step.state)
+        return None
+    if isinstance(step, Retrieve):
+        with span(step.stage, stage=step.stage, round=step.round_num):
+            if RETRIEVER is not None:
+                return RETRIEVER.retrieve(query=step.query, corpus_name=step.corpus_name, size=step.size)
+            return retrieve(query=step.query, corpus_name=step.corpus_name, size=step.size)
+    with span(step.stage, stage=step.stage, round=step.round_num, model=step.model):
+        return model_api.get_response(step.model, step.role, step.prompt)
+
+# 异步执行一个步骤；检索模块是同步的，放到线程池里执行
+async def aexecute_step(step, amodel_api: AsyncModelAPI):
+    if isinstance(step, Checkpoint):
+        # 断点库是本地 SQLite，直接在事件循环里写
+        return execute_step(step, amodel_api.model_api)
+    if isinstance(step, Retrieve):
+        with span(step.stage, stage=step.stage, round=step.round_num):
+            if RETRIEVER is not None and RETRIEVER.batch_fn is not None:
+                # 批量检索由 batcher 线程完成，这里只需等待结果，不占用线程池
+                return await asyncio.wrap_future(RETRIEVER.submit(step.query, step.corpus_name, step.size))
+            search = RETRIEVER.retrieve if RETRIEVER is not None else retrieve
+            return await asyncio.to_thread(search, query=step.query, corpus_name=step.corpus_name, size=step.size)
+    with span(step.stage, stage=step.stage, round=step.round_num, model=step.model):
+        return await amodel_api.aget_response(step.model, step.role, step.prompt)
+
+# 读取条目的轮次断点
+def load_entry_state(entry_id: str):
+    state = RUN_STORE.load_state(entry_id) if RUN_STORE is not None else None
+    if state:
+        print(f"Resuming entry {entry_id} at round {state['round_num']}.")
+    return state
+
+# 单条数据处理逻辑（线程 worker 调用）
+def process_entry(entry: Dict, model_api: ModelAPI, default_model: str, default_role: str,
+                  strict_model: str, strict_role: str, loose_model: str, loose_role: str,
+                  loose_score_threshold: float, max_round: int, writer: ResultWriter,
+                  speculative_judges: bool = False, sweep: List = None):
+    entry_id = entry["_id"]
+    
+    # 检查是否已处理
+    if entry_id in processed_ids:
+        print(f"Skipping already processed entry: {entry_id}")
+        return
+    
+    with span("entry", entry_id=entry_id):
+        steps = entry_rounds(entry, default_model, default_role, strict_model, strict_role,
+                             loose_model, loose_role, loose_score_threshold, max_round, speculative_judges,
+                             state=load_entry_state(entry_id), sweep=sweep)
+        result = drive(steps, lambda step: execute_step(step, model_api), executor=JUDGE_EXECUTOR)
+        
+        # 保存结果
+        save_entry(result if sweep is None else {"_id": entry_id, SWEEP_FIELD: result}, writer)
+    print(f"Processed entry: {entry_id}")
+
+# 单条数据处理逻辑（asyncio 版本，同一个事件循环里可以有成百上千条在途）
+async def aprocess_entry(entry: Dict, amodel_api: AsyncModelAPI, default_model: str, default_role: str,
+                         strict_model: str, strict_role: str, loose_model: str, loose_role: str,
+                         loose_score_threshold: float, max_round: int, writer: ResultWriter,
+                         speculative_judges: bool = False, sweep: List = None):
+    entry_id = entry["_id"]
+    with span("entry", entry_id=entry_id):
+        steps = entry_rounds(entry, default_model, default_role, strict_model, strict_role,
+                             loose_model, loose_role, loose_score_threshold, max_round, speculative_judges,
+                             state=load_entry_state(entry_id), sweep=sweep)
+        result = await adrive(steps, lambda step: aexecute_step(step, amodel_api))
+        save_entry(result if sweep is None else {"_id": entry_id, SWEEP_FIELD: result}, writer)
+    print(f"Processed entry: {entry_id}")
+
+# 单条数据的结束处理（流水线引擎调用）：轮次生成器返回后保存结果
+def finish_entry(entry: Dict, result, writer: ResultWriter, sweep: List = None):
+    entry_id = entry["_id"]
+    save_entry(result if sweep is None else {"_id": entry_id, SWEEP_FIELD: result}, writer)
     print(f"Processed entry: {entry_id}")
 
 # 多线程处理主函数
 def main(default_model: str, default_role: str, strict_model: str, strict_role: str,
-         loose_model: str, loose_role: str, loose_score_threshold: float, max_round: int, num_threads: int = 5):
-    global processed_ids
-    processed_ids = load_processed_ids()
+         loose_model: str, loose_role: str, loose_score_threshold: float, max_round: int, num_threads: int = 5,
+         writer_kind: str = "jsonl", fsync_every: int = 64, queue_size: int = 0, stats_interval: float = 30.0,
+         async_concurrency: int = 0, cache_path: str = None, cache_max_mb: int = 1024,
+         retrieval_cache: int = 10000, retrieval_batch_ms: float = 5.0, retrieval_max_batch: int = 32,
+         speculative_judges: bool = False, run_state_path: str = None, trace_path: str = None,
+         config_path: str = None, adaptive: bool = None, micro_batch: bool = None,
+         stream_judges: bool = None, fields: List[str] = None, compress: bool = None,
+         shard_index: int = 0, num_shards: int = 1, prompt_versions: Dict[str, str] = None,
+         sweep_loose_scores: List[float] = None, sweep_max_rounds: List[int] = None,
+         pipeline: bool = None, stage_workers: Dict[str, int] = None, max_in_flight: int = None,
+         health_check: bool = None, probe_timeout: float = None):
+    global processed_ids, RETRIEVER, REFERENCE, JUDGE_EXECUTOR, RUN_STORE, OUTPUT_FIELDS, PROMPTS
+    # 分片：只处理 _id 哈希到 shard_index 的条目，输出文件和断点库按分片区分
+    check_shard(shard_index, num_shards)
+    if num_shards > 1:
+        print(f"Running shard {shard_index} of {num_shards}.")
+    trace_path = shard_path(trace_path, shard_index, num_shards) if trace_path else None
+    tracer = Tracer(trace_path) if trace_path else None
+    set_tracer(tracer)
+    RUN_STORE = RunStore(shard_path(run_state_path or RUN_STATE_FILE, shard_index, num_shards))
+    imported = RUN_STORE.import_processed_ids(PROCESSED_IDS_FILE)
+    if imported:
+        print(f"Imported {imported} processed ids from {PROCESSED_IDS_FILE}.")
+    processed_ids = RUN_STORE.completed_ids()
+    SPECULATION_STATS.update(launched=0, wasted=0, cancelled=0)
+    
+    # 检索层：缓存重复查询；检索模块提供 batch_retrieve(queries, corpus_name, size) 时合并并发查询
+    batch_fn = getattr(retrieve_module, "batch_retrieve", None) if retrieval_batch_ms > 0 else None
+    RETRIEVER = CachedRetriever(retrieve, batch_fn=batch_fn, max_entries=retrieval_cache,
+                                batch_window=retrieval_batch_ms / 1000, max_batch=retrieval_max_batch)
     
     # 初始化模型 API
-    config_path = "/GLOBALFS/sysu_dfli_1/Kexin/MarchTrain/src/config/config.json"
-    model_api = ModelAPI(config_path)
+    config_path = config_path or CONFIG_FILE
+    cache = ResponseCache(cache_path, max_bytes=cache_max_mb << 20) if cache_path else None
+    model_api = ModelAPI(config_path, cache=cache, adaptive=adaptive, batching=micro_batch,
+                         streaming=stream_judges, prompt_versions=prompt_versions)
+    
+    # 只探测本次 run 用到的模型，所有副本并发探测；端点不可用或模型名不匹配时立即退出
+    health = health_options(model_api.config)
+    if health["enabled"] if health_check is None else health_check:
+        check_models(model_api, [default_model, strict_model, loose_model],
+                     health["timeout"] if probe_timeout is None else probe_timeout)
+    REFERENCE = ReferenceAssembler(reference_options(model_api.config))
+    PROMPTS = model_api.templates
+    print(f"Prompt templates: {', '.join(f'{name}@{version}' for name, version in PROMPTS.versions().items())}")
+    
+    # 输出投影与压缩：命令行参数优先于 config.json 的 "output" 段
+    output = output_options(model_api.config)
+    OUTPUT_FIELDS = fields if fields is not None else output["fields"]
+    compress = output["gzip"] if compress is None else compress
     
-    # 加载数据
-    with open(INPUT_FILE, 'r') as f:
-        data = json.load(f)
+    # 流水线引擎参数：命令行参数优先于 config.json 的 "pipeline" 段
+    pipeline_config = pipeline_options(model_api.config)
+    pipeline = pipeline_config["enabled"] if pipeline is None else pipeline
+    pipeline_config["stages"].update(stage_workers or {})
+    if max_in_flight is not None:
+        pipeline_config["max_in_flight"] = max_in_flight
+    
+    # sweep：looseScore × maxRound 的每个组合一份输出，轮次只跑一遍
+    sweep = None
+    if sweep_loose_scores or sweep_max_rounds:
+        sweep = [(t, m) for t in (sweep_loose_scores or [loose_score_threshold])
+                 for m in (sweep_max_rounds or [max_round])]
+        print(f"Sweeping {len(sweep)} configurations: {', '.join(sweep_key(t, m) for t, m in sweep)}")
     
     # 动态生成输出文件路径
     current_date = datetime.now().strftime("%Y%m%d")
-    output_file = os.path.join(BASE_OUTPUT_DIR, f"{default_model}_{current_date}.json")
+    suffix = f"{shard_tag(shard_index, num_shards)}{output_suffix(writer_kind, compress)}"
     
     # 确保输出目录存在
     os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
+    if sweep is None:
+        output_files = [os.path.join(BASE_OUTPUT_DIR, f"{default_model}_{current_date}{suffix}")]
+        writer = create_writer(writer_kind, output_files[0], fsync_every=fsync_every, compress=compress)
+    else:
+        outputs = {sweep_key(t, m): os.path.join(BASE_OUTPUT_DIR, f"{default_model}_{current_date}_{sweep_key(t, m)}{suffix}")
+                   for t, m in sweep}
+        output_files = list(outputs.values())
+        writer = SweepWriter({key: create_writer(writer_kind, path, fsync_every=fsync_every, compress=compress)
+                              for key, path in outputs.items()})
+    recover_exports(RUN_STORE, writer, output_files)
     
-    # 创建线程池
-    threads = []
-    for entry in data:
-        while len(threads) >= num_threads:
-            # 清理已完成的线程
-            threads = [t for t in threads if t.is_alive()]
-        
-        # 启动新线程
-        thread = threading.Thread(target=process_entry, args=(
-            entry, model_api, default_model, default_role, strict_model, strict_role,
-            loose_model, loose_role, loose_score_threshold, max_round, output_file
-        ))
-        thread.start()
-        threads.append(thread)
+    # 惰性读取数据（list JSON / JSONL，可以是 .gz）：worker 队列有界，内存中只有在途的条目
+    pending = (entry for entry in iter_entries(INPUT_FILE)
+               if in_shard(entry, shard_index, num_shards) and entry["_id"] not in processed_ids)
+    
+    amodel_api = None
+    try:
+        if async_concurrency > 0:
+            # asyncio 引擎：单线程事件循环，每个模型端点各自限流
+            amodel_api = AsyncModelAPI(model_api, default_concurrency=async_concurrency)
+            stats = run_async_engine(pending, lambda entry: aprocess_entry(
+                entry, amodel_api, default_model, default_role, strict_model, strict_role,
+                loose_model, loose_role, loose_score_threshold, max_round, writer, speculative_judges, sweep
+            ), amodel_api, async_concurrency, stats_interval)
+        elif pipeline:
+            # 流水线引擎：检索 / 证据提炼 / 判分 / 作答各有自己的队列和 worker，条目在阶段之间流转
+            stats = run_pipeline(pending, lambda entry: entry_rounds(
+                entry, default_model, default_role, strict_model, strict_role, loose_model, loose_role,
+                loose_score_threshold, max_round, speculative_judges, state=load_entry_state(entry["_id"]), sweep=sweep
+            ), lambda step: execute_step(step, model_api), lambda entry, result: finish_entry(entry, result, writer, sweep),
+                pipeline_config, stats_interval)
+        else:
+            # 投机判分：每个 worker 最多同时有一个后台 loose 调用；sweep 的多个作答调用也在这里并发
+            if speculative_judges or sweep:
+                JUDGE_EXECUTOR = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="loose-judge")
+            stats = run_worker_pool(pending, lambda entry: process_entry(
+                entry, model_api, default_model, default_role, strict_model, strict_role,
+                loose_model, loose_role, loose_score_threshold, max_round, writer, speculative_judges, sweep
+            ), num_threads, queue_size, stats_interval)
+    finally:
+        # 关闭写入器：剩余结果 fsync，断点随之写入
+        writer.close()
+        if JUDGE_EXECUTOR is not None:
+            JUDGE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        RUN_STORE.close()
+        if tracer is not None:
+            tracer.close()
+            set_tracer(None)
     
-    # 等待所有线程完成
-    for thread in threads:
-        thread.join()
+    print(format_stats(stats))
+    report_cache(cache)
+    report_retrieval(RETRIEVER)
+    report_reference(REFERENCE)
+    report_speculation(speculative_judges)
+    report_limits(amodel_api or model_api)
+    report_batching(model_api)
+    report_replicas(model_api)
+    report_prefix_cache(model_api)
+    report_pipeline(stats)
+    if tracer is not None:
+        print(format_summary(tracer.summary()))
+        print(f"Trace written to {trace_path} (summary: {trace_path}.summary.json)")
+    return stats
+
+# 启动时的健康检查：打印每个端点的探测结果，有模型不可用时抛出异常
+def check_models(model_api: ModelAPI, model_names: List[str], timeout: float):
+    start = time.perf_counter()
+    report = model_api.check_models(model_names, timeout)
+    for model_name, result in report.items():
+        if result.get("skipped"):
+            print(f"[health] {model_name} not probed (requests endpoint)")
+        elif not result["endpoints"]:
+            print(f"[health] {model_name} FAILED: {result['error']}")
+        for url, endpoint in result["endpoints"].items():
+            status = f"FAILED: {endpoint['error']}" if not endpoint["ok"] else \
+                f"ok (warning: {endpoint['warning']})" if endpoint.get("warning") else "ok"
+            print(f"[health] {model_name} {url} {status} ({endpoint['ms']:.0f}ms)")
+    failed = [model_name for model_name, result in report.items() if not result["ok"]]
+    if failed:
+        raise RuntimeError(f"Model endpoints unavailable for {', '.join(failed)}; "
+                           f"check config.json / the vLLM servers, or pass --no-healthCheck to skip the check.")
+    print(f"[health] {len(report)} models ok in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+# 线程引擎：固定数量的常驻 worker 从有界队列取条目，主线程阻塞在 submit 上而不是空转
+def run_worker_pool(entries, handler, num_threads: int, queue_size: int, stats_interval: float) -> Dict:
+    pool = WorkerPool(handler, num_workers=num_threads, queue_size=queue_size or None).start()
+    install_sigint_handler(pool)
+    reporter = StatsReporter(pool, stats_interval).start()
+    try:
+        for entry in entries:
+            if not pool.submit(entry):
+                break
+        # 等待所有 worker 完成（SIGINT 后只等进行中的条目）
+        pool.join()
+    finally:
+        reporter.stop()
+    return pool.stats()
+
+# 流水线引擎：每个阶段一个队列和固定数量的 worker，主线程在在途条目达到上限时阻塞
+def run_pipeline(entries, start, execute, finish, options: Dict, stats_interval: float) -> Dict:
+    runner = PipelineRunner(start, execute, finish, options["stages"], max_in_flight=options["max_in_flight"],
+                            default_workers=options["default_workers"],
+                            scope=lambda entry: span("entry", entry_id=entry["_id"])).start()
+    print(f"Pipeline stages: {', '.join(f'{name}={workers}' for name, workers in options['stages'].items())} "
+          f"max_in_flight={options['max_in_flight']}")
+    install_sigint_handler(runner)
+    reporter = StatsReporter(runner, stats_interval).start()
+    try:
+        runner.run(entries)
+    finally:
+        reporter.stop()
+    return runner.stats()
+
+# asyncio 引擎：同一个事件循环里最多 concurrency 条在途
+def run_async_engine(entries, handler, amodel_api: AsyncModelAPI, concurrency: int, stats_interval: float) -> Dict:
+    runner = AsyncEntryRunner(handler, concurrency=concurrency)
+    reporter = StatsReporter(runner, stats_interval).start()
+    
+    async def run():
+        try:
+            await runner.run(entries)
+        finally:
+            await amodel_api.aclose()
+    
+    try:
+        asyncio.run(run())
+    finally:
+        reporter.stop()
+    return runner.stats()
+
+# 打印响应缓存的命中统计
+def report_cache(cache: ResponseCache):
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"[cache] hits={stats['hits']} misses={stats['misses']} bypassed={stats['bypassed']} "
+          f"evictions={stats['evictions']} hit_rate={stats['hit_rate']:.2%} size={stats['bytes'] >> 20}MB")
+    cache.close()
+
+# 打印检索层的缓存 / 合并统计
+def report_retrieval(retriever: CachedRetriever):
+    stats = retriever.stats()
+    print(f"[retrieval] hits={stats['hits']} misses={stats['misses']} coalesced={stats['coalesced']} "
+          f"batches={stats['batches']} hit_rate={stats['hit_rate']:.2%}")
+
+# 打印参考信息去重 / 截断省下的 prompt token
+def report_reference(reference: ReferenceAssembler):
+    stats = reference.stats()
+    print(f"[reference] tokens_in={stats['tokens_in']} tokens_out={stats['tokens_out']} "
+          f"saved={stats['tokens_saved']} ({stats['saved_rate']:.2%})")
+
+# 打印投机判分中被浪费的 loose 调用数量，用来权衡吞吐和后端负载
+def report_speculation(speculative_judges: bool):
+    if not speculative_judges:
+        return
+    launched, wasted = SPECULATION_STATS["launched"], SPECULATION_STATS["wasted"]
+    print(f"[speculation] loose calls launched={launched} wasted={wasted} "
+          f"(cancelled before completion={SPECULATION_STATS['cancelled']}) "
+          f"waste_rate={wasted / launched if launched else 0.0:.2%}")
+
+# 打印每个端点最终的并发窗口和过载次数，用来给 config.json 的 "concurrency" 定上限
+def report_limits(api):
+    for endpoint, stats in api.limiter_stats().items():
+        if not stats['calls']:
+            continue
+        print(f"[limits] {endpoint} calls={stats['calls']} limit={stats['limit']:.1f} baseline={stats['baseline_ms']:.0f}ms "
+              f"overloads={stats['overloads']} decreases={stats['decreases']}")
+
+# 打印每个模型的微批统计：平均批大小越接近 max_batch，GPU 越接近满载
+def report_batching(model_api: ModelAPI):
+    for model_name, stats in model_api.batcher_stats().items():
+        if not stats['requests']:
+            continue
+        print(f"[batching] {model_name} prompts={stats['requests']} batches={stats['batches']} "
+              f"mean_batch={stats['mean_batch']:.1f} failed_batches={stats['failed_batches']}")
+
+# 打印多副本模型每个副本分到的请求数和被摘除的次数
+def report_replicas(model_api: ModelAPI):
+    for model_name, replicas in model_api.replica_stats().items():
+        if not any(stats['requests'] for stats in replicas.values()):
+            continue
+        for url, stats in replicas.items():
+            print(f"[replicas] {model_name} {url} requests={stats['requests']} errors={stats['errors']} "
+                  f"ejections={stats['ejections']}{' (ejected)' if stats['ejected'] else ''}")
+
+# 打印流水线每个阶段的积压、等待 / 执行时间和 worker 占用率，用来分别确定各后端的 worker 数
+def report_pipeline(stats: Dict):
+    for name, stage in stats.get("stages", {}).items():
+        if not stage['processed']:
+            continue
+        print(f"[pipeline] {name} workers={stage['workers']} processed={stage['processed']} errors={stage['errors']} "
+              f"backlog={stage['backlog']} wait={stage['mean_wait_ms']:.1f}ms service={stage['mean_service_ms']:.1f}ms "
+              f"utilization={stage['utilization']:.2%}")
+    if stats.get("edges"):
+        print(f"[pipeline] edges {' '.join(f'{edge}={count}' for edge, count in stats['edges'].items())}")
+
+# 打印每个模型 prompt token 中命中 vLLM prefix cache 的比例（需要服务端返回 prompt_tokens_details）
+def report_prefix_cache(model_api: ModelAPI):
+    for model_name, stats in model_api.prefix_cache_stats().items():
+        if not stats['reported']:
+            print(f"[prefix-cache] {model_name} prompt_tokens={stats['prompt_tokens']} cached_tokens=n/a "
+                  f"(enable --enable-prompt-tokens-details on the server)")
+            continue
+        print(f"[prefix-cache] {model_name} calls={stats['calls']} prompt_tokens={stats['prompt_tokens']} "
+              f"cached_tokens={stats['cached_tokens']} hit_rate={stats['hit_rate']:.2%}")
 
 if __name__ == "__main__":
     import argparse
@@ -252,12 +669,91 @@ if __name__ == "__main__":
     parser.add_argument("--strictRole", type=str, required=True, help="Strict system role key")
     parser.add_argument("--looseModel", type=str, required=True, help="Loose model name")
     parser.add_argument("--looseRole", type=str, required=True, help="Loose system role key")
-    parser.add_argument("--looseScore", type=float, required=True, help="Loose score threshold")
-    parser.add_argument("--maxRound", type=int, required=True, help="Maximum number of rounds")
+    parser.add_argument("--looseScore", type=float, default=None, help="Loose score threshold")
+    parser.add_argument("--maxRound", type=int, default=None, help="Maximum number of rounds")
+    parser.add_argument("--sweepLooseScore", type=lambda value: [float(v) for v in value.split(",") if v], default=None,
+                        help="Comma-separated looseScore values; with --sweepMaxRound, every combination is evaluated "
+                             "in one pass and written to its own output file")
+    parser.add_argument("--sweepMaxRound", type=lambda value: [int(v) for v in value.split(",") if v], default=None,
+                        help="Comma-separated maxRound values for the sweep")
     parser.add_argument("--threads", type=int, default=5, help="Number of threads to use")
+    parser.add_argument("--config", type=str, default=None,
+                        help=f"Model endpoint config (default: {CONFIG_FILE}); give each node's shard its own endpoints")
+    parser.add_argument("--healthCheck", action=argparse.BooleanOptionalAction, default=None,
+                        help="Probe GET /v1/models of the default / strict / loose models at startup and exit if any "
+                             "is unreachable (default: config.json 'health.enabled')")
+    parser.add_argument("--probeTimeout", type=float, default=None,
+                        help="Timeout of each endpoint probe in seconds (default: config.json 'health.timeout')")
+    parser.add_argument("--shardIndex", "--shard-index", dest="shardIndex", type=int, default=0,
+                        help="Index of the shard this process runs (0-based)")
+    parser.add_argument("--numShards", "--num-shards", dest="numShards", type=int, default=1,
+                        help="Split the input into this many shards by a stable hash of _id; each shard writes its "
+                             "own output and run state, merge them with storage/shards.py")
+    parser.add_argument("--async", dest="asyncConcurrency", type=int, default=0,
+                        help="Run on the asyncio engine with this many entries in flight (0 uses worker threads)")
+    parser.add_argument("--cache", type=str, default=None,
+                        help="SQLite file for caching deterministic (temperature=0) LLM responses")
+    parser.add_argument("--cacheMaxMB", type=int, default=1024, help="Size bound of the response cache in MB")
+    parser.add_argument("--retrievalCache", type=int, default=10000,
+                        help="Max cached retrieval results (0 disables caching)")
+    parser.add_argument("--retrievalBatchMs", type=float, default=5.0,
+                        help="Window for merging concurrent queries into one batch_retrieve call (0 disables)")
+    parser.add_argument("--retrievalMaxBatch", type=int, default=32, help="Max queries per batched retrieval")
+    parser.add_argument("--speculativeJudges", action="store_true",
+                        help="Send strict and loose judge calls concurrently; the loose result is dropped when strict_score == 1")
+    parser.add_argument("--runState", type=str, default=None,
+                        help=f"SQLite file holding per-round checkpoints and completion markers (default: {RUN_STATE_FILE})")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="Write per-stage / per-model-call spans to this JSONL file and print a latency summary")
+    parser.add_argument("--adaptive", action=argparse.BooleanOptionalAction, default=None,
+                        help="Adapt per-endpoint concurrency with AIMD (default: config.json 'adaptive.enabled')")
+    parser.add_argument("--microBatch", action=argparse.BooleanOptionalAction, default=None,
+                        help="Merge concurrent prompts per local model into batched completions requests "
+                             "(default: config.json 'batching.enabled')")
+    parser.add_argument("--streamJudges", action=argparse.BooleanOptionalAction, default=None,
+                        help="Stream calls whose role profile sets early_stop and close them once a value parses "
+                             "(default: config.json 'streaming.enabled')")
+    parser.add_argument("--promptVersion", action="append", default=[],
+                        help="Pin a prompt template version, e.g. answer=v1 (default: config.json 'prompts.versions', "
+                             "else the latest version in prompts/templates.json)")
+    parser.add_argument("--pipeline", action=argparse.BooleanOptionalAction, default=None,
+                        help="Run on the stage-pipelined engine: retrieve / evidence_extract / strict_judge / "
+                             "loose_judge / final_answer each get their own queue and workers "
+                             "(default: config.json 'pipeline.enabled')")
+    parser.add_argument("--stageWorkers", action="append", default=[],
+                        help="Workers of one pipeline stage, e.g. strict_judge=16 (default: config.json 'pipeline.stages')")
+    parser.add_argument("--maxInFlight", type=int, default=None,
+                        help="Entries in the pipeline at once (default: config.json 'pipeline.max_in_flight')")
+    parser.add_argument("--queueSize", type=int, default=0, help="Pending entry queue size (default: 2 x threads)")
+    parser.add_argument("--statsInterval", type=float, default=30.0, help="Seconds between scheduler stats lines (0 disables)")
+    parser.add_argument("--writer", type=str, default="jsonl", choices=sorted(WRITERS),
+                        help="Result writer backend (jsonl: append-only, json: legacy list file)")
+    parser.add_argument("--fsyncEvery", type=int, default=64, help="Entries per fsync for the jsonl writer")
+    parser.add_argument("--fields", type=lambda value: [f for f in value.split(",") if f], default=None,
+                        help="Comma-separated input fields to keep in results besides _id / answer / Answer_* "
+                             "(e.g. question,type,round_logs; default: config.json 'output.fields', all fields if unset)")
+    parser.add_argument("--gzip", action=argparse.BooleanOptionalAction, default=None,
+                        help="Write gzip-compressed JSONL results (default: config.json 'output.gzip')")
     args = parser.parse_args()
+    if args.looseScore is None and not args.sweepLooseScore:
+        parser.error("--looseScore or --sweepLooseScore is required")
+    if args.maxRound is None and not args.sweepMaxRound:
+        parser.error("--maxRound or --sweepMaxRound is required")
     
     main(
         args.defaultModel, args.defaultRole, args.strictModel, args.strictRole,
-        args.looseModel, args.looseRole, args.looseScore, args.maxRound, args.threads
+        args.looseModel, args.looseRole, args.looseScore, args.maxRound, args.threads,
+        writer_kind=args.writer, fsync_every=args.fsyncEvery,
+        queue_size=args.queueSize, stats_interval=args.statsInterval,
+        async_concurrency=args.asyncConcurrency, cache_path=args.cache, cache_max_mb=args.cacheMaxMB,
+        retrieval_cache=args.retrievalCache, retrieval_batch_ms=args.retrievalBatchMs,
+        retrieval_max_batch=args.retrievalMaxBatch, speculative_judges=args.speculativeJudges,
+        run_state_path=args.runState, trace_path=args.trace, adaptive=args.adaptive,
+        micro_batch=args.microBatch, stream_judges=args.streamJudges, fields=args.fields, compress=args.gzip,
+        config_path=args.config, shard_index=args.shardIndex, num_shards=args.numShards,
+        prompt_versions=dict(item.split("=", 1) for item in args.promptVersion),
+        sweep_loose_scores=args.sweepLooseScore, sweep_max_rounds=args.sweepMaxRound,
+        pipeline=args.pipeline, max_in_flight=args.maxInFlight,
+        health_check=args.healthCheck, probe_timeout=args.probeTimeout,
+        stage_workers={name: int(workers) for name, workers in (item.split("=", 1) for item in args.stageWorkers)}
     )
\ No newline at end of file
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    # 大小写和空白差异不影响检索结果（检索端的 analyzer 同样会做小写化和分词）
+    return " ".join(query.split()).casefold()
+
+
+class CachedRetriever:
+    """
+    包装 retrieve(query, corpus_name, size)：
+    1. 以归一化后的 (query, corpus_name, size) 为 key 做 LRU 缓存，最多 max_entries 条；
+    2. 相同 key 的并发请求只发一次（后到的请求等待同一个结果）；
+    3. 若提供 batch_fn(queries, corpus_name, size) -> List[List[hit]]，则把 batch_window 秒内
+       来自各个 worker 的请求合并成一次批量检索（最多 max_batch 条）。
+    """
+
+    def __init__(self, retrieve_fn: Callable, batch_fn: Optional[Callable] = None, max_entries: int = 10000,
+                 batch_window: float = 0.005, max_batch: int = 32):
+        self.retrieve_fn = retrieve_fn
+        self.batch_fn = batch_fn
+        self.max_entries = max_entries
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.batches = 0
+        self._cache = OrderedDict()
+        self._inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Tuple, str, Future]] = []
+        self._wakeup = threading.Condition(self._lock)
+        self._batcher = None
+        if batch_fn is not None:
+            self._batcher = threading.Thread(target=self._run_batches, name="retrieval-batcher", daemon=True)
+            self._batcher.start()
+
+    def retrieve(self, query: str, corpus_name: str, size: int):
+        return self.submit(query, corpus_name, size).result()
+
+    def submit(self, query: str, corpus_name: str, size: int) -> Future:
+        key = (normalize_query(query), corpus_name, size)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(self._cache[key])
+                return future
+            if key in self._inflight:
+                self.coalesced += 1
+                return self._inflight[key]
+            self.misses += 1
+            future = self._inflight[key] = Future()
+            if self._batcher is not None:
+                self._pending.append((key, query, future))
+                self._wakeup.notify()
+                return future
+
+        # 未启用批量检索：在调用方线程里直接检索
+        try:
+            self._resolve(key, future, self.retrieve_fn(query=query, corpus_name=corpus_name, size=size))
+        except Exception as e:
+            self._fail(key, future, e)
+        return future
+
+    def _resolve(self, key, future: Future, result):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if self.max_entries > 0:
+                self._cache[key] = result
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        future.set_result(result)
+
+    def _fail(self, key, future: Future, error: Exception):
+        # 失败的检索不缓存，等待同一结果的请求都会收到这个异常
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_exception(error)
+
+    def _run_batches(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                # 第一条请求到达后再等 batch_window 秒，收集更多请求
+                deadline = time.monotonic() + self.batch_window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+
+            # 同一批内按 (corpus_name, size) 分组，每组一次批量请求
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0][1:], []).append(item)
+            for (corpus_name, size), items in groups.items():
+                self.batches += 1
+                try:
+                    results = self.batch_fn([query for _, query, _ in items], corpus_name=corpus_name, size=size)
+                    if len(results) != len(items):
+                        raise ValueError(f"batch_fn returned {len(results)} results for {len(items)} queries")
+                except Exception as e:
+                    for key, _, future in items:
+                        self._fail(key, future, e)
+                    continue
+                for (key, _, future), result in zip(items, results):
+                    self._resolve(key, future, result)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "entries": len(self._cache),
+            }
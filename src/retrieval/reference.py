@@ -0,0 +1,211 @@
+import hashlib
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# 参考信息组装参数，可在 config.json 的 "reference" 段覆盖
+DEFAULT_REFERENCE_OPTIONS = {
+    "dedup": True,
+    "similarity": 0.8,       # 词 3-gram 的 Jaccard 相似度达到该值视为近似重复
+    "strategy": "recency",   # 超出预算时保留什么：recency（最近几轮的证据）/ relevance（与问题和缺失证据最相关的句子）
+    "budgets": {},           # 模型名 -> 参考信息部分的 token 上限；未配置的模型不截断
+    "tokenizers": {},        # 模型名 -> 本地 tokenizer 目录（transformers），未配置时按词数估算
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
+_WORD = re.compile(r"\w+")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def reference_options(config: dict) -> dict:
+    options = dict(DEFAULT_REFERENCE_OPTIONS)
+    options.update(config.get('reference', {}))
+    return options
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def fingerprint(text: str) -> str:
+    # 忽略大小写、标点和空白差异的精确指纹
+    return hashlib.md5(" ".join(_WORD.findall(text.casefold())).encode("utf-8")).hexdigest()
+
+
+def shingles(text: str, n: int = 3) -> frozenset:
+    words = _WORD.findall(text.casefold())
+    if len(words) <= n:
+        return frozenset([tuple(words)])
+    return frozenset(tuple(words[i:i + n]) for i in range(len(words) - n + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def approx_tokens(text: str) -> int:
+    # 英文 BPE tokenizer 大约每个词 1.3 个 token
+    return len(_TOKEN.findall(text)) * 4 // 3
+
+
+class NearDuplicateFilter:
+    """记录已保留的文本，判断新文本是否与其中之一完全相同或近似重复。"""
+
+    def __init__(self, similarity: float):
+        self.similarity = similarity
+        self._exact = set()
+        self._shingles: List[frozenset] = []
+
+    def add(self, text: str) -> bool:
+        """文本不重复时记录下来并返回 True。"""
+        key = fingerprint(text)
+        if key in self._exact:
+            return False
+        grams = shingles(text)
+        if self.similarity < 1.0 and any(jaccard(grams, seen) >= self.similarity for seen in self._shingles):
+            return False
+        self._exact.add(key)
+        self._shingles.append(grams)
+        return True
+
+
+class TokenCounter:
+    """按模型计 token：配置了本地 tokenizer 且安装了 transformers 时精确计数，否则估算。"""
+
+    def __init__(self, tokenizer_paths: Dict[str, str] = None):
+        self.tokenizer_paths = tokenizer_paths or {}
+        self._tokenizers = {}
+        self._lock = threading.Lock()
+
+    def _tokenizer(self, model: str):
+        path = self.tokenizer_paths.get(model)
+        if path is None:
+            return None
+        with self._lock:
+            if path not in self._tokenizers:
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizers[path] = AutoTokenizer.from_pretrained(path)
+                except (ImportError, OSError) as e:
+                    print(f"Falling back to approximate token counts for {model}: {e}")
+                    self._tokenizers[path] = None
+            return self._tokenizers[path]
+
+    def count(self, model: str, text: str) -> int:
+        tokenizer = self._tokenizer(model)
+        if tokenizer is None:
+            return approx_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class ReferenceAssembler:
+    """
+    组装送给模型的参考信息：
+    1. 检索结果：去掉前几轮已经用过的段落和同一批里的近似重复段落，按检索排名在预算内保留；
+    2. 每轮提炼出的证据：新一轮里与之前各轮近似重复的句子不再追加；
+    3. 送给判分 / 作答模型时按该模型的 token 预算截断，按 strategy 选择保留的句子，保持原有顺序。
+    每次组装把原样拼接时的 token 数和实际送出的 token 数累加到 stats 中。
+    """
+
+    def __init__(self, options: dict = None):
+        self.options = dict(DEFAULT_REFERENCE_OPTIONS, **(options or {}))
+        self.counter = TokenCounter(self.options["tokenizers"])
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    def budget(self, models: Iterable[str]) -> Optional[int]:
+        budgets = [self.options["budgets"][m] for m in models if m in self.options["budgets"]]
+        return min(budgets) if budgets else None
+
+    def _record(self, stats: Dict, model: str, raw: str, kept: str):
+        tokens_in, tokens_out = self.counter.count(model, raw), self.counter.count(model, kept)
+        stats["tokens_in"] = stats.get("tokens_in", 0) + tokens_in
+        stats["tokens_out"] = stats.get("tokens_out", 0) + tokens_out
+        with self._lock:
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+
+    def select_hits(self, hits: List[Dict], seen: List[str], model: str, stats: Dict) -> str:
+        """
+        从检索结果中提取 paragraph_text 拼接成参考信息；seen 是之前各轮用过的段落指纹，会被原地更新。
+        """
+        raw = "\n".join(hit["_source"]["paragraph_text"] for hit in hits)
+        if not self.options["dedup"] and self.budget([model]) is None:
+            return raw
+        dedup = NearDuplicateFilter(self.options["similarity"] if self.options["dedup"] else 1.0)
+        previous = set(seen)
+        budget = self.budget([model])
+        kept, used = [], 0
+        for hit in hits:
+            text = hit["_source"]["paragraph_text"]
+            if self.options["dedup"] and (fingerprint(text) in previous or not dedup.add(text)):
+                continue
+            tokens = self.counter.count(model, text)
+            if budget is not None and used + tokens > budget:
+                continue
+            kept.append(text)
+            used += tokens
+        seen.extend(fingerprint(text) for text in kept)
+        reference = "\n".join(kept)
+        self._record(stats, model, raw, reference)
+        return reference
+
+    def add_round(self, rounds: List[str], evidence: str):
+        """追加一轮提炼出的证据，去掉与之前各轮近似重复的句子。"""
+        if not self.options["dedup"]:
+            rounds.append(evidence)
+            return
+        dedup = NearDuplicateFilter(self.options["similarity"])
+        for previous in rounds:
+            for sentence in split_sentences(previous):
+                dedup.add(sentence)
+        rounds.append(" ".join(s for s in split_sentences(evidence) if dedup.add(s)))
+
+    def assemble(self, rounds: List[str], models: Iterable[str], query: str, stats: Dict,
+                 raw_rounds: List[str] = None) -> str:
+        """
+        按 models 中最小的预算组装累积参考信息，格式与原来的逐轮 "\\n" 拼接相同。
+        raw_rounds 是未去重的逐轮证据，用来统计原样拼接时的 token 数。
+        """
+        models = list(models)
+        full = "".join("\n" + evidence for evidence in rounds)
+        raw = "".join("\n" + evidence for evidence in raw_rounds) if raw_rounds is not None else full
+        budget = self.budget(models)
+        if budget is None:
+            self._record(stats, models[0], raw, full)
+            return full
+
+        sentences = [(i, j, s) for i, evidence in enumerate(rounds) for j, s in enumerate(split_sentences(evidence))]
+        if self.options["strategy"] == "relevance":
+            terms = set(_WORD.findall(query.casefold()))
+            order = sorted(sentences, key=lambda item: (
+                -len(terms & set(_WORD.findall(item[2].casefold()))) / (len(_WORD.findall(item[2])) or 1) ** 0.5,
+                -item[0]))
+        else:
+            order = sorted(sentences, key=lambda item: (-item[0], item[1]))
+        kept, used = set(), 0
+        for i, j, sentence in order:
+            tokens = self.counter.count(models[0], sentence)
+            if used + tokens > budget:
+                continue
+            kept.add((i, j))
+            used += tokens
+
+        reference = "".join(
+            "\n" + " ".join(s for j, s in enumerate(split_sentences(evidence)) if (i, j) in kept)
+            for i, evidence in enumerate(rounds)
+        )
+        self._record(stats, models[0], raw, reference)
+        return reference
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "saved_rate": (self.tokens_in - self.tokens_out) / self.tokens_in if self.tokens_in else 0.0,
+            }
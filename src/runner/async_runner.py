@@ -0,0 +1,80 @@
+import asyncio
+import signal
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+
+class AsyncEntryRunner:
+    """
+    在单个事件循环里并发处理条目，最多 concurrency 个同时在途。
+    SIGINT 后停止派发新条目，等待在途条目完成。stats() 与 WorkerPool 的格式一致。
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], concurrency: int = 64):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.start_time = None
+        self._pending = set()
+        self._stopping = False
+
+    def shutdown(self):
+        self._stopping = True
+
+    def stats(self) -> Dict:
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+        done = self.completed + self.failed
+        return {
+            "queue_depth": 0,
+            "in_flight": len(self._pending),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "elapsed": elapsed,
+            "throughput": done / elapsed if elapsed > 0 else 0.0,
+        }
+
+    async def _run_one(self, item):
+        try:
+            await self.handler(item)
+            self.completed += 1
+        except Exception:
+            traceback.print_exc()
+            self.failed += 1
+
+    async def run(self, items: Iterable):
+        self.start_time = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self._on_sigint)
+        except (NotImplementedError, RuntimeError):
+            pass
+        try:
+            for item in items:
+                if self._stopping:
+                    break
+                while len(self._pending) >= self.concurrency:
+                    _, self._pending = await asyncio.wait(self._pending, return_when=asyncio.FIRST_COMPLETED)
+                if self._stopping:
+                    break
+                self._pending.add(asyncio.create_task(self._run_one(item)))
+                self.submitted += 1
+            while self._pending:
+                _, self._pending = await asyncio.wait(self._pending)
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGINT)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    def _on_sigint(self):
+        print("SIGINT received, draining in-flight entries (press Ctrl-C again to abort)...")
+        self.shutdown()
+        # 第二次 Ctrl-C 恢复默认行为
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGINT)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
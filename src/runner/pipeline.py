@@ -0,0 +1,336 @@
+import contextvars
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterable, Optional
+
+from runner.steps import Spawn, Await, Cancel, EntrySteps
+
+# 流水线参数，可在 config.json 的 "pipeline" 段覆盖
+DEFAULT_PIPELINE_OPTIONS = {
+    "enabled": False,
+    "max_in_flight": 64,     # 同时在流水线中的条目数（决定各阶段队列的总积压上限）
+    "default_workers": 4,    # 没有单独配置的阶段使用的 worker 数
+    "stages": {              # 每个阶段（对应一个检索后端 / 模型角色）各自的 worker 数
+        "retrieve": 8,
+        "evidence_extract": 16,
+        "strict_judge": 8,
+        "loose_judge": 8,
+        "final_answer": 8,
+    },
+}
+
+# 通知阶段 worker 退出的哨兵
+_STOP = object()
+
+
+def pipeline_options(config: dict) -> dict:
+    options = dict(DEFAULT_PIPELINE_OPTIONS)
+    section = config.get('pipeline', {})
+    options.update(section)
+    options["stages"] = dict(DEFAULT_PIPELINE_OPTIONS["stages"], **section.get("stages", {}))
+    return options
+
+
+class _Entry:
+    # 一条在流水线中流转的条目：它的轮次生成器、所在的 context（tracing 标签）和上一个阶段
+    __slots__ = ("item", "steps", "context", "scope", "stage")
+
+    def __init__(self, item, steps: EntrySteps, context: contextvars.Context, scope):
+        self.item = item
+        self.steps = steps
+        self.context = context
+        self.scope = scope
+        self.stage = None
+
+
+class _Stage:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue = queue.Queue()
+        self.threads = []
+        self.busy = 0
+        self.processed = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.wait_s = 0.0      # 消息在队列里等待的总时间
+        self.service_s = 0.0   # 执行步骤的总时间
+
+
+class PipelineRunner:
+    """
+    按阶段流水线处理条目：每个阶段（retrieve / evidence_extract / strict_judge / loose_judge / final_answer）
+    有自己的消息队列和固定数量的 worker。条目的轮次生成器 yield 出的每个步骤就是一条消息，
+    按 step.stage 投递到对应阶段的队列；worker 执行完后把结果 send 回生成器，生成器 yield 的下一个步骤
+    再投递到下一个阶段。条目在等待时不占用任何线程，各阶段的并发只取决于各自的 worker 数。
+    阶段之间的转移按边计数，回到 retrieve 的边（loose_judge -> retrieve）就是进入下一轮。
+
+    Checkpoint 等没有 stage 的步骤在推进生成器的线程里直接执行；Spawn 的步骤投递到它自己的阶段，
+    生成器立即拿到一个 Future 继续推进，Await 时若尚未完成则挂起，完成后由执行它的 worker 继续推进。
+    stats() 与 WorkerPool 的格式一致，另外给出每个阶段的积压、繁忙 worker 数和平均等待 / 执行时间。
+    """
+
+    def __init__(self, start: Callable[[Any], Optional[EntrySteps]], execute: Callable[[Any], Any],
+                 finish: Callable[[Any, Any], None], stages: Dict[str, int], max_in_flight: int = 64,
+                 default_workers: int = 4, scope: Optional[Callable[[Any], ContextManager]] = None):
+        self.start_entry = start
+        self.execute = execute
+        self.finish = finish
+        self.scope = scope
+        self.max_in_flight = max(1, max_in_flight)
+        self.default_workers = default_workers
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stages: Dict[str, _Stage] = {}
+        self._edges = defaultdict(int)
+        self._stopping = threading.Event()
+        self._started = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.dropped = 0
+        self.start_time = None
+        for name, workers in stages.items():
+            self._stage(name, workers)
+
+    def start(self):
+        self.start_time = time.monotonic()
+        with self._lock:
+            self._started = True
+            for stage in self._stages.values():
+                self._start_stage(stage)
+        return self
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def shutdown(self):
+        """停止接收新条目，已经进入流水线的条目会跑完。只设置事件，可以在信号处理函数里调用。"""
+        self._stopping.set()
+
+    def run(self, items: Iterable):
+        """逐条送入流水线（在途条目达到 max_in_flight 时阻塞），然后等待在途条目全部完成。"""
+        try:
+            for item in items:
+                if not self._admit():
+                    break
+                self._begin(item)
+            self._wait_idle()
+        finally:
+            self._stop_workers()
+
+    def _admit(self) -> bool:
+        with self._idle:
+            while self.in_flight >= self.max_in_flight and not self._stopping.is_set():
+                # 带超时的 wait，保证阻塞期间主线程仍能响应 SIGINT
+                self._idle.wait(timeout=0.5)
+            if self._stopping.is_set():
+                return False
+            self.in_flight += 1
+            self.submitted += 1
+            return True
+
+    def _wait_idle(self):
+        with self._idle:
+            while self.in_flight:
+                self._idle.wait(timeout=0.5)
+
+    def _stage(self, name: str, workers: Optional[int] = None) -> _Stage:
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                # 没有配置的阶段在第一次用到时按 default_workers 创建
+                stage = self._stages[name] = _Stage(name, workers or self.default_workers)
+                if self._started:
+                    self._start_stage(stage)
+            return stage
+
+    def _start_stage(self, stage: _Stage):
+        for i in range(stage.workers):
+            thread = threading.Thread(target=self._work, args=(stage,), name=f"{stage.name}-{i}", daemon=True)
+            thread.start()
+            stage.threads.append(thread)
+
+    def _stop_workers(self):
+        with self._lock:
+            stages = list(self._stages.values())
+        for stage in stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+        for stage in stages:
+            for thread in stage.threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+
+    def _begin(self, item):
+        context = contextvars.copy_context()
+        try:
+            scope = self.scope(item) if self.scope is not None else nullcontext()
+            context.run(scope.__enter__)
+        except Exception:
+            traceback.print_exc()
+            self._done(None, ok=False)
+            return
+        # scope 已经进入，之后任何出错都要经 _done 退出它（关闭条目的 span）
+        entry = _Entry(item, None, context, scope)
+        try:
+            entry.steps = context.run(self.start_entry, item)
+        except Exception as e:
+            traceback.print_exc()
+            self._done(entry, ok=False, error=e)
+            return
+        if entry.steps is None:
+            # 不需要处理的条目（例如已完成）
+            self._done(entry, ok=True)
+            return
+        self._advance(entry, None, None)
+
+    def _done(self, entry: Optional[_Entry], ok: bool, error: Optional[BaseException] = None):
+        if entry is not None:
+            try:
+                # 出错时把异常交给 scope，span 会记录 error 字段
+                exc_info = (type(error), error, error.__traceback__) if error is not None else (None, None, None)
+                entry.context.run(entry.scope.__exit__, *exc_info)
+            except Exception:
+                traceback.print_exc()
+        with self._idle:
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self._idle.notify_all()
+
+    def _route(self, entry: _Entry, step, future: Optional[Future]):
+        stage = self._stage(step.stage)
+        if future is None:
+            # 后台步骤不改变条目所在的阶段，只统计条目主路径上的转移
+            with self._lock:
+                self._edges[(entry.stage or "start", stage.name)] += 1
+            entry.stage = stage.name
+        stage.queue.put((entry, step, future, time.monotonic()))
+
+    def _advance(self, entry: _Entry, result, error: Optional[BaseException]):
+        """推进条目的生成器，直到它 yield 一个需要投递到某个阶段的步骤、挂起在 Await 上或结束。"""
+        while True:
+            try:
+                if error is not None:
+                    step = entry.context.run(entry.steps.throw, error)
+                else:
+                    step = entry.context.run(entry.steps.send, result)
+            except StopIteration as stop:
+                try:
+                    entry.context.run(self.finish, entry.item, stop.value)
+                except Exception as e:
+                    traceback.print_exc()
+                    self._done(entry, ok=False, error=e)
+                    return
+                self._done(entry, ok=True)
+                return
+            except Exception as e:
+                traceback.print_exc()
+                self._done(entry, ok=False, error=e)
+                return
+            result, error = None, None
+            if isinstance(step, Spawn):
+                result = Future()
+                self._route(entry, step.step, result)
+            elif isinstance(step, Await):
+                if not step.handle.done():
+                    # 挂起：由完成该 Future 的线程继续推进
+                    step.handle.add_done_callback(lambda future: self._resume(entry, future))
+                    return
+                try:
+                    result = step.handle.result()
+                except Exception as e:
+                    error = e
+            elif isinstance(step, Cancel):
+                # 尚未开始的步骤直接取消；已在执行的无法中断，只能丢弃其结果
+                result = step.handle.cancel()
+            elif getattr(step, "stage", None) is not None:
+                self._route(entry, step, None)
+                return
+            else:
+                # Checkpoint 等本地步骤直接执行
+                try:
+                    result = entry.context.run(self.execute, step)
+                except Exception as e:
+                    error = e
+
+    def _resume(self, entry: _Entry, future: Future):
+        try:
+            result, error = future.result(), None
+        except Exception as e:
+            result, error = None, e
+        self._advance(entry, result, error)
+
+    def _work(self, stage: _Stage):
+        while True:
+            message = stage.queue.get()
+            if message is _STOP:
+                return
+            entry, step, future, enqueued = message
+            if future is not None and not future.set_running_or_notify_cancel():
+                with self._lock:
+                    stage.cancelled += 1
+                continue
+            started = time.monotonic()
+            with self._lock:
+                stage.busy += 1
+                stage.wait_s += started - enqueued
+            try:
+                # 后台步骤与条目的主路径并发执行，使用 context 的副本
+                context = entry.context.copy() if future is not None else entry.context
+                result, error = context.run(self.execute, step), None
+            except Exception as e:
+                result, error = None, e
+            with self._lock:
+                stage.busy -= 1
+                stage.processed += 1
+                stage.errors += error is not None
+                stage.service_s += time.monotonic() - started
+            if future is not None:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+                continue
+            self._advance(entry, result, error)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+            done = self.completed + self.failed
+            stages = {}
+            for name, stage in self._stages.items():
+                stages[name] = {
+                    "backlog": stage.queue.qsize(),
+                    "busy": stage.busy,
+                    "workers": stage.workers,
+                    "processed": stage.processed,
+                    "errors": stage.errors,
+                    "cancelled": stage.cancelled,
+                    "mean_wait_ms": stage.wait_s / stage.processed * 1000 if stage.processed else 0.0,
+                    "mean_service_ms": stage.service_s / stage.processed * 1000 if stage.processed else 0.0,
+                    # 各 worker 处于执行状态的时间占比，接近 100% 说明该阶段的 worker 数（或后端）是瓶颈
+                    "utilization": stage.service_s / (stage.workers * elapsed) if elapsed > 0 else 0.0,
+                }
+            return {
+                "queue_depth": sum(stage["backlog"] for stage in stages.values()),
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "elapsed": elapsed,
+                "throughput": done / elapsed if elapsed > 0 else 0.0,
+                "stages": stages,
+                "edges": {f"{source}->{target}": count for (source, target), count in sorted(self._edges.items())},
+            }
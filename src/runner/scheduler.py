@@ -0,0 +1,161 @@
+import queue
+import signal
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+# 通知 worker 退出的哨兵
+_STOP = object()
+
+
+class WorkerPool:
+    """
+    固定数量的常驻 worker 线程，从有界队列中取条目并调用 handler 处理。
+    submit() 在队列满时阻塞（不空转），shutdown() 后不再接受新条目，
+    队列里尚未开始的条目被丢弃，正在处理的条目会跑完。
+    """
+
+    def __init__(self, handler: Callable[[Any], None], num_workers: int, queue_size: Optional[int] = None,
+                 name: str = "worker"):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self._queue = queue.Queue(maxsize=queue_size or self.num_workers * 2)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.dropped = 0
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.monotonic()
+        for t in self._threads:
+            t.start()
+        return self
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def submit(self, item) -> bool:
+        """提交一个条目；队列满时阻塞。若已进入 shutdown 返回 False。"""
+        while not self._stopping.is_set():
+            try:
+                # 带超时的 put，保证阻塞期间主线程仍能响应 SIGINT
+                self._queue.put(item, timeout=0.5)
+            except queue.Full:
+                continue
+            with self._lock:
+                self.submitted += 1
+            return True
+        return False
+
+    def shutdown(self):
+        """
+        优雅停止：不再接受新条目，队列中尚未开始的条目由 worker 丢弃，进行中的条目会跑完。
+        只设置事件、不拿锁，因此可以在信号处理函数里安全调用。
+        """
+        self._stopping.set()
+
+    def join(self):
+        """所有已提交条目处理完（或 shutdown 后进行中的条目处理完）后返回。"""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            # 带超时的 join，保证等待期间主线程仍能响应 SIGINT
+            while t.is_alive():
+                t.join(timeout=0.5)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+            done = self.completed + self.failed
+            return {
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "elapsed": elapsed,
+                "throughput": done / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if self._stopping.is_set():
+                with self._lock:
+                    self.dropped += 1
+                continue
+            with self._lock:
+                self.in_flight += 1
+            try:
+                self.handler(item)
+                ok = True
+            except Exception:
+                traceback.print_exc()
+                ok = False
+            with self._lock:
+                self.in_flight -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+
+class StatsReporter:
+    """后台线程，每 interval 秒打印一次 WorkerPool 的队列深度和吞吐。"""
+
+    def __init__(self, pool: WorkerPool, interval: float = 30.0):
+        self.pool = pool
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats-reporter", daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print(format_stats(self.pool.stats()))
+
+
+def format_stats(stats: Dict) -> str:
+    line = (f"[scheduler] queue={stats['queue_depth']} in_flight={stats['in_flight']} "
+            f"done={stats['completed']} failed={stats['failed']} dropped={stats['dropped']} "
+            f"{stats['throughput']:.2f} entries/s")
+    # 流水线引擎：每个阶段的积压和繁忙 worker 数
+    if stats.get("stages"):
+        line += " | " + " ".join(f"{name}={stage['backlog']}q/{stage['busy']}of{stage['workers']}"
+                                 for name, stage in stats["stages"].items())
+    return line
+
+
+def install_sigint_handler(pool: WorkerPool):
+    """
+    第一次 Ctrl-C：停止派发新条目，等待进行中的条目完成后正常退出（结果和断点照常落盘）；
+    第二次 Ctrl-C：恢复默认行为，直接抛出 KeyboardInterrupt。
+    """
+    def handler(signum, frame):
+        print("SIGINT received, draining in-flight entries (press Ctrl-C again to abort)...")
+        pool.shutdown()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, handler)
@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+from concurrent.futures import Executor, Future
+from typing import Any, Awaitable, Callable, Generator, NamedTuple, Optional
+
+
+# 单条数据处理流程中的外部调用步骤。流程本身写成生成器：yield 一个步骤，
+# 由驱动方（同步线程 / asyncio / 流水线）执行后把结果 send 回去，出错时把异常 throw 回去，
+# 这样同一份轮次逻辑可以被不同的执行引擎复用。
+
+# stage / round_num 只用于 tracing 打标签，不影响执行
+
+class Retrieve(NamedTuple):
+    query: str
+    corpus_name: str
+    size: int
+    stage: str = "retrieve"
+    round_num: int = 0
+
+
+class Generate(NamedTuple):
+    model: str
+    role: str
+    prompt: str
+    stage: str = "generate"
+    round_num: int = 0
+
+
+class Checkpoint(NamedTuple):
+    # 一轮结束后的状态，由驱动方写入断点库
+    entry_id: str
+    state: dict
+
+
+# 后台执行：yield Spawn(step) 立即返回一个句柄，之后 yield Await(handle) 取结果，
+# 或 yield Cancel(handle) 放弃（尚未完成的调用会被取消，已完成的结果被丢弃）。
+
+class Spawn(NamedTuple):
+    step: Any
+
+
+class Await(NamedTuple):
+    handle: Any
+
+
+class Cancel(NamedTuple):
+    handle: Any
+
+
+EntrySteps = Generator[Any, Any, Any]
+
+
+def _run_now(execute: Callable[[Any], Any], step) -> Future:
+    # 没有线程池时 Spawn 退化为立即同步执行
+    future = Future()
+    try:
+        future.set_result(execute(step))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def drive(steps: EntrySteps, execute: Callable[[Any], Any], executor: Optional[Executor] = None):
+    """同步驱动：逐个执行步骤，返回生成器的返回值。Spawn 的步骤提交到 executor 中并行执行。"""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            if isinstance(step, Spawn):
+                # 复制当前 context，让后台线程里的 tracing span 继承 entry_id 等标签
+                result = (executor.submit(contextvars.copy_context().run, execute, step.step)
+                          if executor else _run_now(execute, step.step))
+            elif isinstance(step, Await):
+                result = step.handle.result()
+            elif isinstance(step, Cancel):
+                # 已在运行的线程无法中断，只能丢弃其结果
+                result = step.handle.cancel()
+            else:
+                result = execute(step)
+            error = None
+        except Exception as e:
+            result, error = None, e
+
+
+def _consume_exception(task: asyncio.Task):
+    # 被放弃的任务如果出错，不再打印 "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def adrive(steps: EntrySteps, aexecute: Callable[[Any], Awaitable[Any]]):
+    """异步驱动：与 drive 相同，只是步骤在事件循环中 await 执行，Spawn 的步骤作为 Task 并发执行。"""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            if isinstance(step, Spawn):
+                result = asyncio.ensure_future(aexecute(step.step))
+                result.add_done_callback(_consume_exception)
+            elif isinstance(step, Await):
+                result = await step.handle
+            elif isinstance(step, Cancel):
+                result = step.handle.cancel()
+            else:
+                result = await aexecute(step)
+            error = None
+        except Exception as e:
+            result, error = None, e
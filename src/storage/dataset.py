@@ -0,0 +1,98 @@
+import gzip
+import json
+import sys
+from typing import IO, Iterator
+
+# 每次从文件读入的字符数；流式解析时内存只与单个条目的大小有关，与数据集大小无关
+CHUNK_SIZE = 1 << 20
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+def open_text(path: str, mode: str = 'r') -> IO:
+    """按后缀打开文本文件，.gz 文件透明解压 / 压缩。"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _skip(buf: str, pos: int, chars: str) -> int:
+    while pos < len(buf) and buf[pos] in chars:
+        pos += 1
+    return pos
+
+
+def iter_json_array(f: IO, path: str = "<stream>") -> Iterator:
+    """
+    逐个解析顶层 JSON list 中的元素，每次只在内存中保留当前读入的一块文本。
+    f 需要已经定位到 '[' 之前（允许有空白）。
+    """
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(CHUNK_SIZE)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    fill()
+    pos = _skip(buf, pos, _WHITESPACE)
+    if buf[pos:pos + 1] != "[":
+        raise ValueError(f"{path} is not a JSON array")
+    pos += 1
+    while True:
+        pos = _skip(buf, pos, _WHITESPACE + ",")
+        if pos >= len(buf):
+            if eof:
+                raise ValueError(f"{path}: unexpected end of file inside the JSON array")
+            fill()
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            value, end = _DECODER.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        # 数字等没有结束符的值可能被块边界截断，读到后续字符再确认
+        if end == len(buf) and not eof:
+            fill()
+            continue
+        pos = end
+        yield value
+
+
+def iter_entries(path: str) -> Iterator:
+    """
+    惰性读取数据集：支持 list JSON 和 JSONL，.gz 后缀自动解压。
+    与 json.load 整个文件相比，峰值内存不随数据集大小增长。
+    """
+    with open_text(path) as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == '[':
+            f.seek(0)
+            yield from iter_json_array(f, path)
+            return
+        f.seek(0)
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def count_entries(path: str) -> int:
+    return sum(1 for _ in iter_entries(path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python dataset.py <data.json|data.jsonl[.gz]>")
+        sys.exit(1)
+
+    print(f"{sys.argv[1]}: {count_entries(sys.argv[1])} entries")
@@ -0,0 +1,525 @@
+import gzip
+import json
+import os
+import queue
+import sys
+import textwrap
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 作为脚本运行（python storage/result_writer.py ...）时也能引入 src 下的模块
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from storage.dataset import iter_json_array, open_text  # noqa: E402
+
+# 写入线程的控制消息
+_STOP = object()
+
+# 输出参数，可在 config.json 的 "output" 段覆盖
+DEFAULT_OUTPUT_OPTIONS = {
+    "fields": None,          # 结果中保留的输入字段（除 KEEP_FIELDS 外）；None 保留整条输入
+    "gzip": False,           # JSONL 结果按 gzip 压缩写出
+}
+
+# 投影时总是保留的字段：条目 id、标准答案和模型作答
+KEEP_FIELDS = ("_id", "answer", "Answer_process", "Answer_final")
+
+# sweep 结果中按配置存放各自 entry 的字段
+SWEEP_FIELD = "sweep_results"
+
+# gzip member 的开头（magic + deflate），损坏的数据之后从下一个 member 头继续读
+GZIP_HEADER = b"\x1f\x8b\x08"
+READ_SIZE = 1 << 20
+
+
+def output_options(config: dict) -> dict:
+    options = dict(DEFAULT_OUTPUT_OPTIONS)
+    options.update(config.get('output', {}))
+    return options
+
+
+def project_entry(entry: Dict, fields: Optional[Iterable[str]]) -> Dict:
+    """只保留 KEEP_FIELDS 和 fields 中的字段（如去掉 HotpotQA 的 context / supporting_facts）。"""
+    if fields is None:
+        return entry
+    if SWEEP_FIELD in entry:
+        return {"_id": entry["_id"],
+                SWEEP_FIELD: {key: project_entry(result, fields) for key, result in entry[SWEEP_FIELD].items()}}
+    keep = set(KEEP_FIELDS).union(fields)
+    return {key: value for key, value in entry.items() if key in keep}
+
+
+class ResultWriter:
+    """
+    结果写入器基类。worker 线程调用 write() 提交结果，run 结束时调用 close()。
+    on_commit 回调在该条结果真正落盘之后执行（用于写断点记录等）。
+    """
+
+    def write(self, entry: Dict, on_commit: Optional[Callable[[], None]] = None):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _find_gzip_header(f, start: int) -> int:
+    """返回 start 及之后第一个 gzip member 头的位置，没有时返回 -1。"""
+    f.seek(start)
+    pos, tail = start, b""
+    while True:
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            return -1
+        buf = tail + chunk
+        found = buf.find(GZIP_HEADER)
+        if found >= 0:
+            return pos - len(tail) + found
+        tail = buf[-(len(GZIP_HEADER) - 1):]
+        pos += len(chunk)
+
+
+def iter_gzip_members(f, offset: int = 0) -> Iterator[Tuple[Optional[bytes], Optional[int]]]:
+    """
+    从二进制文件 f 的 offset 处开始逐个解压 gzip member，yield：
+    (数据, None)：解压出的数据；(b"", end)：一个 member 完整结束，end 是它结尾的位置；
+    (None, resume)：遇到损坏的 member（崩溃时被截断、之后又被续写），跳到 resume 处的下一个 member 头继续，
+    调用方应丢弃此前未完成的行。文件末尾没写完的 member 只 yield 已解压出的数据，没有结束标记。
+    """
+    start = offset
+    while True:
+        f.seek(start)
+        head = f.read(len(GZIP_HEADER))
+        if not head:
+            return
+        decompressor = zlib.decompressobj(wbits=31) if head == GZIP_HEADER else None
+        pos = start
+        if decompressor is not None:
+            f.seek(start)
+            try:
+                while not decompressor.eof:
+                    chunk = f.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    pos += len(chunk)
+                    data = decompressor.decompress(chunk)
+                    if data:
+                        yield data, None
+            except zlib.error:
+                pass
+            if decompressor.eof:
+                start = pos - len(decompressor.unused_data)
+                yield b"", start
+                continue
+        resume = _find_gzip_header(f, start + 1)
+        if resume < 0:
+            return
+        yield None, resume
+        start = resume
+
+
+def _repair_tail(path: str, compress: bool = False):
+    """
+    续写之前截掉上次崩溃留下的不完整结尾：JSONL 截到最后一个换行符之后，gzip 截到最后一个完整 member 的结尾。
+    否则新结果会直接接在残片后面，读不出来，却已经被记为已导出。
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        size = end = f.seek(0, os.SEEK_END)
+        if compress and size:
+            f.seek(0)
+            if f.read(len(GZIP_HEADER)) != GZIP_HEADER:
+                raise ValueError(f"{path} is not a gzip file, refusing to append compressed results to it.")
+            end = 0
+            for data, member_end in iter_gzip_members(f):
+                if data is not None and member_end is not None:
+                    end = member_end
+        while not compress and end > 0:
+            step = min(1 << 16, end)
+            f.seek(end - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                end = end - step + newline + 1
+                break
+            end -= step
+        if end < size:
+            print(f"Warning: dropping {size - end} bytes of partially written results at the end of {path}")
+            f.truncate(end)
+
+
+class JsonlResultWriter(ResultWriter):
+    """
+    追加写 JSONL：每条结果一行，由单独的写入线程从队列中取出并写文件，
+    每 fsync_every 条或每 fsync_interval 秒 fsync 一次。
+    单条写入的开销与文件中已有的条目数无关。
+    compress=True 时每次 fsync 之前把这一批行压缩成一个独立的 gzip member 追加到文件末尾。
+    打开已有的文件时先截掉上次崩溃留下的不完整结尾（半行 / 不完整的 member），新结果总是从完整的行或 member 之后写起。
+    """
+
+    def __init__(self, output_file: str, fsync_every: int = 64, fsync_interval: float = 1.0,
+                 max_pending: int = 10000, compress: bool = False):
+        self.output_file = output_file
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.compress = compress
+        self._queue = queue.Queue(maxsize=max_pending)
+        _repair_tail(output_file, compress)
+        self._file = open(output_file, 'ab') if compress else open(output_file, 'a', encoding='utf-8')
+        self._lines = []  # compress 模式下尚未压缩写出的行
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, entry: Dict, on_commit: Optional[Callable[[], None]] = None):
+        self._check()
+        # 在调用方线程里序列化，避免 entry 之后被修改，也把 json 开销分摊到各个 worker
+        line = json.dumps(entry, ensure_ascii=False)
+        self._queue.put((line, on_commit))
+
+    def flush(self):
+        """阻塞直到此前提交的所有结果都已 fsync。"""
+        self._check()
+        done = threading.Event()
+        self._queue.put((None, done.set))
+        done.wait()
+        self._check()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"Result writer for {self.output_file} failed") from self._error
+
+    def _sync(self, callbacks):
+        if self._lines:
+            self._file.write(gzip.compress("".join(self._lines).encode('utf-8')))
+            self._lines.clear()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in result writer commit callback: {e}")
+        callbacks.clear()
+
+    def _run(self):
+        callbacks = []  # 已写入但尚未 fsync 的条目回调
+        pending = 0
+        last_sync = time.monotonic()
+        try:
+            while True:
+                timeout = max(0.0, self.fsync_interval - (time.monotonic() - last_sync))
+                try:
+                    item = self._queue.get(timeout=timeout if pending else None)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+                if item is not None:
+                    line, callback = item
+                    if line is not None:
+                        if self.compress:
+                            self._lines.append(line + "\n")
+                        else:
+                            self._file.write(line + "\n")
+                        pending += 1
+                    if callback is not None:
+                        callbacks.append(callback)
+                    # flush() 请求（line 为 None）需要立即落盘
+                    if line is not None and pending < self.fsync_every \
+                            and time.monotonic() - last_sync < self.fsync_interval:
+                        continue
+                if pending or callbacks:
+                    self._sync(callbacks)
+                    pending = 0
+                last_sync = time.monotonic()
+            self._sync(callbacks)
+        except Exception as e:
+            self._error = e
+            # 写入线程出错后继续消费队列，避免 write() 的调用方永远阻塞在满队列上
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                if item[0] is None and item[1] is not None:
+                    item[1]()
+
+
+class JsonArrayResultWriter(ResultWriter):
+    """
+    旧格式：整个输出文件是一个 list，每写一条都要读出并重写整个文件（O(N) / 条）。
+    仅为兼容保留，新的 run 请使用 JsonlResultWriter。
+    """
+
+    def __init__(self, output_file: str, **kwargs):
+        self.output_file = output_file
+        self._lock = threading.Lock()
+
+    def write(self, entry: Dict, on_commit: Optional[Callable[[], None]] = None):
+        with self._lock:
+            if os.path.exists(self.output_file):
+                with open(self.output_file, 'r') as f:
+                    data = json.load(f)
+            else:
+                data = []
+            data.append(entry)
+            with open(self.output_file, 'w') as f:
+                json.dump(data, f, indent=4)
+        if on_commit is not None:
+            on_commit()
+
+
+class SweepWriter(ResultWriter):
+    """
+    sweep 模式：每条结果是 {"_id": ..., SWEEP_FIELD: {配置: entry}}，按配置分发到各自的写入器，
+    所有配置的结果都落盘之后才调用 on_commit。
+    """
+
+    def __init__(self, writers: Dict[str, ResultWriter]):
+        self.writers = writers
+
+    def write(self, entry: Dict, on_commit: Optional[Callable[[], None]] = None):
+        results = entry[SWEEP_FIELD]
+        remaining = [len(results)]
+        lock = threading.Lock()
+
+        def committed():
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done and on_commit is not None:
+                on_commit()
+
+        for key, result in results.items():
+            self.writers[key].write(result, on_commit=committed)
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def close(self):
+        errors = []
+        for writer in self.writers.values():
+            try:
+                writer.close()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+
+WRITERS = {
+    'jsonl': JsonlResultWriter,
+    'json': JsonArrayResultWriter,
+}
+
+# 各写入器对应的输出文件后缀
+WRITER_SUFFIXES = {
+    'jsonl': '.jsonl',
+    'json': '.json',
+}
+
+
+def output_suffix(kind: str, compress: bool = False) -> str:
+    if compress and kind != 'jsonl':
+        raise ValueError("gzip output is only supported by the jsonl writer.")
+    return WRITER_SUFFIXES[kind] + (".gz" if compress else "")
+
+
+def create_writer(kind: str, output_file: str, **kwargs) -> ResultWriter:
+    if kind not in WRITERS:
+        raise ValueError(f"Unknown result writer '{kind}', choose from {sorted(WRITERS)}.")
+    return WRITERS[kind](output_file, **kwargs)
+
+
+def iter_results(path: str) -> Iterator[Dict]:
+    """
+    逐条读取结果文件，同时支持 JSONL（可以是 .gz）和旧的 list JSON，都不会把整个文件读进内存。
+    JSONL 中因进程崩溃只写了一半的行会被跳过；gzip 文件中损坏的 member 跳过，从下一个 member 继续读。
+    """
+    with open_text(path) as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == '[':
+            f.seek(0)
+            yield from iter_json_array(f, path)
+            return
+        f.seek(0)
+        for line in (_iter_gzip_lines(path) if path.endswith(".gz") else f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                print(f"Warning: skipping truncated line in {path}")
+
+
+def _iter_gzip_lines(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        partial = b""
+        for data, resume in iter_gzip_members(f):
+            if data is None:
+                print(f"Warning: skipping corrupt gzip data in {path}, resuming at byte {resume}")
+                partial = b""
+                continue
+            lines = (partial + data).split(b"\n")
+            partial = lines.pop()
+            yield from lines
+        if partial:
+            yield partial
+
+
+class ResultTailer:
+    """
+    跟随一个仍在写入的 JSONL 结果文件（可以是 .gz），poll() 返回上次之后新写完的条目。
+    只读取新增的字节，offset 总是停在完整的行（gzip 文件：完整的 member）之后，没写完的部分留到下次重新读。
+    gzip 中损坏的 member（崩溃后被截断、之后又被续写）跳过，从下一个 member 继续。文件变短（重新开始的 run）时从头读起。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self._corrupt_at = None  # 上次报告过的损坏位置，避免每次 poll 重复报告
+
+    def _read_members(self, f) -> bytes:
+        out, member = [], []
+        for data, end in iter_gzip_members(f, self.offset):
+            if data is None:
+                if end != self._corrupt_at:
+                    print(f"Warning: skipping corrupt gzip data in {self.path}, resuming at byte {end}")
+                    self._corrupt_at = end
+                member = []
+            elif end is None:
+                member.append(data)
+            else:
+                out.extend(member)
+                member = []
+                self.offset = end
+        return b"".join(out)
+
+    def poll(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) < self.offset:
+                print(f"{self.path} was truncated, reading it from the start.")
+                self.offset = 0
+            if self.path.endswith(".gz"):
+                data = self._read_members(f)
+            else:
+                f.seek(self.offset)
+                data = f.read()
+                if not self.offset and data.lstrip()[:1] == b"[":
+                    raise ValueError(f"{self.path} is a JSON list; only JSONL results can be followed.")
+                # 没写完的最后一行不计入 offset
+                data = data[:data.rfind(b"\n") + 1]
+                self.offset += len(data)
+        entries = []
+        for line in data.split(b"\n"):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                print(f"Warning: skipping malformed line in {self.path}")
+        return entries
+
+
+def jsonl_to_json(jsonl_path: str, json_path: str, indent: int = 4) -> int:
+    """
+    把 JSONL 结果转换成旧的 list-of-entries JSON（与 json.dump(data, indent=4) 输出一致），
+    逐条写出，不需要把整个结果集读进内存。返回条目数。
+    """
+    count = 0
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write("[")
+        for entry in iter_results(jsonl_path):
+            out.write(",\n" if count else "\n")
+            out.write(textwrap.indent(json.dumps(entry, indent=indent), " " * indent))
+            count += 1
+        out.write("\n]" if count else "]")
+    os.replace(tmp_path, json_path)
+    return count
+
+
+def _self_check():
+    # 续写崩溃后留下半行的 JSONL：残片被截掉，之后写入的结果都能读出
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "results.jsonl")
+        with open(path, 'w') as f:
+            f.write('{"_id": "0"}\n{"_id": "1"}\n{"_id": "2", "Answer_fin')
+        with JsonlResultWriter(path) as writer:
+            for entry_id in ("2", "3"):
+                writer.write({"_id": entry_id})
+        ids = [entry["_id"] for entry in iter_results(path)]
+        assert ids == ["0", "1", "2", "3"], ids
+
+        # gzip：最后一个 member 被截断；续写时截到最后一个完整 member 之后，新写入的结果都能读出
+        path = os.path.join(workdir, "results.jsonl.gz")
+        members = [gzip.compress("".join(f'{{"_id": "{i}"}}\n' for i in ids).encode("utf-8"))
+                   for ids in (range(0, 4), range(4, 6))]
+        with open(path, 'wb') as f:
+            f.write(members[0] + members[1][:len(members[1]) // 2])
+        with JsonlResultWriter(path, compress=True) as writer:
+            for entry_id in range(4, 10):
+                writer.write({"_id": str(entry_id)})
+        ids = [entry["_id"] for entry in iter_results(path)]
+        assert ids == [str(i) for i in range(10)], ids
+
+        # 旧版本写出的文件：截断的 member 之后已经续写了别的 member，读取时跳过损坏的部分
+        with open(path, 'wb') as f:
+            f.write(members[0] + members[1][:len(members[1]) // 2] + members[1])
+        ids = [entry["_id"] for entry in iter_results(path)]
+        assert ids == [str(i) for i in range(6)], ids
+
+        # 跟随同一个文件：损坏的 member 被跳过，之后续写的 member 照常读出
+        with open(path, 'wb') as f:
+            f.write(members[0] + members[1][:len(members[1]) // 2])
+        tailer = ResultTailer(path)
+        ids = [entry["_id"] for entry in tailer.poll()]
+        with open(path, 'ab') as f:
+            f.write(members[1])
+        ids += [entry["_id"] for entry in tailer.poll()]
+        assert ids == [str(i) for i in range(6)], ids
+
+
+if __name__ == "__main__":
+    # 自检：python storage/result_writer.py --selfCheck
+    if sys.argv[1:] == ["--selfCheck"]:
+        _self_check()
+        print("Result writer self-check passed.")
+        sys.exit(0)
+    if len(sys.argv) != 3:
+        print("Usage: python result_writer.py <input.jsonl[.gz]> <output.json>")
+        sys.exit(1)
+
+    n = jsonl_to_json(sys.argv[1], sys.argv[2])
+    print(f"Converted {n} entries to {sys.argv[2]}")
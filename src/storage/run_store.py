@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, Optional, Set
+
+
+class RunStore:
+    """
+    一次 run 的断点状态，存放在 SQLite（WAL 模式）里：
+    - rounds：每条数据最近一轮结束后的状态（累积 reference、missing_evidence、round_logs 等），
+      重启后从最后完成的一轮继续；
+    - entries：已完成的条目。complete() 在同一个事务里写入结果并删除轮次状态，
+      结果写入输出文件并 fsync 之后再 mark_exported()，重启时把未导出的结果补写到输出文件。
+    可以在多个线程之间共享。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rounds ("
+            " entry_id TEXT PRIMARY KEY, round_num INTEGER NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " entry_id TEXT PRIMARY KEY, result TEXT, exported INTEGER NOT NULL DEFAULT 0, completed_at REAL NOT NULL)"
+        )
+
+    def completed_ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT entry_id FROM entries")}
+
+    def load_state(self, entry_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM rounds WHERE entry_id = ?", (entry_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_round(self, entry_id: str, state: Dict):
+        blob = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO rounds (entry_id, round_num, state, updated_at) VALUES (?, ?, ?, ?)",
+                               (entry_id, state.get("round_num", 0), blob, time.time()))
+
+    def complete(self, entry_id: str, entry: Dict):
+        """原子地记录结果并清除轮次状态。"""
+        blob = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO entries (entry_id, result, exported, completed_at) "
+                                   "VALUES (?, ?, 0, ?)", (entry_id, blob, time.time()))
+                self._conn.execute("DELETE FROM rounds WHERE entry_id = ?", (entry_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def mark_exported(self, entry_id: str):
+        # 结果已经在输出文件里，不再需要在这里保留一份
+        with self._lock:
+            self._conn.execute("UPDATE entries SET exported = 1, result = NULL WHERE entry_id = ?", (entry_id,))
+
+    def pending_exports(self) -> Iterator[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT result FROM entries WHERE exported = 0 AND result IS NOT NULL").fetchall()
+        for (blob,) in rows:
+            yield json.loads(blob)
+
+    def import_processed_ids(self, path: str) -> int:
+        """从旧的 processed_ids 文本文件迁移已完成的 ID（视为已导出）。"""
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'r') as f:
+            ids = [(line.strip(), time.time()) for line in f if line.strip()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO entries (entry_id, result, exported, completed_at) "
+                                   "VALUES (?, NULL, 1, ?)", ids)
+            return self._conn.total_changes - before
+
+    def stats(self) -> Dict:
+        with self._lock:
+            completed = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            in_progress = self._conn.execute("SELECT COUNT(*) FROM rounds").fetchone()[0]
+        return {"completed": completed, "in_progress": in_progress}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,121 @@
+"""
+按 _id 的稳定哈希把数据集分给多个进程 / 节点（exp_qwen.py --shardIndex i --numShards n），
+每个分片写自己的输出文件和断点库；全部跑完后合并并检查覆盖率：
+
+    python storage/shards.py out/qwen-7b_*_shard*of008.jsonl --input data.json --output merged.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+# 作为脚本运行（python storage/shards.py ...）时也能引入 src 下的模块
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from storage.dataset import iter_entries, open_text  # noqa: E402
+from storage.result_writer import iter_results  # noqa: E402
+
+
+def shard_of(entry_id: str, num_shards: int) -> int:
+    """按 _id 的 md5 分片：与进程、机器和 PYTHONHASHSEED 无关，同一条目总是落在同一个分片。"""
+    digest = hashlib.md5(str(entry_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def in_shard(entry: Dict, shard_index: int, num_shards: int) -> bool:
+    return num_shards <= 1 or shard_of(entry["_id"], num_shards) == shard_index
+
+
+def check_shard(shard_index: int, num_shards: int):
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError(f"Invalid shard {shard_index} of {num_shards}.")
+
+
+def shard_tag(shard_index: int, num_shards: int) -> str:
+    return f"_shard{shard_index:03d}of{num_shards:03d}" if num_shards > 1 else ""
+
+
+def shard_path(path: str, shard_index: int, num_shards: int) -> str:
+    """在文件名的扩展名之前加上分片标记，如 run_state.sqlite -> run_state_shard002of008.sqlite。"""
+    root, ext = os.path.splitext(path)
+    return f"{root}{shard_tag(shard_index, num_shards)}{ext}"
+
+
+def merge_shards(shard_files: List[str], output_file: str, input_file: Optional[str] = None) -> Dict:
+    """
+    把各分片的结果合并成一个 JSONL（.gz 后缀时压缩），同一 _id 只保留第一次出现的结果。
+    给出 input_file 时检查覆盖率：缺失的 id 和输入中不存在的 id 都计入返回的统计。
+    逐条流式处理，内存中只保留 id 集合。
+    """
+    expected = {entry["_id"] for entry in iter_entries(input_file)} if input_file else None
+    seen = set()
+    stats = {"written": 0, "duplicates": 0, "unexpected": 0, "missing": 0, "missing_ids": []}
+    # 临时文件保留 .gz 后缀，open_text 才会按输出文件名压缩
+    tmp_path = output_file + (".tmp.gz" if output_file.endswith(".gz") else ".tmp")
+    with open_text(tmp_path, 'w') as out:
+        for path in shard_files:
+            for entry in iter_results(path):
+                entry_id = entry["_id"]
+                if entry_id in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(entry_id)
+                if expected is not None and entry_id not in expected:
+                    stats["unexpected"] += 1
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                stats["written"] += 1
+    os.replace(tmp_path, output_file)
+    if expected is not None:
+        missing = sorted(expected - seen)
+        stats["missing"] = len(missing)
+        stats["missing_ids"] = missing
+    return stats
+
+
+def _self_check():
+    # 合并成 .gz 文件：输出确实是 gzip，能用 iter_results 读回全部条目
+    import gzip
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as workdir:
+        shard_files = []
+        for shard_index in range(2):
+            path = os.path.join(workdir, f"results{shard_tag(shard_index, 2)}.jsonl")
+            with open(path, 'w') as f:
+                f.writelines(json.dumps({"_id": str(i)}) + "\n" for i in range(10) if shard_of(str(i), 2) == shard_index)
+            shard_files.append(path)
+        output_file = os.path.join(workdir, "merged.jsonl.gz")
+        stats = merge_shards(shard_files, output_file)
+        assert stats["written"] == 10, stats
+        with gzip.open(output_file, 'rt') as f:
+            assert len(f.readlines()) == 10
+        assert sorted(int(entry["_id"]) for entry in iter_results(output_file)) == list(range(10))
+
+
+if __name__ == "__main__":
+    # 自检：python storage/shards.py --selfCheck
+    if sys.argv[1:] == ["--selfCheck"]:
+        _self_check()
+        print("Shard merge self-check passed.")
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Merge per-shard result files and check coverage against the input.")
+    parser.add_argument("shards", nargs="+", help="Shard result files (.jsonl / .jsonl.gz / legacy .json)")
+    parser.add_argument("--output", type=str, required=True, help="Merged JSONL file (.gz suffix compresses)")
+    parser.add_argument("--input", type=str, default=None, help="Input dataset used for the coverage check")
+    parser.add_argument("--missingIds", type=str, default=None, help="Write ids missing from all shards to this file")
+    parser.add_argument("--allowMissing", action="store_true", help="Exit with 0 even if some input ids are missing")
+    args = parser.parse_args()
+
+    stats = merge_shards(args.shards, args.output, args.input)
+    print(f"Merged {len(args.shards)} shards into {args.output}: written={stats['written']} "
+          f"duplicates={stats['duplicates']} unexpected={stats['unexpected']} missing={stats['missing']}")
+    if args.missingIds and stats["missing_ids"]:
+        with open(args.missingIds, 'w') as f:
+            f.writelines(entry_id + "\n" for entry_id in stats["missing_ids"])
+        print(f"Missing ids written to {args.missingIds}")
+    if stats["missing"] and not args.allowMissing:
+        sys.exit(1)
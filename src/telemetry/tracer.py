@@ -0,0 +1,122 @@
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from storage.result_writer import JsonlResultWriter
+
+# 会被子 span 继承的标签
+INHERITED_TAGS = ("entry_id", "round", "stage")
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class Tracer:
+    """
+    收集 span（每个阶段、每次模型调用各一个），可选地逐条写入 JSONL trace 文件，
+    run 结束时按 (span, model) 汇总 p50/p95/p99 延迟和 token 用量。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._sink = JsonlResultWriter(path, fsync_every=1024, fsync_interval=5.0) if path else None
+        self._lock = threading.Lock()
+        self._latencies: Dict[tuple, List[float]] = defaultdict(list)
+        self._totals: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def emit(self, record: Dict):
+        key = (record["span"], record.get("model", ""))
+        with self._lock:
+            self._latencies[key].append(record["wall_ms"])
+            totals = self._totals[key]
+            totals["prompt_tokens"] += record.get("prompt_tokens", 0) or 0
+            totals["completion_tokens"] += record.get("completion_tokens", 0) or 0
+            totals["cached_tokens"] += record.get("cached_tokens", 0) or 0
+            totals["retries"] += record.get("retries", 0) or 0
+            totals["errors"] += 1 if "error" in record else 0
+            totals["cache_hits"] += 1 if record.get("cache_hit") else 0
+        if self._sink is not None:
+            self._sink.write(record)
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for (name, model), values in sorted(self._latencies.items()):
+                ordered = sorted(values)
+                label = f"{name}/{model}" if model else name
+                result[label] = {
+                    "count": len(ordered),
+                    "mean_ms": sum(ordered) / len(ordered),
+                    "p50_ms": percentile(ordered, 50),
+                    "p95_ms": percentile(ordered, 95),
+                    "p99_ms": percentile(ordered, 99),
+                    **self._totals[(name, model)],
+                }
+            return result
+
+    def close(self):
+        if self._sink is not None:
+            self._sink.close()
+            with open(self.path + ".summary.json", 'w') as f:
+                json.dump(self.summary(), f, indent=4)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    # nearest-rank 百分位，ordered 已排序
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+TRACER: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global TRACER
+    TRACER = tracer
+
+
+@contextmanager
+def span(name: str, **tags):
+    """
+    记录一个 span：墙钟耗时、标签以及 annotate() 写入的字段。
+    未启用 tracer 时不做任何事。entry_id / round / stage 会被嵌套的子 span 继承。
+    """
+    tracer = TRACER
+    if tracer is None:
+        yield None
+        return
+    parent = _current.get()
+    inherited = {k: v for k, v in (parent or {}).items() if k in INHERITED_TAGS}
+    record = {"span": name, **inherited, **{k: v for k, v in tags.items() if v is not None}}
+    token = _current.set(record)
+    record["start"] = time.time()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["wall_ms"] = (time.perf_counter() - start) * 1000
+        _current.reset(token)
+        tracer.emit(record)
+
+
+def annotate(**fields):
+    """给当前 span 补充字段（token 用量、重试次数、是否命中缓存等）。"""
+    record = _current.get()
+    if record is not None:
+        record.update({k: v for k, v in fields.items() if v is not None})
+
+
+def format_summary(summary: Dict[str, Dict]) -> str:
+    lines = [f"{'span/model':<40} {'count':>7} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9} {'prompt_tok':>11} {'compl_tok':>10}"]
+    for label, s in summary.items():
+        lines.append(f"{label:<40} {s['count']:>7} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} "
+                     f"{s['prompt_tokens']:>11} {s['completion_tokens']:>10}")
+    return "\n".join(lines)